@@ -15,8 +15,11 @@ from ufl import (FiniteElement, TestFunction, TrialFunction, triangle,
 from ufl.algorithms import (extract_arguments, expand_derivatives,
                             expand_indices, extract_elements,
                             extract_unique_elements, extract_coefficients)
+from ufl.algorithms.transformer import ReuseTransformer, ufl2uflcopy
+from ufl.classes import IntValue
 from ufl.corealg.traversal import (pre_traversal, post_traversal,
-                                   unique_pre_traversal, unique_post_traversal)
+                                   unique_pre_traversal, unique_post_traversal,
+                                   traverse_unique_terminals)
 
 # TODO: add more tests, covering all utility algorithms
 
@@ -95,6 +98,30 @@ def test_pre_and_post_traversal():
     assert list(unique_post_traversal(s)) == [v, f, p1, g, p2, s]
 
 
+def test_traversal_of_deep_expressions():
+    element = FiniteElement("Lagrange", triangle, 1)
+    f = Coefficient(element)
+    s = f
+    for i in range(2, 10002):
+        s = s*(f + i)
+    assert s.ufl_shape == ()
+    assert hash(s) == hash(s)
+    assert len(list(pre_traversal(s))) == 40001
+    assert len(list(post_traversal(s))) == 40001
+    assert len(list(unique_post_traversal(s))) == 30001
+    terminals = list(traverse_unique_terminals(s))
+    assert len(terminals) == 10001
+    assert set(terminals) == set([f] + [IntValue(i) for i in range(2, 10002)])
+    assert list(traverse_unique_terminals(f)) == [f]
+
+    # Shapes are inherited through long chains of sums
+    s = f
+    for i in range(2, 2002):
+        s = s + i*f
+    assert s.ufl_shape == ()
+    assert s.ufl_free_indices == ()
+
+
 def test_expand_indices():
     element = FiniteElement("Lagrange", triangle, 2)
     v = TestFunction(element)
@@ -113,6 +140,49 @@ def test_expand_indices():
     # TODO: Test something more
 
 
+def test_transformer_visits_deep_expressions_without_recursion():
+    element = FiniteElement("Lagrange", triangle, 1)
+    f = Coefficient(element)
+    e = f
+    for i in range(3000):
+        e = e*f
+    assert ReuseTransformer().visit(e) is e
+    assert ufl2uflcopy(e) == e
+
+
+def test_transformer_memoizes_shared_subexpressions():
+    element = FiniteElement("Lagrange", triangle, 1)
+    f = Coefficient(element)
+
+    class CountingTransformer(ReuseTransformer):
+        def __init__(self):
+            ReuseTransformer.__init__(self)
+            self.count = 0
+
+        def product(self, o, *ops):
+            self.count += 1
+            return self.reuse_if_untouched(o, *ops)
+
+    class MemoizingTransformer(CountingTransformer):
+        _memoize_visits = True
+
+    # A DAG with 2**20 paths through 20 unique products
+    e = f
+    for i in range(20):
+        e = e*e
+    t = MemoizingTransformer()
+    assert t.visit(e) is e
+    assert t.count == 20
+
+    # Memoization is opt-in for subclasses
+    e = f
+    for i in range(4):
+        e = e*e
+    t = CountingTransformer()
+    assert t.visit(e) is e
+    assert t.count == 2**4 - 1
+
+
 def test_adjoint():
     cell = triangle
 
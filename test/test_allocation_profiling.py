@@ -0,0 +1,76 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of allocation profiling of expression objects.
+"""
+
+import json
+
+import pytest
+
+from ufl import *
+from ufl.core.expr import Expr
+from ufl.algorithms import compute_form_data
+from ufl.algorithms.compute_form_data import clear_form_data_cache
+from ufl.algorithms.apply_derivatives import apply_derivatives
+from ufl.algorithms.allocation_profiling import live_objects, profile_allocations, \
+    active_allocation_profiler
+from ufl.log import UFLException
+
+
+def test_live_objects():
+    x = SpatialCoordinate(triangle)
+    before = live_objects()
+    keep = [x[0]*x[1] + k for k in range(1, 20)]
+    after = live_objects()
+    assert after["Sum"][0] >= before.get("Sum", (0, 0))[0] + len(keep)
+    count, size = after["Sum"]
+    assert size > count > 0
+
+
+def test_profile_allocations_sections():
+    assert "__del__" not in Expr.__dict__
+    x = SpatialCoordinate(triangle)
+    with profile_allocations() as profiler:
+        assert active_allocation_profiler() is profiler
+        with profiler.section("temporaries"):
+            for k in range(1, 10):
+                x[0]*k + k
+        with profiler.section("kept"):
+            kept = [x[1]*k + k for k in range(1, 10)]
+    assert active_allocation_profiler() is None
+    assert Expr.__init__ is Expr._ufl_regular__init__
+
+    total, temporaries, kept_section = profiler.sections
+    assert total.name == "total"
+    assert temporaries.created["Sum"] == 9
+    assert temporaries.survived.get("Sum", 0) == 0
+    assert kept_section.created["Sum"] == 9
+    assert kept_section.survived["Sum"] == 9
+    assert total.total_created() >= temporaries.total_created() + kept_section.total_created()
+
+    data = json.loads(profiler.to_json())
+    assert [d["name"] for d in data] == ["total", "temporaries", "kept"]
+    assert data[2]["survived"]["Sum"] == 9
+    assert "temporaries" in str(profiler)
+
+    with profile_allocations():
+        with pytest.raises(UFLException):
+            with profile_allocations():
+                pass
+
+
+def test_profile_allocations_of_passes():
+    clear_form_data_cache()
+    V = VectorElement("CG", triangle, 1)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    F = grad(u) + Identity(2)
+    a = derivative(tr(F.T*F)**2*dx, u, v)
+    with profile_allocations() as profiler:
+        compute_form_data(a)
+    clear_form_data_cache()
+    sections = dict((s.name, s) for s in profiler.sections)
+    derivatives = sections["apply_derivatives"]
+    assert derivatives.total_created() > derivatives.total_survived() > 0
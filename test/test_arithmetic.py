@@ -4,7 +4,9 @@
 import pytest
 
 from ufl import *
-from ufl.classes import Division, FloatValue, IntValue
+from ufl.classes import Division, FloatValue, IntValue, Sum, Product
+from ufl.algebra import sum_terms, product_factors, canonical_sum, canonical_product
+from ufl.sorting import sorted_expr
 
 
 def test_scalar_casting(self):
@@ -92,3 +94,36 @@ def test_elem_op(self):
     self.assertEqual(elem_op(sin, A), as_matrix(((sin(x), sin(y), sin(z)),
                                                  (sin(3), sin(4), sin(5)))))
     self.assertEqual(elem_op(sin, A).dx(0).ufl_shape, (2, 3))
+
+
+def test_flattened_sum_and_product():
+    x, y, z = SpatialCoordinate(tetrahedron)
+    terms = [x, sin(y), z*x, cos(z), y]
+    assert sorted_expr(sum_terms(sum(terms))) == sorted_expr(terms)
+    assert sum_terms(x) == [x]
+    factors = [x, sin(y), z, cos(z)]
+    e = factors[0]*factors[1]*factors[2]*factors[3]
+    assert sorted_expr(product_factors(e)) == sorted_expr(factors)
+
+
+def test_canonical_sum_and_product():
+    x, y, z = SpatialCoordinate(tetrahedron)
+    terms = [x**k*sin(k*y) for k in range(1, 100)] + [z]
+    s = canonical_sum(terms)
+    assert canonical_sum(reversed(terms)) == s
+    assert sorted_expr(sum_terms(s)) == sorted_expr(terms)
+    point = (0.3, 0.2, 0.1)
+    assert abs(s(point) - sum(terms)(point)) < 1e-12
+
+    # The tree has logarithmic depth
+    depth = 0
+    level = [s]
+    while level:
+        depth += 1
+        level = [o for e in level if isinstance(e, Sum) for o in e.ufl_operands]
+    assert depth <= 8
+
+    p = canonical_product([x, y, 2.0, z])
+    assert isinstance(p, Product)
+    assert sorted_expr(product_factors(p)) == sorted_expr([x, y, as_ufl(2.0), z])
+    assert canonical_sum([x]) is x
@@ -0,0 +1,378 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of caching in compute_form_data.
+"""
+
+import os
+import shutil
+import threading
+
+import pytest
+
+from ufl import *
+from ufl.algorithms import compute_form_data, compute_form_data_batch, extract_coefficients
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dag, shared_dag_caches
+from ufl.algorithms.compute_form_data import clear_form_data_cache, \
+    set_form_data_cache_size, set_form_data_cache_dir, _form_data_cache
+from ufl.algorithms.formdatacache import FormDataCache, serialize_form_data, deserialize_form_data
+from ufl.core.multiindex import Index
+from ufl.variable import Label
+from ufl.algorithms.pass_profiling import profile_passes
+
+
+@pytest.fixture
+def cache():
+    clear_form_data_cache()
+    set_form_data_cache_size(64)
+    yield _form_data_cache
+    set_form_data_cache_size(0)
+    set_form_data_cache_dir(None)
+    clear_form_data_cache()
+
+
+def build_form(f, g):
+    V = f.ufl_element()
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    return (f*u*v + g*inner(grad(u), grad(v)))*dx + g*u*v*ds
+
+
+def test_cache_hit_shares_integrands(cache):
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    fd1 = compute_form_data(build_form(f, g))
+    fd2 = compute_form_data(build_form(f, g))
+    assert len(cache) == 1
+    assert fd1 is not fd2
+    assert fd1.integral_data[0] is not fd2.integral_data[0]
+    assert fd1.integral_data[0].integrals[0] is fd2.integral_data[0].integrals[0]
+    assert fd1.reduced_coefficients == fd2.reduced_coefficients
+
+    # Different options are cached separately
+    compute_form_data(build_form(f, g), do_apply_function_pullbacks=True)
+    assert len(cache) == 2
+
+
+def test_cache_hit_is_renumbered_for_new_coefficients(cache):
+    V = FiniteElement("CG", triangle, 1)
+    f, g = Coefficient(V), Coefficient(V)
+    fd1 = compute_form_data(build_form(f, g))
+    h, k = Coefficient(V), Coefficient(V)
+    fd2 = compute_form_data(build_form(h, k))
+    assert len(cache) == 1
+    assert fd2.original_form == build_form(h, k)
+    assert fd2.reduced_coefficients == [h, k]
+    assert fd2.function_replace_map[h] == fd1.function_replace_map[f]
+    assert fd2.function_replace_map[k] == fd1.function_replace_map[g]
+    assert fd2.integral_data[0].integral_coefficients == set((h, k))
+    assert fd1.integral_data[0].integral_coefficients == set((f, g))
+
+    # The integrals refer to the new form
+    assert fd2.preprocessed_form.coefficients() == (h, k)
+    assert fd1.preprocessed_form.coefficients() == (f, g)
+    for itg_data in fd2.integral_data:
+        for itg in itg_data.integrals:
+            assert set(extract_coefficients(itg.integrand())) <= set((h, k))
+
+
+def test_cache_is_disabled_by_default():
+    clear_form_data_cache()
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    compute_form_data(f*dx)
+    assert len(_form_data_cache) == 0
+
+
+def test_cache_hit_uses_subdomain_data_of_new_form(cache):
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    markers1 = Coefficient(V)
+    markers2 = Coefficient(V)
+    a1 = f*dx(1, subdomain_data=markers1)
+    a2 = f*dx(1, subdomain_data=markers2)
+    assert a1.signature() == a2.signature()
+    fd1 = compute_form_data(a1)
+    fd2 = compute_form_data(a2)
+    assert len(cache) == 2
+    assert fd2.original_form is a2
+    compute_form_data(f*dx(1, subdomain_data=markers2))
+    assert len(cache) == 2
+
+
+def test_cache_hit_uses_domains_of_new_form(cache):
+    V = FiniteElement("CG", triangle, 1)
+    forms = []
+    for i in range(2):
+        mesh = Mesh(VectorElement("CG", triangle, 1))
+        f = Coefficient(FunctionSpace(mesh, V))
+        forms.append(f*SpatialCoordinate(mesh)[0]*dx(domain=mesh))
+    fd1 = compute_form_data(forms[0])
+    fd2 = compute_form_data(forms[1])
+    assert len(cache) == 1
+    mesh = forms[1].ufl_domain()
+    assert fd2.integral_data[0].domain is mesh
+    assert fd2.preprocessed_form.ufl_domains() == (mesh,)
+    assert fd2.preprocessed_form.coefficients() == forms[1].coefficients()
+    assert fd1.preprocessed_form.ufl_domains() == (forms[0].ufl_domain(),)
+
+
+def test_cache_evicts_least_recently_used(cache):
+    set_form_data_cache_size(2)
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    forms = [f*dx, f**2*dx, f**3*dx]
+    compute_form_data(forms[0])
+    compute_form_data(forms[1])
+    compute_form_data(forms[0])
+    compute_form_data(forms[2])
+    assert len(cache) == 2
+    signatures = set(key[0] for key in cache)
+    assert signatures == set((forms[0].signature(), forms[2].signature()))
+
+    set_form_data_cache_size(0)
+    assert len(cache) == 0
+    compute_form_data(forms[1])
+    assert len(cache) == 0
+
+
+def test_disk_cache_roundtrip(cache, tmpdir):
+    options = dict(do_apply_function_pullbacks=True,
+                   do_apply_integral_scaling=True,
+                   do_apply_geometry_lowering=True)
+    V = FiniteElement("CG", triangle, 2)
+    f, g = Coefficient(V), Coefficient(V)
+    set_form_data_cache_dir(str(tmpdir))
+    compute_form_data(build_form(f, g), **options)
+    assert len(tmpdir.listdir()) == 1
+
+    # A new process would start with an empty cache and new coefficients
+    clear_form_data_cache()
+    h, k = Coefficient(V), Coefficient(V)
+    a = build_form(h, k)
+    fd = compute_form_data(a, **options)
+
+    set_form_data_cache_size(0)
+    set_form_data_cache_dir(None)
+    expected = compute_form_data(a, **options)
+    assert fd.original_form is a
+    # Index counts differ between the two computations
+    assert fd.preprocessed_form.signature() == expected.preprocessed_form.signature()
+    assert fd.preprocessed_form.coefficients() == (h, k)
+    assert fd.reduced_coefficients == expected.reduced_coefficients
+    assert fd.function_replace_map == expected.function_replace_map
+    assert fd.unique_elements == expected.unique_elements
+    for itg_data, expected_itg_data in zip(fd.integral_data, expected.integral_data):
+        assert itg_data.domain == expected_itg_data.domain
+        assert itg_data.integral_coefficients == expected_itg_data.integral_coefficients
+        assert itg_data.enabled_coefficients == expected_itg_data.enabled_coefficients
+
+
+def test_disk_cache_eviction(tmpdir):
+    disk_cache = FormDataCache(str(tmpdir))
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    forms = [f*dx, f**2*dx, f**3*dx]
+    for a in forms:
+        set_form_data_cache_size(0)
+        disk_cache.put(a.signature(), compute_form_data(a))
+    files = disk_cache.files()
+    assert len(files) == 3
+    assert not any(name.endswith(".tmp") for name in os.listdir(str(tmpdir)))
+
+    # Mark the first file as the oldest one and evict it
+    os.utime(disk_cache.filename(forms[0].signature()), (0, 0))
+    disk_cache.evict(sum(f[1] for f in files) - 1)
+    assert len(disk_cache.files()) == 2
+    assert disk_cache.get(forms[0].signature(), forms[0]) is None
+    fd = disk_cache.get(forms[1].signature(), forms[1])
+    assert fd.preprocessed_form == compute_form_data(forms[1]).preprocessed_form
+
+    disk_cache.clear()
+    assert disk_cache.files() == []
+
+
+def test_disk_cache_raises_index_counts(cache):
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    a = f*inner(grad(f), grad(f))*dx
+    data = serialize_form_data(compute_form_data(a))
+    # Pretend the data was stored by a process with larger counts
+    counts = (Index._globalcount + 1000, Label._globalcount + 1000)
+    data["counts"] = counts
+    deserialize_form_data(data, a)
+    assert Index().count() >= counts[0]
+    assert Label().count() >= counts[1]
+
+
+def test_disk_cache_put_ignores_disk_errors(tmpdir):
+    directory = str(tmpdir.join("cache"))
+    disk_cache = FormDataCache(directory)
+    V = FiniteElement("CG", triangle, 1)
+    a = Coefficient(V)*dx
+    fd = compute_form_data(a)
+    shutil.rmtree(directory)
+    disk_cache.put(a.signature(), fd)
+    assert not os.path.exists(directory)
+
+
+def test_parallel_preprocessing_matches_serial(cache):
+    set_form_data_cache_size(0)
+    options = dict(do_apply_function_pullbacks=True,
+                   do_apply_integral_scaling=True,
+                   do_apply_geometry_lowering=True)
+    V = VectorElement("CG", triangle, 2)
+    f = Coefficient(V)
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    n = FacetNormal(triangle)
+    a = (inner(grad(u), grad(v))*dx(0) + det(grad(f))*inner(u, v)*dx(1) +
+         dot(grad(u)*n, v)*ds(2) + inner(jump(u), avg(v))*dS)
+
+    serial = compute_form_data(a, **options)
+    parallel = compute_form_data(a, parallel=2, **options)
+    assert serial.preprocessed_form.signature() == parallel.preprocessed_form.signature()
+    assert [(d.integral_type, d.subdomain_id) for d in serial.integral_data] == \
+        [(d.integral_type, d.subdomain_id) for d in parallel.integral_data]
+    assert parallel.preprocessed_form.arguments() == (v, u)
+    assert parallel.preprocessed_form.coefficients() == (f,)
+    assert parallel.preprocessed_form.ufl_domains() == a.ufl_domains()
+    assert parallel.reduced_coefficients == serial.reduced_coefficients
+
+
+class LockedMesh(Mesh):
+    def __init__(self, coordinate_element):
+        Mesh.__init__(self, coordinate_element)
+        self.lock = threading.Lock()
+
+
+class LockedFunctionSpace(FunctionSpace):
+    def __init__(self, domain, element):
+        FunctionSpace.__init__(self, domain, element)
+        self.lock = threading.Lock()
+
+
+class LockedCoefficient(Coefficient):
+    def __init__(self, V):
+        Coefficient.__init__(self, V)
+        self.lock = threading.Lock()
+
+
+def test_parallel_preprocessing_of_unpicklable_subclasses():
+    set_form_data_cache_size(0)
+    mesh = LockedMesh(VectorElement("CG", triangle, 1))
+    V = LockedFunctionSpace(mesh, FiniteElement("CG", triangle, 2))
+    f = LockedCoefficient(V)
+    g = Coefficient(FunctionSpace(mesh, FiniteElement("DG", triangle, 0)))
+    v = TestFunction(V)
+    a = f*g*v*dx + inner(grad(f), grad(v))*ds
+
+    serial = compute_form_data(a)
+    parallel = compute_form_data(a, parallel=2)
+    assert serial.preprocessed_form.signature() == parallel.preprocessed_form.signature()
+    assert parallel.preprocessed_form.coefficients() == (f, g)
+    assert all(c is o for c, o in zip(parallel.preprocessed_form.coefficients(), (f, g)))
+    assert parallel.preprocessed_form.ufl_domains() == (mesh,)
+    assert parallel.preprocessed_form.ufl_domains()[0] is mesh
+
+
+class CountingLowering(MultiFunction):
+    def __init__(self, counts):
+        MultiFunction.__init__(self)
+        self.counts = counts
+
+    def dag_cache_key(self):
+        return ()
+
+    def expr(self, o, *ops):
+        self.counts[o] = self.counts.get(o, 0) + 1
+        return MultiFunction.reuse_if_untouched(self, o, *ops)
+
+
+def test_shared_dag_caches():
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    shared = sin(f*f)
+    a = shared + f
+    b = shared*cos(f)
+
+    counts = {}
+    map_expr_dag(CountingLowering(counts), a)
+    map_expr_dag(CountingLowering(counts), b)
+    assert counts[shared] == 2
+
+    counts = {}
+    with shared_dag_caches():
+        map_expr_dag(CountingLowering(counts), a)
+        map_expr_dag(CountingLowering(counts), b)
+    assert set(counts.values()) == set((1,))
+    assert counts[shared] == 1
+
+
+def test_batch_matches_single_forms(cache):
+    V = VectorElement("CG", triangle, 1)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    du = TrialFunction(V)
+    F = grad(u) + Identity(2)
+    psi = tr(F.T*F)**2 + det(F)
+    E = psi*dx
+    R = derivative(E, u, v)
+    J = derivative(R, u, du)
+    forms = [E, R, J]
+    options = dict(do_apply_function_pullbacks=True,
+                   do_apply_geometry_lowering=True)
+
+    batch = compute_form_data_batch(forms, **options)
+    clear_form_data_cache()
+    single = [compute_form_data(a, **options) for a in forms]
+    assert [fd.original_form for fd in batch] == forms
+    assert [fd.preprocessed_form.signature() for fd in batch] == \
+        [fd.preprocessed_form.signature() for fd in single]
+
+
+def test_profile_passes(cache):
+    import json
+    options = dict(do_apply_function_pullbacks=True,
+                   do_apply_geometry_lowering=True)
+    V = FiniteElement("CG", triangle, 1)
+    f, g = Coefficient(V), Coefficient(V)
+    a = build_form(f, g)
+    fd0 = compute_form_data(a, **options)
+    assert fd0.pass_profile is None
+
+    records = []
+    with profile_passes(callback=records.append, trace_memory=True) as profiler:
+        fd = compute_form_data(a, **options)
+    assert fd is not fd0
+    assert len(profiler.profiles) == 1
+    profile = fd.pass_profile
+    assert profile is profiler.profiles[0]
+    assert records == profile.records
+    assert fd.preprocessed_form.signature() == fd0.preprocessed_form.signature()
+
+    names = [r.name for r in profile.records]
+    for name in ("apply_algebra_lowering", "apply_derivatives", "group_form_integrals",
+                 "attach_estimated_degrees", "apply_function_pullbacks",
+                 "apply_geometry_lowering", "apply_restrictions", "check_form_arity"):
+        assert name in names
+
+    # Integral transformations are recorded per integral
+    integrals = set((r.integral_type, r.subdomain_id) for r in profile.records
+                    if r.name == "apply_function_pullbacks")
+    assert integrals == set([("cell", "otherwise"), ("exterior_facet", "otherwise")])
+    for r in profile.records:
+        assert r.time >= 0
+        assert 0 < r.nodes_after <= r.tree_size_after
+        assert r.memory_delta is not None
+    lowering = profile.records[0]
+    assert lowering.name == "apply_algebra_lowering"
+    assert lowering.integral_type is None
+
+    data = json.loads(profile.to_json())
+    assert len(data["passes"]) == len(profile.records)
+    assert data["passes"][0]["name"] == "apply_algebra_lowering"
+    assert json.loads(profiler.to_json())[0] == data
+    assert "apply_derivatives" in str(profile)
@@ -0,0 +1,116 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of cache statistics of map_expr_dags.
+"""
+
+import json
+
+from ufl import *
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dag, map_expr_dags, shared_dag_caches
+from ufl.corealg.dag_statistics import collect_dag_statistics, active_dag_statistics
+
+
+class Identity(MultiFunction):
+    expr = MultiFunction.reuse_if_untouched
+
+    def terminal(self, o):
+        return o
+
+
+class IndexedCounter(MultiFunction):
+    def expr(self, o, *ops):
+        return sum(ops)
+
+    def terminal(self, o):
+        return 0
+
+    def indexed(self, o):
+        # Cutoff handler
+        return 1
+
+
+def test_dag_statistics_of_identity():
+    x = SpatialCoordinate(triangle)
+    e = x[0]*x[1] + x[0]
+    f = x[0]*x[1]
+    with collect_dag_statistics() as collector:
+        assert active_dag_statistics() is collector
+        e2, f2 = map_expr_dags(Identity(), [e, f])
+    assert active_dag_statistics() is None
+    assert e2 == e and f2 == f
+
+    s, = collector.records
+    assert s.algorithm == "Identity"
+    # x, 0, 1, x[0], x[1], x[0]*x[1], e
+    assert s.input_nodes == 7
+    assert s.visited == 8
+    assert s.vcache_hits == 1
+    assert s.handler_calls == 7
+    assert s.cutoff_skipped == 0
+    assert s.rcache_hits == 0
+    assert s.output_nodes == 7
+    assert s.size_ratio() == 1.0
+
+
+def test_dag_statistics_of_cutoffs_and_compression():
+    x = SpatialCoordinate(triangle)
+    e = x[0] + x[1]
+    with collect_dag_statistics() as collector:
+        assert map_expr_dag(IndexedCounter(), e) == 2
+    s, = collector.records
+    assert s.visited == 3
+    assert s.cutoff_skipped == 3
+    # Both indexed results are the integer 1
+    assert s.rcache_hits == 1
+    assert s.output_nodes is None
+    assert s.size_ratio() is None
+
+
+class SharedIndexedCounter(IndexedCounter):
+    def dag_cache_key(self):
+        return ()
+
+
+def test_dag_statistics_count_cache_hits_apart_from_cutoffs():
+    x = SpatialCoordinate(triangle)
+    e = x[0]*x[1]
+    with collect_dag_statistics() as collector:
+        with shared_dag_caches():
+            map_expr_dag(Identity(), e)
+            map_expr_dag(SharedIndexedCounter(), e)
+            map_expr_dag(SharedIndexedCounter(), e)
+        map_expr_dags(Identity(), [e, e])
+    identity, first, second, repeated = collector.records
+    assert identity.cutoff_skipped == 0
+    assert first.cutoff_skipped == 3
+    assert first.handler_calls == 3
+    # Shared cache hits are not counted as cutoffs
+    assert second.handler_calls == 0
+    assert second.vcache_hits == second.visited == 3
+    assert second.cutoff_skipped == 3
+    # Nor are hits from an earlier expression of the same call
+    assert repeated.vcache_hits == 1
+    assert repeated.cutoff_skipped == 0
+
+
+def test_dag_statistics_by_algorithm():
+    x = SpatialCoordinate(triangle)
+    i, j = indices(2)
+    e = as_tensor(x[i]*x[j], (i, j))[0, 1]
+    with collect_dag_statistics() as collector:
+        for k in range(3):
+            map_expr_dag(Identity(), e*k)
+        map_expr_dag(IndexedCounter(), e)
+    totals = collector.by_algorithm()
+    assert totals["Identity"].calls == 3
+    assert totals["Identity"].handler_calls == sum(r.handler_calls for r in collector.records
+                                                    if r.algorithm == "Identity")
+    assert len(totals) == 2
+
+    data = json.loads(collector.to_json())
+    assert len(data["calls"]) == len(collector.records)
+    assert [d["algorithm"] for d in data["algorithms"]] == list(totals.keys())
+    assert "Identity" in str(collector)
@@ -0,0 +1,98 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of stable structural digests of expressions.
+"""
+
+import os
+import subprocess
+import sys
+
+from ufl import *
+from ufl.classes import FloatValue, ConstantValue
+from ufl.core.compute_expr_digest import compute_expr_digest
+
+
+def build_expression():
+    V = FiniteElement("CG", triangle, 1)
+    W = VectorElement("CG", triangle, 1)
+    f = Coefficient(V, count=1)
+    w = Coefficient(W, count=2)
+    x = SpatialCoordinate(triangle)
+    i = Index(count=3)
+    return f*sin(x[0]) + w[i]*w[i] + conditional(lt(f, 0.5), f, 2*f)
+
+
+script = """
+from ufl import *
+import test_digest
+from ufl.core.compute_expr_digest import compute_expr_digest
+print(compute_expr_digest(test_digest.build_expression()).hex())
+"""
+
+
+def test_digest_is_memoized_on_all_nodes():
+    e = build_expression()
+    d = compute_expr_digest(e)
+    assert isinstance(d, bytes)
+    assert len(d) == 16
+    assert e._digest is d
+    assert all(o._digest is not None for o in e.ufl_operands)
+    assert compute_expr_digest(e) is d
+
+
+def test_digest_of_equal_expressions():
+    a = build_expression()
+    b = build_expression()
+    assert a is not b
+    assert compute_expr_digest(a) == compute_expr_digest(b)
+    assert a == b
+
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V, count=1)
+    g = Coefficient(V, count=4)
+    assert compute_expr_digest(f*f) != compute_expr_digest(f*g)
+    assert compute_expr_digest(f + 1) != compute_expr_digest(f + 1.0)
+    assert compute_expr_digest(FloatValue(0.1)) != compute_expr_digest(FloatValue(0.1 + 1e-16))
+
+
+def test_digest_of_equal_scalar_values():
+    # Zero values are normally represented by Zero, so bypass that
+    a = ConstantValue.__new__(FloatValue)
+    a.__init__(0.0)
+    b = ConstantValue.__new__(FloatValue)
+    b.__init__(-0.0)
+    assert a == b
+    assert compute_expr_digest(a) == compute_expr_digest(b)
+
+
+def test_equality_uses_digests():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    a = sin(f*f)
+    b = sin(f*f)
+    compute_expr_digest(a)
+    compute_expr_digest(b)
+    assert a == b
+    c = cos(f*f)
+    compute_expr_digest(c)
+    assert not a == c
+
+    # Inconsistent digests would show up as inequality
+    b._digest = c._digest
+    assert not a == b
+
+
+def test_digest_is_independent_of_hash_seed():
+    env = dict(os.environ)
+    path = [os.path.dirname(os.path.abspath(__file__))]
+    if env.get("PYTHONPATH"):
+        path.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(path)
+    digests = set()
+    for seed in ("1", "2"):
+        env["PYTHONHASHSEED"] = seed
+        out = subprocess.check_output([sys.executable, "-c", script], env=env)
+        digests.add(out.strip().decode("ascii"))
+    assert digests == {compute_expr_digest(build_expression()).hex()}
@@ -82,3 +82,107 @@ def test_comparison_of_deeply_nested_expression():
     assert a == b
     assert not a == c
     assert not b == c
+
+
+def test_equality_cache_of_deep_comparisons():
+    import ufl.exprequals as exprequals
+    from ufl.core.compute_expr_digest import compute_expr_digest
+    from ufl.sorting import sort_key
+    exprequals.clear_equality_cache()
+
+    x = SpatialCoordinate(triangle)
+
+    def build_expr(n):
+        a = x[0]
+        for k in range(n):
+            a = sin(a)*x[1] + k
+        return a
+
+    a = build_expr(50)
+    b = build_expr(50)
+    c = build_expr(50) + 1
+    d = build_expr(50) + 2
+    assert a is not b
+    assert a == b
+    assert exprequals._cached_equality(a, b) is True
+    assert exprequals._cached_equality(b, a) is True
+    # Proven equal subexpressions are remembered too
+    assert exprequals._cached_equality(a.ufl_operands[1], b.ufl_operands[1]) is True
+
+    # Digest and sort key computed for one of them are shared
+    compute_expr_digest(c)
+    sort_key(d)
+    assert c.ufl_operands[1] == d.ufl_operands[1]
+    assert d.ufl_operands[1]._digest is c.ufl_operands[1]._digest
+    assert c.ufl_operands[1]._sort_key is d.ufl_operands[1]._sort_key
+
+    # The cache can be bounded or disabled
+    exprequals.set_equality_cache_size(2)
+    assert len(exprequals._equality_cache) <= 2
+    exprequals.set_equality_cache_size(0)
+    assert len(exprequals._equality_cache) == 0
+    assert build_expr(10) == build_expr(10)
+    assert len(exprequals._equality_cache) == 0
+    exprequals.set_equality_cache_size(4096)
+
+
+def test_equality_statistics():
+    from ufl.core.expr import Expr
+    from ufl.core.operator import Operator
+    from ufl.log import UFLException
+    import ufl.exprequals as exprequals
+    x = SpatialCoordinate(triangle)
+    equals = Expr.__dict__["__eq__"]
+    compute_hash = Operator.__dict__["_ufl_compute_hash_"]
+
+    with exprequals.collect_equality_statistics() as stats:
+        assert Expr.__dict__["__eq__"] is not equals
+        a = x[0]*x[1] + 1
+        b = x[0]*x[1] + 1
+        c = x[0]*x[1] + 2
+        assert a == b
+        assert not a == c
+        assert a == a
+        assert not a == 1
+        with pytest.raises(UFLException):
+            exprequals.enable_equality_statistics()
+    assert Expr.__dict__["__eq__"] is equals
+    assert Operator.__dict__["_ufl_compute_hash_"] is compute_hash
+
+    s = stats.pairs[("Sum", "Sum")]
+    assert s.comparisons == 3
+    assert s.equal == 2
+    assert s.not_equal == 1
+    assert s.collisions == 0
+    assert s.deep_comparisons == 1
+    assert s.deep_time <= s.time
+    assert stats.hashes["Sum"].computations == 3
+    assert stats.hashes["Product"].computations == 3
+    assert stats.total().comparisons >= 3
+
+    d = stats.as_dict()
+    assert d["pairs"]["Sum,Sum"]["equal"] == 2
+    assert stats.report().split("\n")[1].split()[:2] == ["Sum,", "Sum"]
+
+    # Collisions are counted if hashes of unequal objects are equal
+    with exprequals.collect_equality_statistics() as stats:
+        c._hash = a._hash
+        assert not a == c
+    assert stats.pairs[("Sum", "Sum")].collisions == 1
+
+
+def test_deprecated_collision_measuring(capsys):
+    from ufl.core.expr import Expr
+    import ufl.exprequals as exprequals
+    x = SpatialCoordinate(triangle)
+    equals = exprequals.measure_collisions(Expr.__dict__["__eq__"])
+    a = x[0]*x[1] + 3
+    assert equals(a, x[0]*x[1] + 3)
+    assert not equals(a, x[0]*x[1] + 4)
+    exprequals.print_collisions()
+    assert "Sum, Sum" in capsys.readouterr().out
+
+    with exprequals.collect_equality_statistics():
+        a == x[0]*x[1] + 5
+        exprequals.print_collisions()
+    assert "Sum, Sum" in capsys.readouterr().out
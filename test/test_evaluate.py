@@ -364,3 +364,76 @@ def test_cofac():
 
 def test_inv():
     pass  # TODO
+
+
+def test_memoized_evaluation_matches_evaluate():
+    x = SpatialCoordinate(triangle)
+    element = FiniteElement("CG", triangle, 1)
+    velement = VectorElement("CG", triangle, 1)
+    f = Coefficient(element)
+    w = Coefficient(velement)
+    i, j = indices(2)
+    A = as_matrix([[x[0], 2 * x[1]], [x[0] * x[1], 3]])
+    expressions = [
+        x[0] ** 2 + sin(x[1]) / 3,
+        exp(x[0]) - ln(2 + x[1] ** 2) + sqrt(abs(x[0])) + erf(x[1]),
+        conditional(And(lt(x[0], 6), Not(gt(x[1], 1.5))), x[0], 2 * x[1]),
+        max_value(x[0], x[1]) - min_value(x[0], 1.0) + atan_2(x[1], x[0]),
+        A[i, j] * A[j, i] + det(A) + tr(A),
+        inv(A)[0, 1],
+        dot(A, x)[1] * f + dot(w, grad(f)),
+        as_tensor(A[j, i] * A[j, 1], (i,))[0],
+        variable(x[0]) * f ** 2,
+    ]
+
+    def fvalue(x, derivatives=()):
+        return x[0] * x[1] if not derivatives else x[1 - derivatives[0]]
+    mapping = {f: fvalue, w: (3, -1)}
+    for s in expressions:
+        assert s((5, 7), mapping, memoize=True) == s((5, 7), mapping)
+
+    s = as_vector((x[0] * x[1], A[i, 1] * x[i]))
+    for c in ((0,), (1,)):
+        assert s((5, 7), component=c, memoize=True) == s((5, 7), component=c)
+
+
+def test_memoized_evaluation_of_shared_subexpressions():
+    element = FiniteElement("CG", triangle, 1)
+    f = Coefficient(element)
+    calls = []
+
+    def fvalue(x):
+        calls.append(x)
+        return 0.5
+
+    s = f
+    for k in range(30):
+        s = s * s + s
+    s = s / (1 + s)
+    s((5, 7), {f: fvalue}, memoize=True)
+    assert len(calls) == 1
+
+    # Without memoization, the number of calls grows exponentially
+    s = f
+    for k in range(4):
+        s = s * s + s
+    del calls[:]
+    s((5, 7), {f: fvalue})
+    assert len(calls) == 3 ** 4
+
+
+def test_memoized_evaluation_of_deep_expressions():
+    x = SpatialCoordinate(triangle)
+    s = x[0]
+    for k in range(3000):
+        s = 0.5 * s + x[1]
+    assert abs(s((5, 7), memoize=True) - 14) < 1e-12
+
+
+def test_memoized_evaluation_of_conditionals_with_failing_branches():
+    x = SpatialCoordinate(triangle)
+    s = conditional(gt(x[0], 0), x[0], ln(-x[0]))
+    assert s((5, 7), memoize=True) == s((5, 7)) == 5
+    s = conditional(lt(x[0], 0), x[0], ln(-x[0]))
+    with pytest.raises(ValueError):
+        s((5, 7), memoize=True)
@@ -0,0 +1,112 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of vectorized evaluation of expressions in arrays of points.
+"""
+
+import numpy
+import pytest
+
+from ufl import *
+from ufl.algorithms.evaluation import evaluate_points
+
+
+@pytest.fixture
+def points():
+    return numpy.array([[0.1, 0.2], [0.5, -0.3], [1.5, 0.7], [-0.4, 2.0]])
+
+
+def evaluate_pointwise(expr, points, mapping=None):
+    "Evaluate expr with scalar evaluation in each point."
+    shape = expr.ufl_shape
+    values = numpy.zeros((len(points),) + shape)
+    for k, x in enumerate(points):
+        for c in numpy.ndindex(*shape):
+            values[(k,) + c] = expr(tuple(x), mapping, c)
+    return values
+
+
+def test_evaluate_points_matches_scalar_evaluation(points):
+    x = SpatialCoordinate(triangle)
+    i, j = indices(2)
+    A = as_matrix([[x[0], 2*x[1]], [x[0]*x[1], 3.0]])
+    expressions = [
+        x[0]**2 + sin(x[1])/3,
+        exp(x[0]) - ln(2 + x[1]**2) + sqrt(abs(x[0])),
+        cos(x[0])*tan(x[1]) + atan_2(x[1], x[0]) + erf(x[0]),
+        conditional(And(lt(x[0], 0.6), Not(gt(x[1], 1.5))), x[0], 2*x[1]),
+        max_value(x[0], x[1]) - min_value(x[0], 1.0),
+        dot(A, x),
+        inner(A, A),
+        A[i, j]*A[j, i],
+        as_tensor(A[i, j]*x[j], (i,)),
+        as_tensor(A[j, i]*A[j, 1], (i,)),
+        det(A) + tr(A),
+        inv(A),
+        outer(x, x)*A,
+        Identity(2)*x[0] + A.T,
+        cross(as_vector((x[0], x[1], 1.0)), as_vector((1.0, x[0], x[1]))),
+        as_vector((1.0, x[0], x[0]*x[1])),
+    ]
+    for expr in expressions:
+        values = evaluate_points(expr, points)
+        assert values.shape == (len(points),) + expr.ufl_shape
+        assert numpy.allclose(values, evaluate_pointwise(expr, points))
+
+
+def test_evaluate_points_with_mapping(points):
+    x = SpatialCoordinate(triangle)
+    V = FiniteElement("CG", triangle, 1)
+    W = VectorElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    w = Coefficient(W)
+
+    def fvalues(x, derivatives=()):
+        if derivatives == ():
+            return x[..., 0]**2*x[..., 1]
+        elif derivatives == (0,):
+            return 2*x[..., 0]*x[..., 1]
+        elif derivatives == (1,):
+            return x[..., 0]**2
+        return 0*x[..., 0]
+
+    wvalue = numpy.array([3.0, -1.0])
+    expr = f*g + dot(w, grad(f)) + x[0]*f
+    mapping = {f: fvalues, g: 2.0, w: wvalue}
+    values = evaluate_points(expr, points, mapping)
+
+    # Scalar evaluation of the same expression and mapping
+    scalar_mapping = {f: lambda x, d=(): float(fvalues(numpy.array(x), d)),
+                      g: 2.0, w: tuple(wvalue)}
+    assert numpy.allclose(values, evaluate_pointwise(expr, points, scalar_mapping))
+
+    # Per point values in the mapping
+    gvalues = points[:, 0] + 1
+    values = evaluate_points(f*g, points, {f: 1.5, g: gvalues})
+    assert numpy.allclose(values, 1.5*gvalues)
+
+
+def test_call_with_points_array(points):
+    x = SpatialCoordinate(triangle)
+    expr = as_vector((x[0]*x[1], x[1]))
+    values = expr(points)
+    assert values.shape == (len(points), 2)
+    assert numpy.allclose(values[:, 0], points[:, 0]*points[:, 1])
+    assert numpy.allclose(expr(points, component=(1,)), points[:, 1])
+
+    # Constant expressions are broadcast to all points
+    assert numpy.allclose(as_ufl(3.0)(points), 3.0*numpy.ones(len(points)))
+
+
+def test_evaluate_points_of_nested_index_sums(points):
+    x = SpatialCoordinate(tetrahedron)
+    points = numpy.hstack([points, points[:, :1]])
+    i, j, k = indices(3)
+    A = outer(x, x) + Identity(3)
+    expr = A[i, j]*A[j, k]*A[k, i]
+    values = evaluate_points(expr, points)
+    expected = [numpy.trace(numpy.linalg.matrix_power(numpy.outer(p, p) + numpy.eye(3), 3))
+                for p in points]
+    assert numpy.allclose(values, expected)
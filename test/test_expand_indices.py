@@ -15,6 +15,9 @@ from ufl import *
 from ufl.algorithms import *
 from ufl.algorithms.renumbering import renumber_indices
 from ufl.classes import Sum, Product
+from ufl.algorithms.apply_algebra_lowering import apply_algebra_lowering
+from ufl.algorithms.transformer import apply_transformer
+from ufl.algorithms.expand_indices import IndexExpander, IndexScalarizer
 
 # TODO: Test expand_indices2 throuroughly for correctness, then efficiency:
 # expand_indices, expand_indices2 = expand_indices2, expand_indices
@@ -325,6 +328,67 @@ def test_expand_indices_nabla_div_grad(self, fixt):
     compare(inner(a, a), (10.00+11.00)**2 + (10.01+11.01)**2 + (10.10+11.10)**2 + (10.11+11.11)**2)
 
 
+def test_expand_indices_matches_index_expander():
+    cell = tetrahedron
+    V = VectorElement("CG", cell, 2)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    du = TrialFunction(V)
+    I = Identity(3)
+    F = I + grad(u)
+    C = F.T*F
+    E = (C - I)/2
+    psi = tr(E*E) + tr(E)**2 + ln(det(F))**2 + inner(inv(C), E)
+    L = derivative(psi*dx, u, v)
+    a = derivative(L, u, du)
+    w = as_vector((u[0], 0, u[1]*u[2]))
+    f = conditional(lt(u[i]*u[i], 1.0), w[j]*grad(u)[j, k]*w[k], 2.0)*dx
+    for form in (L, a, f):
+        form = expand_derivatives(apply_algebra_lowering(form))
+        expected = apply_transformer(form, IndexExpander())
+        assert expand_indices(form).equals(expected)
+        assert purge_list_tensors(form.integrals()[0].integrand()) == \
+            expected.integrals()[0].integrand()
+
+
+def test_index_scalarizer_components():
+    V = VectorElement("CG", triangle, 1)
+    w = Coefficient(V)
+    A = as_matrix([[w[0], 0], [w[1]*w[0], 1]])
+    B = as_tensor(A[i, k]*A[k, j] + w[i]*w[j], (i, j))
+    scalarizer = IndexScalarizer()
+    components = list(scalarizer.iter_components(B))
+    assert [c for c, e in components] == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    for c, e in components:
+        assert e.ufl_shape == () and e.ufl_free_indices == ()
+        assert e == expand_indices(B[c])
+
+    # Components are expanded on request, and expansions are reused
+    expansions = scalarizer.iter_components(A)
+    assert next(expansions)[1] == w[0]
+    e = scalarizer.scalar_component(A, (1, 0))
+    assert e == w[1]*w[0]
+    assert scalarizer.scalar_component(A, (1, 0)) is e
+
+
+
+def test_expand_indices_of_indexed_vector_variable():
+    V = VectorElement("CG", triangle, 1)
+    w = Coefficient(V)
+    v = variable(w*2)
+    # Each component is expanded from the variable expression, where
+    # IndexExpander reused the first component for all components
+    e = expand_indices((v[0] + v[1])*dx).integrals()[0].integrand()
+    assert e == 2*w[0] + 2*w[1]
+    expected = apply_transformer((v[0] + v[1])*dx, IndexExpander())
+    assert e != expected.integrals()[0].integrand()
+
+    # Scalar variables are kept
+    s = variable(w[0]*w[1])
+    e = expand_indices((s + 1)*dx).integrals()[0].integrand()
+    assert e == s + 1
+
+
 def xtest_expand_indices_list_tensor_problem(self, fixt):
     print()
     print(('='*40))
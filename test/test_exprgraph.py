@@ -0,0 +1,90 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of the array representation of expression DAGs.
+"""
+
+import pickle
+
+import pytest
+
+from ufl import *
+from ufl.classes import Sum, Product, Indexed, Terminal, Operator
+from ufl.algorithms import expand_derivatives, extract_coefficients
+from ufl.algorithms.exprgraph import ExprGraph
+from ufl.corealg.traversal import unique_pre_traversal
+
+
+@pytest.fixture
+def form():
+    V = VectorElement("CG", triangle, 1)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    F = grad(u) + Identity(2)
+    psi = tr(F.T*F)**2 + det(F)
+    a = derivative(psi*dx, u, v) + inner(u, v)*ds
+    return expand_derivatives(a)
+
+
+def test_graph_of_expression_has_unique_nodes():
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    g = f*f
+    e = g + sin(g)
+    G = ExprGraph(e)
+    assert len(G) == len(set(unique_pre_traversal(e)))
+    assert G.terminals == [f]
+    assert G.num_edges() == 5
+    assert list(G.arities()) == [0, 2, 1, 2]
+    assert list(G.parent_counts()) == [2, 2, 1, 0]
+    assert list(G.depths()) == [0, 1, 2, 3]
+    assert G.tree_sizes() == [1, 3, 4, 8]
+    assert G.count_type(Sum) == 1
+    assert G.count_type(Operator) == 3
+    assert G.has_type(Product)
+    assert not G.has_type(Indexed)
+
+
+def test_graph_operands_are_numbered_first(form):
+    G = ExprGraph(form)
+    for i in range(len(G)):
+        assert all(j < i for j in G.operands(i))
+
+
+def test_graph_of_form_roundtrip(form):
+    G = ExprGraph(form)
+    integrands = [itg.integrand() for itg in form.integrals()]
+    assert len(G.roots) == len(integrands)
+    assert G.expressions() == integrands
+    assert G.expression(1) == integrands[1]
+    assert set(G.extract_terminals(Coefficient)) == set(extract_coefficients(form))
+    assert sum(G.type_counts()) == len(G)
+    assert G.count_type(Terminal) == len(G.terminals)
+
+    H = ExprGraph(form.integrals())
+    assert H.expressions() == integrands
+
+
+def test_graph_reconstructs_nodes_with_new_terminals():
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    e = grad(f)[0] + sin(f)
+    G = ExprGraph(e)
+    assert G.nodes[G.roots[0]] is e
+    # Unchanged nodes are reused
+    assert G.expression() is e
+
+    # The reconstruct method of Grad knows the shape of the zero,
+    # which can not be found from the new operand
+    G.terminals = [as_ufl(2.0) if t == f else t for t in G.terminals]
+    assert G.expression() == sin(2.0)
+
+    # Graphs restored by pickle construct nodes from their classes
+    G = pickle.loads(pickle.dumps(ExprGraph(e)))
+    assert G.nodes is None
+    assert G.expression() == e
+
+
+def test_graph_argument_numbers(form):
+    G = ExprGraph(form)
+    numbers = G.argument_numbers()
+    assert all(numbers[i] == frozenset((0,)) for i in G.roots)
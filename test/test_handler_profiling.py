@@ -0,0 +1,90 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of profiling of MultiFunction handlers.
+"""
+
+from ufl import *
+from ufl.algebra import Sum
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dag
+from ufl.corealg.handler_profiling import profile_handlers, active_handler_profiler
+from ufl.algorithms.apply_derivatives import apply_derivatives
+
+
+class TerminalCounter(MultiFunction):
+    def expr(self, o, *ops):
+        return sum(ops)
+
+    def terminal(self, o):
+        return 1
+
+    def indexed(self, o):
+        # Cutoff handler
+        return 1
+
+
+def test_handlers_are_only_wrapped_when_profiling():
+    mf = TerminalCounter()
+    assert mf._handlers[Sum._ufl_typecode_] == mf.expr
+    with profile_handlers() as profiler:
+        assert active_handler_profiler() is profiler
+        mf = TerminalCounter()
+        assert mf._handlers[Sum._ufl_typecode_] != mf.expr
+    assert active_handler_profiler() is None
+
+
+def test_profile_handlers_counts_calls():
+    x = SpatialCoordinate(triangle)
+    e = x[0]*x[1] + x[0]
+    with profile_handlers() as profiler:
+        assert map_expr_dag(TerminalCounter(), e) == 3
+
+    stats = profiler.handlers["TerminalCounter.expr"]
+    assert stats.calls == 2
+    assert stats.cutoff_calls == 0
+    assert stats.self_time <= stats.cumulative_time
+
+    # The two x[0] are the same object, and the cutoff skips x
+    stats = profiler.handlers["TerminalCounter.indexed"]
+    assert stats.calls == 2
+    assert stats.cutoff_calls == 2
+    assert "TerminalCounter.terminal" not in profiler.as_dict()["handlers"]
+
+    assert profiler.types["Sum"].calls == 1
+    assert profiler.types["Product"].calls == 1
+    assert profiler.types["Indexed"].cutoff_calls == 2
+
+
+def test_profile_handlers_of_plain_functions():
+    x = SpatialCoordinate(triangle)
+
+    def count(o, *ops):
+        return 1 + sum(ops)
+
+    with profile_handlers() as profiler:
+        assert map_expr_dag(count, x[0] + x[1]) == 7
+    assert profiler.handlers["count"].calls == 6
+    assert profiler.types["Indexed"].calls == 2
+
+
+def test_profile_handlers_nested_rulesets():
+    x = SpatialCoordinate(triangle)
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    e = grad(grad(f*x[0]))
+    with profile_handlers() as profiler:
+        apply_derivatives(e)
+
+    rules = profiler.handlers["DerivativeRuleDispatcher.grad"]
+    assert rules.calls > 0
+    # The nested rulesets are applied within the dispatcher handler
+    nested = profiler.handlers["GradRuleset.product"]
+    assert nested.calls > 0
+    assert rules.self_time <= rules.cumulative_time - nested.self_time + 1e-9
+
+    report = profiler.report(limit=3)
+    lines = report.split("\n")
+    assert lines[0].split()[0] == "Handler"
+    assert len([line for line in lines if line]) == 8
+    assert "Type" in report
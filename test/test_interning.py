@@ -0,0 +1,68 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of interning (hash-consing) of operator objects.
+"""
+
+import gc
+
+import pytest
+
+from ufl import *
+from ufl.core.operator import Operator
+from ufl.classes import Sum, Abs
+
+
+@pytest.fixture
+def interning():
+    Operator.ufl_enable_interning()
+    yield
+    Operator.ufl_disable_interning()
+
+
+def test_interning_is_disabled_by_default():
+    assert not Operator.ufl_interning_enabled()
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    a = f*f + abs(f)
+    b = f*f + abs(f)
+    assert a == b
+    assert a is not b
+
+
+def test_equal_operators_are_identical(interning):
+    V = FiniteElement("CG", triangle, 1)
+    W = VectorElement("CG", triangle, 1)
+    f = Coefficient(V)
+    w = Coefficient(W)
+    i = Index()
+
+    def build():
+        return f*f + abs(f) + w[i]*w[i] + sin(f) + conditional(lt(f, 1), f, 2*f)
+    a = build()
+    b = build()
+    assert a is b
+    assert grad(w)[0, 1] is grad(w)[0, 1]
+    assert as_vector((f, 2*f)) is as_vector((f, 2*f))
+
+    # Different operands still give different objects
+    assert f*f + abs(f) is not f*f + f
+
+
+def test_interned_objects_are_released(interning):
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    a = sin(f*f)
+    table = Operator._ufl_interning_table_
+    assert len(table) == 2
+    del a
+    gc.collect()
+    assert len(table) == 0
+
+
+def test_disable_interning_restores_constructors():
+    init = Sum.__dict__["__init__"]
+    Operator.ufl_enable_interning()
+    assert Sum.__dict__["__init__"] is not init
+    Operator.ufl_disable_interning()
+    assert Sum.__dict__["__init__"] is init
+    assert Abs(Coefficient(FiniteElement("CG", triangle, 1))) is not None
@@ -0,0 +1,100 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of generated functions evaluating expressions with NumPy.
+"""
+
+import numpy
+import pytest
+
+from ufl import *
+from ufl.algorithms import lambdify
+from ufl.algorithms.evaluation import evaluate_points
+from ufl.algorithms.lambdify import generate_lambda_code, set_lambdify_cache_size, clear_lambdify_cache
+from ufl.algorithms.lambdify import _lambdify_cache
+
+
+@pytest.fixture
+def points():
+    return numpy.array([[0.1, 0.2], [0.5, -0.3], [1.5, 0.7], [-0.4, 2.0]])
+
+
+def test_lambdify_matches_evaluate_points(points):
+    x = SpatialCoordinate(triangle)
+    i, j = indices(2)
+    A = as_matrix([[x[0], 2*x[1]], [x[0]*x[1], 3.0]])
+    expressions = [
+        x[0]**2 + sin(x[1])/3,
+        exp(x[0]) - ln(2 + x[1]**2) + sqrt(abs(x[0])) + erf(x[1]),
+        conditional(Or(lt(x[0], 0.2), ge(x[1], 1.5)), x[0], 2*x[1]),
+        conditional(lt(x[0], 0.2), x, 2*x),
+        max_value(x[0], x[1]) - min_value(x[0], 1.0) + atan_2(x[1], x[0]),
+        A[i, j]*A[j, i] + det(A),
+        inv(A),
+        as_tensor(A[j, i]*A[j, 1], (i,)),
+        variable(x[0])*Identity(2),
+    ]
+    for expr in expressions:
+        f = lambdify(expr)
+        assert numpy.allclose(f(points), evaluate_points(expr, points))
+
+
+def test_lambdify_with_mapping(points):
+    V = FiniteElement("CG", triangle, 1)
+    W = VectorElement("CG", triangle, 1)
+    f = Coefficient(V)
+    w = Coefficient(W)
+    expr = f**2 + dot(w, w)*f
+    g = lambdify(expr)
+    for c in (1.0, 2.0):
+        mapping = {f: c*points[:, 0], w: (1.0, c)}
+        assert numpy.allclose(g(points, mapping), evaluate_points(expr, points, mapping))
+
+
+def test_lambdify_binds_common_subexpressions_once():
+    x = SpatialCoordinate(triangle)
+    a = sin(x[0]*x[1])
+    b = a + a*a
+    expr = b*b + b
+    source, terminals = generate_lambda_code(expr)
+    assert source.count("numpy.sin(") == 1
+    assert len([line for line in source.splitlines() if "+" in line]) == 2
+
+
+def test_lambdify_cache_shares_functions_by_signature(points):
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    i = Index()
+    x = SpatialCoordinate(triangle)
+    a = lambdify(f*x[i]*x[i] + cos(f))
+    b = lambdify(g*x[i]*x[i] + cos(g))
+    assert a.function is b.function
+    assert a.terminals != b.terminals
+    assert numpy.allclose(a(points, {f: 2.0}), b(points, {g: 2.0}))
+
+    c = lambdify(f*x[i]*x[i] + sin(f))
+    assert c.function is not a.function
+
+
+def test_lambdify_cache_is_bounded():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    x = SpatialCoordinate(triangle)
+    exprs = [f*x[0], f + x[1], cos(f)]
+    clear_lambdify_cache()
+    set_lambdify_cache_size(2)
+    try:
+        first = [lambdify(e).function for e in exprs]
+        assert len(_lambdify_cache) == 2
+        # The least recently used function was evicted
+        assert lambdify(exprs[0]).function is not first[0]
+        assert lambdify(exprs[2]).function is first[2]
+
+        set_lambdify_cache_size(0)
+        assert len(_lambdify_cache) == 0
+        assert lambdify(exprs[2]).function is not lambdify(exprs[2]).function
+    finally:
+        set_lambdify_cache_size(128)
+        clear_lambdify_cache()
@@ -10,8 +10,10 @@ from ufl import *
 
 from ufl.utils.dicts import EmptyDictType
 from ufl.classes import MultiIndex, FixedIndex
+from ufl.algorithms import signature
 from ufl.algorithms.signature import compute_multiindex_hashdata, \
-    compute_terminal_hashdata
+    compute_terminal_hashdata, compute_form_signature, \
+    compute_expression_signature
 
 from itertools import chain
 
@@ -506,3 +508,83 @@ def test_signature_of_forms_change_with_operators(self):
                 a = f*dx
                 yield a
     check_unique_signatures(forms())
+
+
+def test_signature_does_not_depend_on_counts():
+    def form(fc, gc, ic):
+        V = FiniteElement("CG", triangle, 1)
+        W = VectorElement("CG", triangle, 1)
+        f = Coefficient(V, count=fc)
+        g = Coefficient(W, count=gc)
+        i = Index(count=ic)
+        j = Index(count=ic + 1)
+        return (f*g[i]*g[i] + g[j]*f*g[j])*dx + f*ds
+    sigs = set(form(*c).signature() for c in ((1, 2, 3), (5, 7, 11), (20, 30, 40)))
+    assert len(sigs) == 1
+    assert form(2, 1, 3).signature() not in sigs
+
+
+def test_signature_of_shared_subexpressions_is_linear():
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    e = f
+    for k in range(100):
+        e = e*e + k
+    # The tree has more than 2**100 nodes, but only ~300 unique nodes
+    a = e*dx
+    assert len(a.signature()) == 128
+    assert a.signature() != ((e + 1)*dx).signature()
+
+    g = Coefficient(FiniteElement("CG", triangle, 1), count=f.count() + 1)
+    domain = f.ufl_domain()
+    sig = compute_expression_signature(e, {f: 0, domain: 0})
+    assert sig == compute_expression_signature(replace(e, {f: g}), {g: 0, domain: 0})
+
+
+def test_legacy_signature():
+    V = FiniteElement("CG", triangle, 1)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    a = (u*v + inner(grad(u), grad(v)))*dx + u*v*ds(1)
+    renumbering = a._compute_renumbering()
+    legacy = compute_form_signature(a, renumbering, legacy=True)
+    # The signature computed by UFL 2017.2
+    assert legacy == ("64fbc86be76c940e60645f7a20ff9961dfba2c215843cde16a08087a0484839f"
+                      "a6bf26769cbfbd586a023c5c03ad1e9378b2788477ec9ae7d72993d10e20b61c")
+    assert legacy != a.signature()
+    assert compute_form_signature(a, renumbering) == a.signature()
+
+
+def test_legacy_signature_of_indexed_operands_of_different_rank():
+    A = Coefficient(TensorElement("CG", triangle, 1))
+    B = Coefficient(VectorElement("CG", triangle, 1))
+    v = TestFunction(FiniteElement("CG", triangle, 1))
+    a = (A[0, 1] + B[0])*v*dx
+    legacy = compute_form_signature(a, a._compute_renumbering(), legacy=True)
+    # The signature computed by UFL 2017.2
+    assert legacy == ("54cd61d63c07ff3a84997e6d850805f3510480f6c70ce6eab541f45e283e05e9"
+                      "92224970ebd2c97f9cc4a726afd2d981915253eb91dfd3e50dc3692fba9ee239")
+
+
+def test_signature_reuses_integrand_digests(monkeypatch):
+    V = FiniteElement("CG", triangle, 1)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    e = u*v + inner(grad(u), grad(v))
+    sig = (e*dx).signature()
+
+    # Signing a new form with the same integrands and coefficients
+    # does not traverse them again
+    calls = []
+
+    def counting_hashdata(expressions, renumbering):
+        calls.append(expressions)
+        return compute_terminal_hashdata(expressions, renumbering)
+    monkeypatch.setattr(signature, "compute_terminal_hashdata", counting_hashdata)
+    assert (e*dx).signature() == sig
+    assert calls == []
+
+    # The renumbering is part of the cache key
+    w = Coefficient(V)
+    assert (replace(e, {u: w})*dx).signature() == sig
+    assert len(calls) == 1
+    assert ((u*v + inner(grad(w), grad(v)))*dx).signature() != sig
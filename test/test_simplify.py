@@ -5,6 +5,11 @@ import pytest
 from ufl.classes import Sum, Product
 import math
 from ufl import *
+from ufl.classes import Indexed, MultiIndex, FixedIndex, IntValue, FloatValue
+from ufl.algorithms import compute_form_data
+from ufl.algorithms.simplify import simplify
+from ufl.algorithms.compute_form_data import clear_form_data_cache
+from ufl.corealg.traversal import unique_pre_traversal
 
 
 def xtest_zero_times_argument(self):
@@ -127,3 +132,87 @@ def test_indexing(self):
     Bij2 = as_tensor(Bij, (i, j))[i, j]
     Bij3 = as_tensor(Bij, (i, j))
     assert Bij2 == Bij
+
+
+def test_simplify_folds_constants(self):
+    element = FiniteElement("CG", triangle, 1)
+    f = Coefficient(element)
+    g = Coefficient(element)
+
+    assert simplify(2*(3*f)) == 6*f
+    assert simplify(2*(f*(g*3))) == 6*(f*g)
+    assert simplify((2 + f) + 3) == 5 + f
+    assert simplify(((f + 1) + g) + -1) == f + g
+    assert simplify(2*(f*0.5)) == f
+    assert simplify((4*f)/2) == 2*f
+    assert simplify(4*(f/2)) == 2*f
+    assert simplify((2.0*f)/4.0) == 0.5*f
+    assert simplify((f/2.0)/4.0) == 0.125*f
+
+    # Integer divisions are only folded when exact
+    assert simplify((2*f)/3) == (2*f)/3
+    assert simplify((f/2)/3) == f/6
+    assert isinstance(simplify((2*f)/3).ufl_operands[1], IntValue)
+
+    # Nothing to fold
+    e = 2*f + g*f
+    assert simplify(e) is e
+
+
+def test_simplify_removes_known_conditionals(self):
+    element = FiniteElement("CG", triangle, 1)
+    f = Coefficient(element)
+
+    assert simplify(conditional(lt(1, 2), f, 2*f)) == f
+    assert simplify(conditional(Not(lt(1, 2)), f, 2*f)) == 2*f
+    assert simplify(conditional(And(lt(f, 2), gt(1, 2)), f, 2*f)) == 2*f
+    assert simplify(conditional(Or(lt(f, 2), lt(1, 2)), f, 2*f)) == f
+    assert simplify(conditional(lt(f, 2), 2*(3*f), 6*f)) == 6*f
+    e = conditional(lt(f, 2), f, 2*f)
+    assert simplify(e) == e
+
+    assert simplify(max_value(IntValue(1), FloatValue(2.5))) == 2.5
+    assert simplify(abs(as_ufl(-2))) == 2
+
+
+def test_simplify_selects_components_of_list_tensors(self):
+    element = FiniteElement("CG", triangle, 1)
+    f = Coefficient(element)
+
+    A = as_matrix([[f, 2*f], [3*f, 4*f]])
+    e = Indexed(A, MultiIndex((FixedIndex(1), FixedIndex(0))))
+    assert simplify(e) == 3*f
+    e = Indexed(A, MultiIndex((FixedIndex(1), i)))
+    assert simplify(e) == as_vector((3*f, 4*f))[i]
+
+
+def test_simplify_preserves_values(self):
+    element = FiniteElement("CG", triangle, 1)
+    f = Coefficient(element)
+    x = SpatialCoordinate(triangle)
+
+    e = (2*(x[0]*3) + 1)/4 + conditional(lt(2, 3), sin(2*(f*3)), f) + as_vector((f, 2*(x[1]*2)))[1]
+    s = simplify(e)
+    assert s != e
+    mapping = {f: 0.3}
+    assert abs(s((0.2, 0.7), mapping) - e((0.2, 0.7), mapping)) < 1e-14
+
+
+def test_compute_form_data_with_simplify(self):
+    V = VectorElement("CG", triangle, 1)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    F = Identity(2) + grad(u)
+    psi = 2*(tr(F.T*F)/2 - 1)
+    a = derivative(psi*dx, u, v)
+
+    clear_form_data_cache()
+    fd = compute_form_data(a, do_apply_function_pullbacks=True,
+                           do_apply_geometry_lowering=True)
+    fds = compute_form_data(a, do_apply_function_pullbacks=True,
+                            do_apply_geometry_lowering=True,
+                            do_simplify=True)
+    integrand = fd.preprocessed_form.integrals()[0].integrand()
+    simplified = fds.preprocessed_form.integrals()[0].integrand()
+    assert len(set(unique_pre_traversal(simplified))) < len(set(unique_pre_traversal(integrand)))
+    assert simplify(simplified) == simplified
@@ -0,0 +1,80 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of the canonical ordering of expressions.
+"""
+
+import random
+from functools import cmp_to_key
+
+from ufl import *
+from ufl.corealg.traversal import unique_pre_traversal
+from ufl.sorting import cmp_expr, sort_key, sorted_expr, _cmp_expr_trees
+
+
+def test_sort_keys_match_tree_comparison():
+    V = VectorElement("CG", triangle, 2)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    i, j = indices(2)
+    F = Identity(2) + grad(u)
+    e = inner(F.T*F, grad(v)) + det(F)*u[i]*v[i] + as_tensor(F[i, j]*u[j], (i,))[0]
+    nodes = list(unique_pre_traversal(e))
+    random.seed(3)
+    random.shuffle(nodes)
+    expected = sorted(nodes, key=cmp_to_key(_cmp_expr_trees))
+    assert [id(n) for n in sorted_expr(nodes)] == [id(n) for n in expected]
+    for a, b in zip(nodes[:-1], nodes[1:]):
+        assert cmp_expr(a, b) == _cmp_expr_trees(a, b) == -cmp_expr(b, a)
+
+
+def test_sort_keys_are_cached_and_independent_of_index_counts():
+    x = SpatialCoordinate(triangle)
+    i, j = indices(2)
+    e = x[i]*x[i] + 1
+    assert e._sort_key is None
+    k = sort_key(e)
+    assert e._sort_key is k
+    assert e.ufl_operands[1]._sort_key is not None
+    assert sort_key(x[j]*x[j] + 1) == k
+    assert cmp_expr(x[i], x[j]) == 0
+
+
+def test_cmp_expr_of_deep_expressions():
+    x = SpatialCoordinate(triangle)
+
+    def chain(n):
+        s = x[0]
+        for k in range(n):
+            s = s*x[1] + k
+        return s
+
+    # Keys too deep to be compared fall back to comparing trees
+    a = chain(3000)
+    b = chain(3000)
+    assert a is not b
+    assert cmp_expr(a, b) == 0
+    assert cmp_expr(a, chain(2999)) == -cmp_expr(chain(2999), a) != 0
+    assert [id(t) for t in sorted_expr([b, a])] == [id(b), id(a)]
+
+
+def test_operand_order_of_indexed_operands_of_different_rank():
+    A = Coefficient(TensorElement("CG", triangle, 1))
+    B = Coefficient(VectorElement("CG", triangle, 1))
+    x = SpatialCoordinate(triangle)
+    # Multi-indices are compared up to the length of the shorter one,
+    # so A[0, 1] and B[0] are ordered by their coefficients
+    assert cmp_expr(A[0, 1], B[0]) == cmp_expr(A, B) == -1
+    assert (A[0, 1] + B[0]).ufl_operands == (A[0, 1], B[0])
+    assert (B[0] + A[0, 1]).ufl_operands == (A[0, 1], B[0])
+    assert (B[0]*A[0, 1]).ufl_operands == (A[0, 1], B[0])
+
+    nodes = [A[0, 1], B[0], A[1, 0], B[1], A[0, 0]*x[0], B[0]*x[0], x[0], x[1]]
+    for a in nodes:
+        for b in nodes:
+            assert cmp_expr(a, b) == _cmp_expr_trees(a, b)
+    random.seed(5)
+    random.shuffle(nodes)
+    expected = sorted(nodes, key=cmp_to_key(_cmp_expr_trees))
+    assert [id(n) for n in sorted_expr(nodes)] == [id(n) for n in expected]
@@ -0,0 +1,84 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of flattening expressions to lists of unique nodes.
+"""
+
+import pytest
+
+from ufl import *
+from ufl.classes import Variable, Label, Sum
+from ufl.algorithms import expand_derivatives
+from ufl.algorithms.ssa import SSAList, compute_ssa_list, wrap_shared_subexpressions
+from ufl.corealg.traversal import unique_pre_traversal, pre_traversal
+
+
+def test_ssa_list_of_expression():
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    g = f*f
+    e = g + sin(g)
+    ssa = compute_ssa_list(e)
+    assert len(ssa) == len(set(unique_pre_traversal(e)))
+    assert ssa.nodes == [f, g, sin(g), e]
+    assert [tuple(ssa.operands(i)) for i in range(len(ssa))] == [(), (0, 0), (1,), (1, 2)]
+    assert ssa.reference_counts == [2, 2, 1, 1]
+    assert list(ssa.roots) == [3]
+    assert ssa.shared_nodes() == [1]
+    assert ssa.tree_sizes() == [1, 3, 4, 8]
+    assert ssa.redundancy() == 2.0
+
+
+def test_ssa_list_is_topologically_ordered():
+    V = VectorElement("CG", triangle, 1)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    F = grad(u) + Identity(2)
+    psi = tr(F.T*F)**2 + det(F)
+    a = expand_derivatives(derivative(psi*dx, u, v) + inner(u, v)*ds)
+    ssa = SSAList(a)
+    for i in range(len(ssa)):
+        ops = ssa.operands(i)
+        assert all(j < i for j in ops)
+        assert ssa.nodes[i].ufl_operands == tuple(ssa.nodes[j] for j in ops)
+    assert len(set(ssa.nodes)) == len(ssa)
+    assert [ssa.nodes[i] for i in ssa.roots] == [itg.integrand() for itg in a.integrals()]
+    assert sum(ssa.reference_counts) == ssa.num_edges() + len(ssa.roots)
+
+
+def test_ssa_list_shares_subexpressions_across_integrals():
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    g = exp(f)*f
+    a = g*dx + (g + 1)*ds
+    ssa = SSAList(a)
+    assert ssa.nodes.count(g) == 1
+    assert ssa.reference_counts[ssa.nodes.index(g)] == 2
+    assert ssa.shared_nodes() == [ssa.nodes.index(g)]
+
+
+def test_wrap_shared_subexpressions():
+    f = Coefficient(FiniteElement("CG", triangle, 1))
+    x = SpatialCoordinate(triangle)
+    g = exp(f)*x[0]
+    h = g*g + sin(g)
+    a = h*dx + (g + 1)*ds
+
+    b = wrap_shared_subexpressions(a)
+    variables = set(v for itg in b.integrals() for v in pre_traversal(itg.integrand())
+                    if isinstance(v, Variable))
+    # g appears in both integrals with the same label
+    assert len(variables) == 1
+    var, = variables
+    assert var.ufl_operands[0] == g
+    assert b.integrals()[1].integrand() == var + 1
+
+    # Values are not changed
+    e = wrap_shared_subexpressions(h)
+    assert isinstance(e, Sum)
+    assert e((0.5, 0.7), {f: 0.3}) == h((0.5, 0.7), {f: 0.3})
+
+    # Expressions with free indices are not wrapped
+    i = Index()
+    y = x[i]*x[0]
+    e = wrap_shared_subexpressions(as_tensor(y + y*x[1], (i,))[1])
+    assert not any(isinstance(v, Variable) for v in pre_traversal(e))
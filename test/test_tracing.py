@@ -0,0 +1,85 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+"""
+Test of tracing of form preprocessing stages.
+"""
+
+import json
+import os
+
+from ufl import *
+from ufl.algorithms import compute_form_data, load_ufl_file
+from ufl.algorithms.compute_form_data import clear_form_data_cache, set_form_data_cache_size
+from ufl.tracing import trace_events, trace_to_file, trace_span, tracing_active
+
+
+def _form():
+    element = FiniteElement("CG", triangle, 1)
+    u = Coefficient(element)
+    v = TestFunction(element)
+    return derivative(u**2*v*dx + grad(u)[0]*v*ds, u)
+
+
+def test_trace_span_is_noop_when_inactive():
+    assert not tracing_active()
+    with trace_span("nothing"):
+        pass
+    events = []
+    with trace_events(events.append):
+        assert tracing_active()
+        with trace_span("outer", "test", {"k": 1}):
+            with trace_span("inner"):
+                pass
+    assert not tracing_active()
+    assert [e["name"] for e in events] == ["inner", "outer"]
+    inner, outer = events
+    assert outer["ph"] == "X"
+    assert outer["cat"] == "test"
+    assert outer["args"] == {"k": 1}
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+def test_trace_compute_form_data():
+    # The signature is only computed for the cache lookup
+    clear_form_data_cache()
+    set_form_data_cache_size(1)
+    a = _form()
+    events = []
+    try:
+        with trace_events(events.append):
+            compute_form_data(a, do_apply_function_pullbacks=True,
+                              do_apply_geometry_lowering=True)
+    finally:
+        set_form_data_cache_size(0)
+    names = [e["name"] for e in events]
+    assert names[-1] == "compute_form_data"
+    for name in ("apply_algebra_lowering", "apply_derivatives", "group_form_integrals",
+                 "apply_function_pullbacks", "check_form_arity", "Form.signature",
+                 "GateauxDerivativeRuleset", "GradRuleset"):
+        assert name in names
+    categories = dict((e["name"], e["cat"]) for e in events)
+    assert categories["group_form_integrals"] == "compute_form_data"
+    assert categories["GradRuleset"] == "apply_derivatives"
+
+
+def test_trace_to_file(tmpdir):
+    filename = str(tmpdir.join("trace.json"))
+    uflfilename = str(tmpdir.join("Poisson.ufl"))
+    with open(uflfilename, "w") as f:
+        f.write("element = FiniteElement('CG', triangle, 1)\n"
+                "v = TestFunction(element)\n"
+                "u = TrialFunction(element)\n"
+                "a = inner(grad(u), grad(v))*dx\n")
+    with trace_to_file(filename):
+        ufd = load_ufl_file(uflfilename)
+    assert os.path.exists(filename)
+    with open(filename) as f:
+        data = json.load(f)
+    events = data["traceEvents"]
+    names = [e["name"] for e in events]
+    assert names[-1] == "load_ufl_file"
+    assert events[-1]["args"]["filename"] == uflfilename
+    assert "execute_ufl_code" in names
+    assert len(ufd.forms) == 1
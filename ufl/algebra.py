@@ -28,7 +28,7 @@ from ufl.core.operator import Operator
 from ufl.constantvalue import Zero, zero, ScalarValue, IntValue, as_ufl
 from ufl.checks import is_ufl_scalar, is_true_ufl_scalar
 from ufl.index_combination_utils import merge_unique_indices
-from ufl.sorting import sorted_expr
+from ufl.sorting import cmp_expr, sorted_expr
 from ufl.precedence import parstr
 
 # --- Algebraic operators ---
@@ -82,7 +82,8 @@ class Sum(Operator):
         else:
             # Otherwise sort operands in a canonical order
             # operands = (b, a)
-            a, b = sorted_expr((a, b))
+            if cmp_expr(a, b) > 0:
+                a, b = b, a
 
         # construct and initialize a new Sum object
         self = Operator.__new__(cls)
@@ -170,7 +171,8 @@ class Product(Operator):
         else:  # a * b = b * a
             # Sort operands in a semi-canonical order
             # (NB! This is fragile! Small changes here can have large effects.)
-            a, b = sorted_expr((a, b))
+            if cmp_expr(a, b) > 0:
+                a, b = b, a
 
         # Construction
         self = Operator.__new__(cls)
@@ -345,3 +347,58 @@ class Abs(Operator):
     def __str__(self):
         a, = self.ufl_operands
         return "|%s|" % (parstr(a, self),)
+
+
+# --- Flattened views and bulk construction of sums and products ---
+
+def _flattened_operands(expr, cls):
+    "Return the operands of the tree of nested cls objects rooted at expr."
+    operands = []
+    stack = [expr]
+    while stack:
+        e = stack.pop()
+        if isinstance(e, cls):
+            stack.extend(reversed(e.ufl_operands))
+        else:
+            operands.append(e)
+    return operands
+
+
+def _balanced(cls, operands):
+    "Sort operands once and combine them pairwise into a balanced tree."
+    operands = sorted_expr(as_ufl(o) for o in operands)
+    if not operands:
+        error("Expecting at least one operand.")
+    while len(operands) > 1:
+        combined = [cls(operands[k], operands[k + 1])
+                    for k in range(0, len(operands) - 1, 2)]
+        if len(operands) % 2:
+            combined.append(operands[-1])
+        operands = combined
+    return operands[0]
+
+
+def sum_terms(expr):
+    """Return the list of terms of expr, which are the operands of the
+    tree of nested Sum objects rooted at expr, from left to right."""
+    return _flattened_operands(expr, Sum)
+
+
+def product_factors(expr):
+    """Return the list of factors of expr, which are the operands of
+    the tree of nested Product objects rooted at expr, from left to
+    right."""
+    return _flattened_operands(expr, Product)
+
+
+def canonical_sum(terms):
+    """Return the sum of terms, sorted canonically once and added as a
+    balanced tree of Sum objects with logarithmic depth."""
+    return _balanced(Sum, terms)
+
+
+def canonical_product(factors):
+    """Return the product of scalar factors, sorted canonically once
+    and multiplied as a balanced tree of Product objects with
+    logarithmic depth. Factors must not share free indices."""
+    return _balanced(Product, factors)
@@ -33,6 +33,7 @@ __all__ = as_native_strings([
     "estimate_total_polynomial_degree",
     "sort_elements",
     "compute_form_data",
+    "compute_form_data_batch",
     "purge_list_tensors",
     "apply_transformer",
     "ReuseTransformer",
@@ -64,6 +65,7 @@ __all__ = as_native_strings([
     "compute_form_functional",
     "compute_form_signature",
     "tree_format",
+    "lambdify",
 ])
 
 # Utilities for traversing over expression trees in different ways
@@ -92,7 +94,7 @@ from ufl.algorithms.analysis import (
 
 # Preprocessing a form to extract various meta data
 # from ufl.algorithms.formdata import FormData
-from ufl.algorithms.compute_form_data import compute_form_data
+from ufl.algorithms.compute_form_data import compute_form_data, compute_form_data_batch
 
 # Utilities for checking properties of forms
 from ufl.algorithms.signature import compute_form_signature
@@ -128,6 +130,8 @@ from ufl.algorithms.formsplitter import FormSplitter
 # Utilities for Automatic Functional Differentiation
 from ufl.algorithms.ad import expand_derivatives
 
+from ufl.algorithms.lambdify import lambdify
+
 # Utilities for form file handling
 from ufl.algorithms.formfiles import read_ufl_file
 from ufl.algorithms.formfiles import load_ufl_file
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Profiling of the allocation of expression objects.
+
+``live_objects`` counts the expression objects alive at the time of
+the call, found through the garbage collector, and their approximate
+size in bytes. Within a ``profile_allocations`` context, the objects
+created in each section, such as each pass of ``compute_form_data``,
+are counted by type along with how many of them are still alive when
+the section ends. Nothing is installed outside of the context, so
+normal runs are not affected.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import gc
+import json
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+from weakref import ref
+
+from ufl.log import error
+from ufl.core.expr import Expr
+
+
+# The profiler of the active profile_allocations context
+_active_profiler = None
+
+
+def _object_size(o):
+    "Return the approximate size in bytes of o and the containers it owns."
+    size = sys.getsizeof(o)
+    if not o._ufl_is_terminal_:
+        size += sys.getsizeof(o.ufl_operands)
+    d = getattr(o, "__dict__", None)
+    if d is not None:
+        size += sys.getsizeof(d)
+    return size
+
+
+def live_objects():
+    """Return a dict mapping the names of expression types to the
+    number of live objects of the type and their approximate total
+    size in bytes, as tuples (count, bytes)."""
+    counts = defaultdict(int)
+    sizes = defaultdict(int)
+    for o in gc.get_objects():
+        if isinstance(o, Expr):
+            name = o._ufl_class_.__name__
+            counts[name] += 1
+            sizes[name] += _object_size(o)
+    return dict((name, (counts[name], sizes[name])) for name in counts)
+
+
+class AllocationSection(object):
+    """Counts of the expression objects created in a section of code.
+
+    *Attributes*
+        ``name``
+            Name of the section.
+        ``created``
+            Dict mapping type names to the number of objects created.
+        ``survived``
+            Dict mapping type names to the number of created objects
+            still alive at the end of the section, filled in when the
+            section ends.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.created = defaultdict(int)
+        self.survived = {}
+        self._objects = {}
+
+    def _add(self, o):
+        k = id(o)
+        r = self._objects.get(k)
+        if r is not None and r() is o:
+            # Reinitialized object, e.g. a cached constant
+            return
+        self._objects[k] = ref(o)
+        self.created[o._ufl_class_.__name__] += 1
+
+    def _close(self):
+        survived = defaultdict(int)
+        for r in self._objects.values():
+            o = r()
+            if o is not None:
+                survived[o._ufl_class_.__name__] += 1
+        self.survived = dict(survived)
+        self.created = dict(self.created)
+        self._objects = {}
+
+    def total_created(self):
+        "Return the total number of objects created."
+        return sum(self.created.values())
+
+    def total_survived(self):
+        "Return the total number of created objects alive at the end."
+        return sum(self.survived.values())
+
+    def as_dict(self):
+        "Return the counts as a dict."
+        return {"name": self.name,
+                "created": dict(self.created),
+                "survived": dict(self.survived),
+                "total_created": self.total_created(),
+                "total_survived": self.total_survived()}
+
+
+class AllocationProfiler(object):
+    """The AllocationSection objects of a profile_allocations context,
+    in the order they were entered. The first section covers the
+    whole context."""
+
+    def __init__(self):
+        self.sections = []
+        self._open_sections = []
+
+    @contextmanager
+    def section(self, name):
+        "Count the objects created in this context in a new section."
+        section = AllocationSection(name)
+        self.sections.append(section)
+        self._open_sections.append(section)
+        try:
+            yield section
+        finally:
+            self._open_sections.remove(section)
+            gc.collect()
+            section._close()
+
+    def _add(self, o):
+        for section in self._open_sections:
+            section._add(o)
+
+    def as_dicts(self):
+        "Return a list with each section as a dict."
+        return [s.as_dict() for s in self.sections]
+
+    def to_json(self, **kwargs):
+        "Return the sections as a JSON list, passing kwargs to json.dumps."
+        return json.dumps(self.as_dicts(), **kwargs)
+
+    def __str__(self):
+        lines = ["%-32s %10s %10s" % ("Section", "Created", "Survived")]
+        for s in self.sections:
+            lines.append("%-32s %10d %10d" % (s.name, s.total_created(), s.total_survived()))
+        return "\n".join(lines)
+
+
+def _profiling__init__(self):
+    "Expr constructor installed by profile_allocations."
+    Expr._ufl_regular__init__(self)
+    _active_profiler._add(self)
+
+
+@contextmanager
+def profile_allocations(name="total"):
+    """Count the expression objects created within this context.
+
+    Yields an AllocationProfiler, with a section with the given name
+    for the whole context. Further sections are added with its
+    ``section`` method, and by the passes of compute_form_data.
+    Contexts cannot be nested.
+    """
+    global _active_profiler
+    if _active_profiler is not None:
+        error("Allocation profiling is already active.")
+    profiler = AllocationProfiler()
+    _active_profiler = profiler
+    Expr.__init__ = _profiling__init__
+    try:
+        with profiler.section(name):
+            yield profiler
+    finally:
+        Expr.__init__ = Expr._ufl_regular__init__
+        _active_profiler = None
+
+
+def active_allocation_profiler():
+    "Return the AllocationProfiler of the active profile_allocations context, or None."
+    return _active_profiler
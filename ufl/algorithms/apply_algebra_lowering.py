@@ -39,6 +39,9 @@ class LowerCompoundAlgebra(MultiFunction):
     def __init__(self):
         MultiFunction.__init__(self)
 
+    def dag_cache_key(self):
+        return ()
+
     expr = MultiFunction.reuse_if_untouched
 
     # ------------ Compound tensor operators
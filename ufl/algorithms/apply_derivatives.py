@@ -49,6 +49,7 @@ from ufl.corealg.map_dag import map_expr_dag
 from ufl.algorithms.map_integrands import map_integrand_dags
 
 from ufl.checks import is_cellwise_constant
+from ufl.tracing import trace_span
 
 # TODO: Add more rulesets?
 # - DivRuleset
@@ -1014,6 +1015,9 @@ class DerivativeRuleDispatcher(MultiFunction):
     def __init__(self):
         MultiFunction.__init__(self)
 
+    def dag_cache_key(self):
+        return ()
+
     def terminal(self, o):
         return o
 
@@ -1024,20 +1028,24 @@ class DerivativeRuleDispatcher(MultiFunction):
 
     def grad(self, o, f):
         rules = GradRuleset(o.ufl_shape[-1])
-        return map_expr_dag(rules, f)
+        with trace_span(type(rules).__name__, "apply_derivatives"):
+            return map_expr_dag(rules, f)
 
     def reference_grad(self, o, f):
         rules = ReferenceGradRuleset(o.ufl_shape[-1])  # FIXME: Look over this and test better.
-        return map_expr_dag(rules, f)
+        with trace_span(type(rules).__name__, "apply_derivatives"):
+            return map_expr_dag(rules, f)
 
     def variable_derivative(self, o, f, dummy_v):
         rules = VariableRuleset(o.ufl_operands[1])
-        return map_expr_dag(rules, f)
+        with trace_span(type(rules).__name__, "apply_derivatives"):
+            return map_expr_dag(rules, f)
 
     def coefficient_derivative(self, o, f, dummy_w, dummy_v, dummy_cd):
         dummy, w, v, cd = o.ufl_operands
         rules = GateauxDerivativeRuleset(w, v, cd)
-        return map_expr_dag(rules, f)
+        with trace_span(type(rules).__name__, "apply_derivatives"):
+            return map_expr_dag(rules, f)
 
     def indexed(self, o, Ap, ii):  # TODO: (Partially) duplicated in generic rules
         # Reuse if untouched
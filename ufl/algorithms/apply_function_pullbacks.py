@@ -241,6 +241,9 @@ class FunctionPullbackApplier(MultiFunction):
     def __init__(self):
         MultiFunction.__init__(self)
 
+    def dag_cache_key(self):
+        return ()
+
     expr = MultiFunction.reuse_if_untouched
 
     def terminal(self, t):
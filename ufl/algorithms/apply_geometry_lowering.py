@@ -61,6 +61,9 @@ class GeometryLoweringApplier(MultiFunction):
         for cls in preserve_types:
             self._preserve_types[cls._ufl_typecode_] = True
 
+    def dag_cache_key(self):
+        return tuple(self._preserve_types)
+
     expr = MultiFunction.reuse_if_untouched
 
     def terminal(self, t):
@@ -36,6 +36,9 @@ class RestrictionPropagator(MultiFunction):
             self._rp = {"+": RestrictionPropagator("+"),
                         "-": RestrictionPropagator("-")}
 
+    def dag_cache_key(self):
+        return (self.current_restriction,)
+
     def restricted(self, o):
         "When hitting a restricted quantity, visit child with a separate restriction algorithm."
         # Assure that we have only two levels here, inside or outside
@@ -188,6 +191,9 @@ class DefaultRestrictionApplier(MultiFunction):
             self._rp = {"+": DefaultRestrictionApplier("+"),
                         "-": DefaultRestrictionApplier("-")}
 
+    def dag_cache_key(self):
+        return (self.current_restriction,)
+
     def terminal(self, o):
         # Most terminals are unchanged
         return o
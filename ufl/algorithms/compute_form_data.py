@@ -20,16 +20,20 @@ raw input form given by a user."""
 # You should have received a copy of the GNU Lesser General Public License
 # along with UFL. If not, see <http://www.gnu.org/licenses/>.
 
+from collections import OrderedDict
+from copy import copy
 from itertools import chain
 
 from ufl.log import error, info
 from ufl.utils.sequences import max_degree
 
-from ufl.classes import GeometricFacetQuantity, Coefficient, Form
+from ufl.classes import GeometricFacetQuantity, GeometricQuantity, Argument, Coefficient, Form, Integral
 from ufl.corealg.traversal import traverse_unique_terminals
+from ufl.corealg.map_dag import shared_dag_caches
 from ufl.algorithms.analysis import extract_coefficients, extract_sub_elements, unique_tuple
 from ufl.algorithms.formdata import FormData
 from ufl.algorithms.formtransformations import compute_form_arities
+from ufl.algorithms.replace import replace
 from ufl.algorithms.check_arities import check_form_arity
 
 # These are the main symbolic processing steps:
@@ -39,12 +43,61 @@ from ufl.algorithms.apply_derivatives import apply_derivatives
 from ufl.algorithms.apply_integral_scaling import apply_integral_scaling
 from ufl.algorithms.apply_geometry_lowering import apply_geometry_lowering
 from ufl.algorithms.apply_restrictions import apply_restrictions, apply_default_restrictions
+from ufl.algorithms.simplify import simplify
 from ufl.algorithms.estimate_degrees import estimate_total_polynomial_degree
 
 # See TODOs at the call sites of these below:
 from ufl.algorithms.domain_analysis import build_integral_data
 from ufl.algorithms.domain_analysis import reconstruct_form_from_integral_data
 from ufl.algorithms.domain_analysis import group_form_integrals
+from ufl.algorithms.parallel import map_integrals_in_processes
+from ufl.algorithms.pass_profiling import active_pass_profiler, run_pass
+from ufl.tracing import trace_span
+
+
+# Cache of computed FormData, keyed by form signature, the options of
+# compute_form_data and the subdomain data of the form and ordered
+# from least to most recently used. Disabled by default, since the
+# entries keep the original forms and their coefficients alive.
+_form_data_cache = OrderedDict()
+_form_data_cache_size = 0
+
+# Optional persistent cache of FormData, see set_form_data_cache_dir
+_form_data_disk_cache = None
+
+
+def set_form_data_cache_size(size):
+    """Set the maximal number of FormData objects kept by
+    compute_form_data. Least recently used entries are evicted first,
+    size 0 disables the cache, which is the default.
+
+    The cached FormData objects refer to the forms they were computed
+    for, which are kept alive with their coefficients and subdomain
+    data until evicted."""
+    global _form_data_cache_size
+    if size < 0:
+        error("Expecting nonnegative cache size.")
+    _form_data_cache_size = size
+    while len(_form_data_cache) > size:
+        _form_data_cache.popitem(last=False)
+
+
+def clear_form_data_cache():
+    "Remove all entries from the compute_form_data cache."
+    _form_data_cache.clear()
+
+
+def set_form_data_cache_dir(directory, max_size=None):
+    """Store the FormData computed by compute_form_data in directory
+    and reuse it in later processes. Files are removed in least
+    recently used order when their total size exceeds max_size bytes.
+    Pass None to disable the persistent cache."""
+    global _form_data_disk_cache
+    if directory is None:
+        _form_data_disk_cache = None
+    else:
+        from ufl.algorithms.formdatacache import FormDataCache
+        _form_data_disk_cache = FormDataCache(directory, max_size)
 
 
 def _auto_select_degree(elements):
@@ -215,6 +268,175 @@ def attach_estimated_degrees(form):
     return Form(new_integrals)
 
 
+def _subdomain_data_key(form):
+    """Return the identities of the subdomain data of form, in the
+    order of its domains."""
+    subdomain_data = form.subdomain_data()
+    return tuple(tuple(sorted((integral_type, id(sd))
+                              for integral_type, sd in subdomain_data.get(domain, {}).items()))
+                 for domain in form.ufl_domains())
+
+
+def _rebind_terminals(terminals, original_form, form):
+    """Return a mapping from the terminals of original_form among
+    terminals to the corresponding terminals of form."""
+    argument_map = dict(zip(original_form.arguments(), form.arguments()))
+    coefficient_map = dict(zip(original_form.coefficients(), form.coefficients()))
+    domain_map = dict(zip(original_form.ufl_domains(), form.ufl_domains()))
+    mapping = {}
+    for t in terminals:
+        if isinstance(t, Argument):
+            s = argument_map.get(t, t)
+        elif isinstance(t, Coefficient):
+            s = coefficient_map.get(t, t)
+        elif isinstance(t, GeometricQuantity) and t.ufl_domain() in domain_map:
+            s = t._ufl_class_(domain_map[t.ufl_domain()])
+        else:
+            s = t
+        if s != t:
+            mapping[t] = s
+    return mapping
+
+
+def _rebind_integral(itg, domain, terminal_map, subdomain_data):
+    """Return itg with the terminals in terminal_map replaced, on the
+    given domain and with its subdomain data taken from the
+    subdomain_data of a form."""
+    integrand = itg.integrand()
+    if terminal_map:
+        integrand = replace(integrand, terminal_map)
+    sd = itg.subdomain_data()
+    if sd is not None:
+        sd = subdomain_data.get(domain, {}).get(itg.integral_type())
+    if integrand is itg.integrand() and domain is itg.ufl_domain() and sd is itg.subdomain_data():
+        return itg
+    return Integral(integrand, itg.integral_type(), domain, itg.subdomain_id(),
+                    itg.metadata(), sd)
+
+
+def _form_data_view(form_data, form):
+    """Return a copy of form_data for a form with the same signature as
+    form_data.original_form.
+
+    The copy shares the processed integrands with form_data if form is
+    form_data.original_form, otherwise the integrands, domains and
+    subdomain data of the integrals and all attributes referring to
+    coefficients and domains of the original form refer to those of
+    the given form. The function_replace_map maps the coefficients of
+    both forms to the same renumbered coefficients.
+    """
+    original_form = form_data.original_form
+    if form is original_form:
+        coefficient_map = {}
+        domain_map = {}
+        terminal_map = {}
+    else:
+        coefficient_map = dict(zip(original_form.coefficients(), form.coefficients()))
+        domain_map = dict((d, new_d) for d, new_d in zip(original_form.ufl_domains(),
+                                                         form.ufl_domains())
+                          if d is not new_d)
+        terminals = set(t for itg_data in form_data.integral_data
+                        for itg in itg_data.integrals
+                        for t in traverse_unique_terminals(itg.integrand()))
+        terminal_map = _rebind_terminals(terminals, original_form, form)
+    subdomain_data = form.subdomain_data()
+
+    view = FormData()
+    view.__dict__.update(form_data.__dict__)
+    view.original_form = form
+    view.reduced_coefficients = [coefficient_map.get(c, c)
+                                 for c in form_data.reduced_coefficients]
+    view.function_replace_map = dict(form_data.function_replace_map)
+    for c, new_c in form_data.function_replace_map.items():
+        view.function_replace_map[coefficient_map.get(c, c)] = new_c
+
+    # Form compilers attach data to the integral data, so these are
+    # copied as well
+    view.integral_data = []
+    rebound = False
+    for itg_data in form_data.integral_data:
+        integrals = itg_data.integrals
+        itg_data = copy(itg_data)
+        itg_data.domain = domain_map.get(itg_data.domain, itg_data.domain)
+        itg_data.integrals = [_rebind_integral(itg, itg_data.domain, terminal_map, subdomain_data)
+                              for itg in integrals]
+        rebound = rebound or any(a is not b for a, b in zip(integrals, itg_data.integrals))
+        itg_data.metadata = dict(itg_data.metadata)
+        itg_data.integral_coefficients = set(coefficient_map.get(c, c)
+                                             for c in itg_data.integral_coefficients)
+        itg_data.enabled_coefficients = list(itg_data.enabled_coefficients)
+        view.integral_data.append(itg_data)
+    if rebound:
+        view.preprocessed_form = reconstruct_form_from_integral_data(view.integral_data)
+    return view
+
+
+def _apply_integral_transformations(form,
+                                    do_apply_function_pullbacks,
+                                    do_apply_integral_scaling,
+                                    do_apply_geometry_lowering,
+                                    preserve_geometry_types,
+                                    do_apply_default_restrictions,
+                                    do_apply_restrictions,
+                                    do_simplify=False,
+                                    profile=None):
+    """Apply the transformations of compute_form_data which act on each
+    integral separately, recording them in profile if not None."""
+    if do_apply_function_pullbacks:
+        # Rewrite coefficients and arguments in terms of their
+        # reference cell values with Piola transforms and symmetry
+        # transforms injected where needed.
+        # Decision: Not supporting grad(dolfin.Expression) without a
+        #           Domain.  Current dolfin works if Expression has a
+        #           cell but this should be changed to a mesh.
+        form = run_pass(profile, "apply_function_pullbacks", apply_function_pullbacks, form)
+
+    # Scale integrals to reference cell frames
+    if do_apply_integral_scaling:
+        form = run_pass(profile, "apply_integral_scaling", apply_integral_scaling, form)
+
+    # Apply default restriction to fully continuous terminals
+    if do_apply_default_restrictions:
+        form = run_pass(profile, "apply_default_restrictions", apply_default_restrictions, form)
+
+    # Lower abstractions for geometric quantities into a smaller set
+    # of quantities, allowing the form compiler to deal with a smaller
+    # set of types and treating geometric quantities like any other
+    # expressions w.r.t. loop-invariant code motion etc.
+    if do_apply_geometry_lowering:
+        form = run_pass(profile, "apply_geometry_lowering", apply_geometry_lowering,
+                        form, preserve_geometry_types)
+
+    # Apply differentiation again, because the algorithms above can
+    # generate new derivatives or rewrite expressions inside
+    # derivatives
+    if do_apply_function_pullbacks or do_apply_geometry_lowering:
+        form = run_pass(profile, "apply_derivatives", apply_derivatives, form)
+
+        # Neverending story: apply_derivatives introduces new Jinvs,
+        # which needs more geometry lowering
+        if do_apply_geometry_lowering:
+            form = run_pass(profile, "apply_geometry_lowering", apply_geometry_lowering,
+                            form, preserve_geometry_types)
+            # Lower derivatives that may have appeared
+            form = run_pass(profile, "apply_derivatives", apply_derivatives, form)
+
+    # Propagate restrictions to terminals
+    if do_apply_restrictions:
+        form = run_pass(profile, "apply_restrictions", apply_restrictions, form)
+
+    # Fold constants and remove operations without effect
+    if do_simplify:
+        form = run_pass(profile, "simplify", simplify, form)
+
+    return form
+
+
+def _transform_integrals(integrals, *options):
+    "Apply the transformations of _apply_integral_transformations to a list of integrals."
+    return list(_apply_integral_transformations(Form(integrals), *options).integrals())
+
+
 def compute_form_data(form,
                       # Default arguments configured to behave the way old FFC expects it:
                       do_apply_function_pullbacks=False,
@@ -224,11 +446,93 @@ def compute_form_data(form,
                       do_apply_default_restrictions=True,
                       do_apply_restrictions=True,
                       do_estimate_degrees=True,
+                      do_simplify=False,
+                      parallel=None,
                       ):
+    """Preprocess a form and return a FormData object.
+
+    If enabled by set_form_data_cache_size or set_form_data_cache_dir,
+    results are cached by form signature and options, so calling this
+    again for an equivalent form only copies the cached FormData.
+
+    If parallel is an integer larger than 1, the transformations of
+    the integrals after grouping are applied in a pool of that many
+    processes. The result is the same as for serial processing.
+
+    If do_simplify is true, constants are folded in the integrands
+    after the other transformations, see ufl.algorithms.simplify.
+
+    Within a ufl.algorithms.pass_profiling.profile_passes context,
+    the passes are measured and the records attached to the FormData
+    as pass_profile, otherwise pass_profile is None. Within a
+    ufl.tracing.trace_events context, the call and its passes are
+    traced as spans.
+    """
+    with trace_span("compute_form_data"):
+        options = (do_apply_function_pullbacks,
+                   do_apply_integral_scaling,
+                   do_apply_geometry_lowering,
+                   tuple(preserve_geometry_types),
+                   do_apply_default_restrictions,
+                   do_apply_restrictions,
+                   do_estimate_degrees,
+                   do_simplify)
+
+        if not (_form_data_cache_size or _form_data_disk_cache) or active_pass_profiler():
+            return _compute_form_data(form, *options, parallel=parallel)
+
+        key = (form.signature(),) + options
+        # The subdomain data are not part of the signature
+        memory_key = key + (_subdomain_data_key(form),)
+        form_data = _form_data_cache.get(memory_key)
+        if form_data is None:
+            if _form_data_disk_cache is not None:
+                form_data = _form_data_disk_cache.get(key, form)
+            if form_data is None:
+                form_data = _compute_form_data(form, *options, parallel=parallel)
+                if _form_data_disk_cache is not None:
+                    _form_data_disk_cache.put(key, form_data)
+            if not _form_data_cache_size:
+                return form_data
+            _form_data_cache[memory_key] = form_data
+            if len(_form_data_cache) > _form_data_cache_size:
+                _form_data_cache.popitem(last=False)
+        else:
+            _form_data_cache.move_to_end(memory_key)
+        return _form_data_view(form_data, form)
+
+
+def compute_form_data_batch(forms, **kwargs):
+    """Preprocess several forms and return a list of FormData objects.
+
+    The keyword arguments are passed on to compute_form_data. Each
+    transformation is applied once to each subexpression shared
+    between the forms, and the transformed subexpressions are shared
+    between the results.
+    """
+    with shared_dag_caches():
+        return [compute_form_data(form, **kwargs) for form in forms]
+
+
+def _compute_form_data(form,
+                       do_apply_function_pullbacks,
+                       do_apply_integral_scaling,
+                       do_apply_geometry_lowering,
+                       preserve_geometry_types,
+                       do_apply_default_restrictions,
+                       do_apply_restrictions,
+                       do_estimate_degrees,
+                       do_simplify,
+                       parallel=None):
 
     # TODO: Move this to the constructor instead
     self = FormData()
 
+    # Record the passes if profiling
+    profiler = active_pass_profiler()
+    profile = profiler.new_profile() if profiler is not None else None
+    self.pass_profile = profile
+
     # --- Store untouched form for reference.
     # The user of FormData may get original arguments,
     # original coefficients, and form signature from this object.
@@ -245,66 +549,54 @@ def compute_form_data(form,
     # Lower abstractions for tensor-algebra types into index notation,
     # reducing the number of operators later algorithms and form
     # compilers need to handle
-    form = apply_algebra_lowering(form)
+    form = run_pass(profile, "apply_algebra_lowering", apply_algebra_lowering, form)
 
     # Apply differentiation before function pullbacks, because for
     # example coefficient derivatives are more complicated to derive
     # after coefficients are rewritten, and in particular for
     # user-defined coefficient relations it just gets too messy
-    form = apply_derivatives(form)
+    form = run_pass(profile, "apply_derivatives", apply_derivatives, form)
 
     # --- Group form integrals
     # TODO: Refactor this, it's rather opaque what this does
     # TODO: Is self.original_form.ufl_domains() right here?
     #       It will matter when we start including 'num_domains' in ufc form.
-    form = group_form_integrals(form, self.original_form.ufl_domains())
+    form = run_pass(profile, "group_form_integrals", group_form_integrals,
+                    form, self.original_form.ufl_domains())
 
     # Estimate polynomial degree of integrands now, before applying
     # any pullbacks and geometric lowering.  Otherwise quad degrees
     # blow up horrifically.
     if do_estimate_degrees:
-        form = attach_estimated_degrees(form)
-
-    if do_apply_function_pullbacks:
-        # Rewrite coefficients and arguments in terms of their
-        # reference cell values with Piola transforms and symmetry
-        # transforms injected where needed.
-        # Decision: Not supporting grad(dolfin.Expression) without a
-        #           Domain.  Current dolfin works if Expression has a
-        #           cell but this should be changed to a mesh.
-        form = apply_function_pullbacks(form)
-
-    # Scale integrals to reference cell frames
-    if do_apply_integral_scaling:
-        form = apply_integral_scaling(form)
-
-    # Apply default restriction to fully continuous terminals
-    if do_apply_default_restrictions:
-        form = apply_default_restrictions(form)
-
-    # Lower abstractions for geometric quantities into a smaller set
-    # of quantities, allowing the form compiler to deal with a smaller
-    # set of types and treating geometric quantities like any other
-    # expressions w.r.t. loop-invariant code motion etc.
-    if do_apply_geometry_lowering:
-        form = apply_geometry_lowering(form, preserve_geometry_types)
-
-    # Apply differentiation again, because the algorithms above can
-    # generate new derivatives or rewrite expressions inside
-    # derivatives
-    if do_apply_function_pullbacks or do_apply_geometry_lowering:
-        form = apply_derivatives(form)
-
-        # Neverending story: apply_derivatives introduces new Jinvs,
-        # which needs more geometry lowering
-        if do_apply_geometry_lowering:
-            form = apply_geometry_lowering(form, preserve_geometry_types)
-            # Lower derivatives that may have appeared
-            form = apply_derivatives(form)
-
-    # Propagate restrictions to terminals
-    if do_apply_restrictions:
-        form = apply_restrictions(form)
+        form = run_pass(profile, "attach_estimated_degrees", attach_estimated_degrees, form)
+
+    # The remaining transformations are applied to each integral
+    # separately
+    options = (do_apply_function_pullbacks,
+               do_apply_integral_scaling,
+               do_apply_geometry_lowering,
+               preserve_geometry_types,
+               do_apply_default_restrictions,
+               do_apply_restrictions,
+               do_simplify)
+    if profile is not None:
+        # Transform and record each integral separately
+        integrals = []
+        for itg in form.integrals():
+            profile.integral_type = itg.integral_type()
+            profile.subdomain_id = itg.subdomain_id()
+            integrals.extend(_apply_integral_transformations(Form([itg]), *options,
+                                                             profile=profile).integrals())
+        profile.integral_type = None
+        profile.subdomain_id = None
+        form = Form(integrals)
+    elif parallel and parallel > 1 and len(form.integrals()) > 1:
+        integrals = map_integrals_in_processes(_transform_integrals,
+                                               form.integrals(),
+                                               options, parallel)
+        form = Form(integrals)
+    else:
+        form = _apply_integral_transformations(form, *options)
 
     # --- Group integrals into IntegralData objects
     # Most of the heavy lifting is done above in group_form_integrals.
@@ -385,7 +677,8 @@ def compute_form_data(form,
     # TODO: This is a very expensive check... Replace with something
     # faster!
     preprocessed_form = reconstruct_form_from_integral_data(self.integral_data)
-    check_form_arity(preprocessed_form, self.original_form.arguments())  # Currently testing how fast this is
+    run_pass(profile, "check_form_arity", check_form_arity,
+             preprocessed_form, self.original_form.arguments())
 
     # TODO: This member is used by unit tests, change the tests to
     # remove this!
@@ -25,7 +25,8 @@ from ufl.log import error
 from ufl.utils.str import as_native_strings
 from ufl.integral import Integral
 from ufl.form import Form
-from ufl.sorting import cmp_expr, sorted_expr
+from ufl.sorting import cmp_expr
+from ufl.algebra import canonical_sum
 from ufl.utils.sorting import canonicalize_metadata, sorted_by_key
 import numbers
 
@@ -236,8 +237,7 @@ def accumulate_integrands_with_same_metadata(integrals):
     for cdid in by_cdid:
         integrals, cd = by_cdid[cdid]
         # Ensure canonical sorting of more than two integrands
-        integrands = sorted_expr((itg.integrand() for itg in integrals))
-        integrands_sum = sum(integrands[1:], integrands[0])
+        integrands_sum = canonical_sum(itg.integrand() for itg in integrals)
         by_cdid[cdid] = (integrands_sum, cd)
 
     # Sort integrands canonically by integrand first then compiler
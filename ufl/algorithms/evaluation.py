@@ -0,0 +1,738 @@
+# -*- coding: utf-8 -*-
+"""Vectorized evaluation of expressions in many points at once.
+
+The value of each node in the expression DAG is computed once as a
+NumPy array of shape ``(N,) + shape + index_dimensions``, where ``N``
+is the number of points (or 1 for values that do not vary), ``shape``
+is the ``ufl_shape`` of the node and ``index_dimensions`` holds one
+axis for each free index of the node, in the sorted order of
+``ufl_free_indices``. Index notation is evaluated with
+``numpy.einsum``.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import math
+import operator
+
+import numpy
+
+from ufl.log import error, warning
+from ufl.utils.stacks import StackDict
+from ufl.core.multiindex import FixedIndex, Index
+from ufl.constantvalue import IntValue
+from ufl.permutation import compute_indices
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dag
+from ufl.mathfunctions import _find_erf
+
+
+# --- Operations on value arrays, shared with generated code ---
+
+def expand(v, free_indices, target_indices, rank=0):
+    """Insert axes of length 1 into the value v of an expression with
+    the given free indices, such that it broadcasts against values of
+    expressions with free indices target_indices (a sorted superset)
+    and the given rank."""
+    r = v.ndim - 1 - len(free_indices)
+    if free_indices == target_indices and r == rank:
+        return v
+    dims = v.shape[1 + r:]
+    shape = v.shape[:1 + r] + (1,)*(rank - r)
+    shape += tuple(dims[free_indices.index(i)] if i in free_indices else 1
+                   for i in target_indices)
+    return v.reshape(shape)
+
+
+def _labels(counts, numbering):
+    return [numbering.setdefault(c, len(numbering) + 1) for c in counts]
+
+
+def index_values(multiindex):
+    """Return the indices of multiindex as a tuple of ints for fixed
+    indices and 1-tuples of the count for free indices."""
+    return tuple(int(i) if isinstance(i, FixedIndex) else (i.count(),)
+                 for i in multiindex)
+
+
+def indexed(A, free_indices, indices, target_indices):
+    """Value of an Indexed of the tensor value A with the given free
+    indices, indexed by indices as returned by index_values.
+    target_indices are the free indices of the Indexed."""
+    A = A[(slice(None),) + tuple(slice(None) if isinstance(i, tuple) else i
+                                 for i in indices)]
+    numbering = {}
+    free = [i[0] for i in indices if isinstance(i, tuple)]
+    sublist = [0] + _labels(free, numbering) + _labels(free_indices, numbering)
+    return numpy.einsum(A, sublist, [0] + _labels(target_indices, numbering))
+
+
+def component_tensor(A, free_indices, indices, target_indices):
+    "Value of a ComponentTensor of the scalar value A over the given index counts."
+    numbering = {}
+    sublist = [0] + _labels(free_indices, numbering)
+    out = [0] + _labels(indices, numbering) + _labels(target_indices, numbering)
+    return numpy.einsum(A, sublist, out)
+
+
+def index_sum(A, rank, free_indices, target_indices):
+    "Value of an IndexSum of the value A over the free index it has but target_indices lacks."
+    numbering = {}
+    # Shape axes are labeled by negative numbers, which are no index counts
+    sublist = [0] + _labels(range(-1, -rank - 1, -1), numbering)
+    sublist += _labels(free_indices, numbering)
+    out = sublist[:1 + rank] + _labels(target_indices, numbering)
+    return numpy.einsum(A, sublist, out)
+
+
+def list_tensor(*values):
+    "Value of a ListTensor of the given values."
+    values = numpy.broadcast_arrays(*values)
+    return numpy.stack(values, axis=1)
+
+
+def _erf(v):
+    try:
+        import scipy.special
+    except ImportError:
+        return numpy.vectorize(math.erf, otypes=[float])(v)
+    return scipy.special.erf(v)
+
+
+def bessel_function(name, nu, v):
+    """Value of a Bessel function with the UFL name (e.g. cyl_bessel_j)
+    for values nu and v, where nu is an int for integer orders."""
+    try:
+        import scipy.special
+    except ImportError:
+        error("You must have scipy installed to evaluate bessel functions in python.")
+    name = name[-1]
+    if isinstance(nu, int):
+        functype = 'n' if name != 'i' else 'v'
+    else:
+        functype = 'v'
+    return getattr(scipy.special, name + functype)(nu, v)
+
+
+# NumPy functions for the names of MathFunction objects
+math_functions = {
+    "sqrt": numpy.sqrt,
+    "exp": numpy.exp,
+    "ln": numpy.log,
+    "cos": numpy.cos,
+    "sin": numpy.sin,
+    "tan": numpy.tan,
+    "cosh": numpy.cosh,
+    "sinh": numpy.sinh,
+    "tanh": numpy.tanh,
+    "acos": numpy.arccos,
+    "asin": numpy.arcsin,
+    "atan": numpy.arctan,
+    "erf": _erf,
+}
+
+
+def as_value(value, shape, num_points):
+    "Convert a value given for an expression of the given shape to a value array."
+    value = numpy.asarray(value, dtype=float)
+    if value.shape == shape:
+        return value.reshape((1,) + shape)
+    if value.shape != (num_points,) + shape:
+        error("Expecting value of shape %s or %s, not %s." % (shape, (num_points,) + shape, value.shape))
+    return value
+
+
+def points_array(x):
+    "Return x as an array of shape (N, gdim)."
+    x = numpy.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = x.reshape((len(x), 1))
+    if x.ndim != 2:
+        error("Expecting array of points with shape (N, gdim).")
+    return x
+
+
+class PointsEvaluator(MultiFunction):
+    """Compute the value array of each node of an expression in the
+    points x, with values of terminals and their derivatives taken
+    from mapping.
+
+    The mapping values may be arrays of shape ``(N,) + shape`` or
+    ``shape``, or callables taking the points array and returning such
+    an array. Derivatives of terminals are taken from the mapping if
+    the derivative expression is a key of the mapping, otherwise by
+    calling a callable as ``f(x, derivatives)``, like in scalar
+    evaluation.
+    """
+
+    def __init__(self, x, mapping):
+        MultiFunction.__init__(self)
+        self.x = x
+        self.mapping = mapping
+        self.num_points = len(x)
+
+    def expr(self, o, *ops):
+        error("Vectorized evaluation of %s not available." % o._ufl_class_.__name__)
+
+    # --- Terminals
+
+    def _mapped_value(self, o):
+        f = self.mapping.get(o)
+        if f is None:
+            return None
+        if callable(f):
+            f = f(self.x)
+        return as_value(f, o.ufl_shape, self.num_points)
+
+    def terminal(self, o):
+        v = self._mapped_value(o)
+        if v is None:
+            if o.ufl_shape:
+                error("Missing value for %s in mapping." % (o,))
+            try:
+                v = numpy.array([float(o)])
+            except Exception:
+                error("Missing value for %s in mapping." % (o,))
+        return v
+
+    def zero(self, o):
+        dims = o.ufl_index_dimensions
+        return numpy.zeros((1,) + o.ufl_shape + dims)
+
+    def scalar_value(self, o):
+        return numpy.array([float(o._value)])
+
+    def identity(self, o):
+        return numpy.eye(o.ufl_shape[0]).reshape((1,) + o.ufl_shape)
+
+    def permutation_symbol(self, o):
+        v = numpy.zeros((1,) + o.ufl_shape)
+        for p in itertools.permutations(range(o.ufl_shape[0])):
+            v[(0,) + p] = float(o[p])
+        return v
+
+    def spatial_coordinate(self, o):
+        v = self._mapped_value(o)
+        if v is None:
+            v = self.x
+        return v
+
+    def multi_index(self, o):
+        return o
+
+    def label(self, o):
+        return o
+
+    # --- Derivatives of terminals
+
+    def grad(self, o):
+        "Evaluate derivatives of a terminal through the mapping."
+        v = self._mapped_value(o)
+        if v is not None:
+            return v
+        t = o
+        ngrads = 0
+        while isinstance(t, type(o)):
+            t = t.ufl_operands[0]
+            ngrads += 1
+        if not t._ufl_is_terminal_:
+            error("Can only evaluate derivatives of terminals, apply derivatives first.")
+        f = self.mapping.get(t)
+        dim = o.ufl_shape[-1]
+        if f is None or not callable(f):
+            # Derivatives of values without derivative information are zero
+            return numpy.zeros((1,) + o.ufl_shape)
+        v = numpy.zeros((self.num_points,) + o.ufl_shape)
+        for derivatives in itertools.product(range(dim), repeat=ngrads):
+            d = as_value(f(self.x, derivatives), t.ufl_shape, self.num_points)
+            v[(Ellipsis,) + derivatives] = d
+        return v
+
+    reference_grad = grad
+
+    # --- Algebra
+
+    def sum(self, o, a, b):
+        return a + b
+
+    def _aligned(self, o, *ops):
+        fo = o.ufl_free_indices
+        rank = len(o.ufl_shape)
+        return [expand(v, op.ufl_free_indices, fo, rank)
+                for op, v in zip(o.ufl_operands, ops)]
+
+    def product(self, o, a, b):
+        a, b = self._aligned(o, a, b)
+        return a*b
+
+    def division(self, o, a, b):
+        a, b = self._aligned(o, a, b)
+        return a/b
+
+    def power(self, o, a, b):
+        a, b = self._aligned(o, a, b)
+        return a**b
+
+    def abs(self, o, a):
+        return numpy.abs(a)
+
+    # --- Conditions
+
+    def _condition_operands(self, o, a, b):
+        fa = o.ufl_operands[0].ufl_free_indices
+        fb = o.ufl_operands[1].ufl_free_indices
+        fo = tuple(sorted(set(fa) | set(fb)))
+        return expand(a, fa, fo), expand(b, fb, fo)
+
+    def eq(self, o, a, b):
+        a, b = self._condition_operands(o, a, b)
+        return a == b
+
+    def ne(self, o, a, b):
+        a, b = self._condition_operands(o, a, b)
+        return a != b
+
+    def le(self, o, a, b):
+        a, b = self._condition_operands(o, a, b)
+        return a <= b
+
+    def ge(self, o, a, b):
+        a, b = self._condition_operands(o, a, b)
+        return a >= b
+
+    def lt(self, o, a, b):
+        a, b = self._condition_operands(o, a, b)
+        return a < b
+
+    def gt(self, o, a, b):
+        a, b = self._condition_operands(o, a, b)
+        return a > b
+
+    def and_condition(self, o, a, b):
+        return numpy.logical_and(a, b)
+
+    def or_condition(self, o, a, b):
+        return numpy.logical_or(a, b)
+
+    def not_condition(self, o, a):
+        return numpy.logical_not(a)
+
+    def conditional(self, o, c, t, f):
+        fo = o.ufl_free_indices
+        rank = len(o.ufl_shape)
+        c = expand(c, (), fo, rank)
+        return numpy.where(c, t, f)
+
+    def min_value(self, o, a, b):
+        a, b = self._aligned(o, a, b)
+        return numpy.minimum(a, b)
+
+    def max_value(self, o, a, b):
+        a, b = self._aligned(o, a, b)
+        return numpy.maximum(a, b)
+
+    # --- Functions
+
+    def math_function(self, o, a):
+        return math_functions[o._name](a)
+
+    def atan_2(self, o, a, b):
+        a, b = self._aligned(o, a, b)
+        return numpy.arctan2(a, b)
+
+    def bessel_function(self, o, nu, a):
+        if isinstance(o.ufl_operands[0], IntValue):
+            nu = int(o.ufl_operands[0])
+        return bessel_function(o._name, nu, a)
+
+    # --- Index notation
+
+    def indexed(self, o, A, ii):
+        A_op = o.ufl_operands[0]
+        return indexed(A, A_op.ufl_free_indices, index_values(ii), o.ufl_free_indices)
+
+    def component_tensor(self, o, A, ii):
+        return component_tensor(A, o.ufl_operands[0].ufl_free_indices,
+                                [i.count() for i in ii], o.ufl_free_indices)
+
+    def index_sum(self, o, A, i):
+        A_op = o.ufl_operands[0]
+        return index_sum(A, len(A_op.ufl_shape), A_op.ufl_free_indices, o.ufl_free_indices)
+
+    def list_tensor(self, o, *ops):
+        return list_tensor(*ops)
+
+    # --- Operators without effect on values
+
+    def variable(self, o, a, label):
+        return a
+
+    def restricted(self, o, a):
+        return a
+
+    def cell_avg(self, o, a):
+        return a
+
+    def facet_avg(self, o, a):
+        return a
+
+
+def evaluate_points(expression, x, mapping=None):
+    """Evaluate expression in each of the points in x, an array with
+    shape (N, gdim), and return an array with shape (N,) + the shape
+    of the expression.
+
+    See PointsEvaluator for the supported values in mapping.
+    """
+    from ufl.algorithms.ad import expand_derivatives
+    x = points_array(x)
+    if mapping is None:
+        mapping = {}
+    expression = expand_derivatives(expression)
+    if expression.ufl_free_indices:
+        error("Cannot evaluate expression with free indices.")
+    v = map_expr_dag(PointsEvaluator(x, mapping), expression, compress=False)
+    return numpy.array(numpy.broadcast_to(v, (len(x),) + expression.ufl_shape))
+
+
+class _Failure(object):
+    "An exception raised while computing a value, raised again where the value is used."
+    __slots__ = ("exception",)
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _apply(function, args):
+    """Return function(*args), or a _Failure if one of the args is a
+    _Failure or the call raises an exception."""
+    for a in args:
+        if isinstance(a, _Failure):
+            return a
+    try:
+        return function(*args)
+    except Exception as e:
+        return _Failure(e)
+
+
+def _value_keys(o):
+    """Return the keys (component, index values) of the values of o,
+    with index values in the order of o.ufl_free_indices."""
+    ranges = [range(d) for d in o.ufl_index_dimensions]
+    return [(c, iv) for c in compute_indices(o.ufl_shape)
+            for iv in itertools.product(*ranges)]
+
+
+def _positions(free_indices, target_indices):
+    "Return the positions of free_indices in target_indices."
+    return tuple(target_indices.index(i) for i in free_indices)
+
+
+def _product(*ops):
+    "Product of ops, where only the last one may be nonscalar, like Product.evaluate."
+    tmp = ops[-1]
+    for a in ops[:-1]:
+        tmp *= a
+    return tmp
+
+
+def _min_value(a, b):
+    try:
+        res = min(a, b)
+    except ValueError:
+        warning('Value error in evaluation of min() of %s and %s.' % (a, b))
+        raise
+    return res
+
+
+def _max_value(a, b):
+    try:
+        res = max(a, b)
+    except ValueError:
+        warning('Value error in evaluation of max() of %s and %s.' % (a, b))
+        raise
+    return res
+
+
+def _erf(a):
+    erf = _find_erf()
+    if erf is None:
+        error("No python implementation of erf available on this system, cannot evaluate. Upgrade python or install scipy.")
+    return erf(a)
+
+
+def _atan_2(a, b):
+    try:
+        res = math.atan2(a, b)
+    except ValueError:
+        warning('Value error in evaluation of function atan_2 with arguments %s, %s.' % (a, b))
+        raise
+    return res
+
+
+class MemoizedEvaluator(MultiFunction):
+    """Evaluate an expression in a single point x, like the ``evaluate``
+    methods of the expression classes, but computing the value of each
+    node for each component and value of its free indices only once.
+
+    Applied with ``map_expr_dag``, the handlers return a dict mapping
+    each key (component, index values) of a node to its value, with
+    the index values in the order of ``ufl_free_indices``. Operators
+    are evaluated by the handlers of this class, which give the same
+    results as the corresponding ``evaluate`` methods, terminals and
+    their derivatives by their ``evaluate`` methods.
+
+    Exceptions are stored in place of the values and raised where the
+    values are used, so branches of conditionals which are not taken
+    do not fail, like in ``evaluate``.
+    """
+
+    def __init__(self, x, mapping):
+        MultiFunction.__init__(self)
+        self.x = x
+        self.mapping = mapping
+
+    def _evaluate(self, o):
+        values = {}
+        fo = o.ufl_free_indices
+        for key in _value_keys(o):
+            component, iv = key
+            index_values = StackDict()
+            for i, v in zip(fo, iv):
+                index_values.push(Index(count=i), v)
+            values[key] = _apply(o.evaluate, (self.x, self.mapping, component, index_values))
+        return values
+
+    def expr(self, o, *ops):
+        return self._evaluate(o)
+
+    def terminal(self, o):
+        return self._evaluate(o)
+
+    def multi_index(self, o):
+        return o
+
+    def label(self, o):
+        return o
+
+    def _elementwise(self, o, function, *ops):
+        """Return the values of o computed by function from the values
+        of its operands ops, where nonscalar operands have the shape
+        of o."""
+        fo = o.ufl_free_indices
+        operands = [(v, bool(op.ufl_shape), _positions(op.ufl_free_indices, fo))
+                    for op, v in zip(o.ufl_operands, ops)]
+        values = {}
+        for key in _value_keys(o):
+            component, iv = key
+            args = [v[(component if shaped else (), tuple(iv[p] for p in positions))]
+                    for v, shaped, positions in operands]
+            values[key] = _apply(function, args)
+        return values
+
+    # --- Algebra
+
+    def sum(self, o, *ops):
+        return self._elementwise(o, lambda *args: sum(args), *ops)
+
+    def product(self, o, *ops):
+        if o.ufl_shape and o.ufl_shape != o.ufl_operands[-1].ufl_shape:
+            error("Expecting nonscalar product operand to be the last by convention.")
+        if o.ufl_shape:
+            return self._elementwise(o, _product, *ops)
+        return self._elementwise(o, lambda *args: _product(*(args + (1,))), *ops)
+
+    def division(self, o, a, b):
+        # Avoiding integer division by casting to float
+        return self._elementwise(o, lambda a, b: float(a) / float(b), a, b)
+
+    def power(self, o, a, b):
+        return self._elementwise(o, operator.pow, a, b)
+
+    def abs(self, o, a):
+        return self._elementwise(o, abs, a)
+
+    # --- Conditions
+
+    def _binary_condition(self, o, a, b, op):
+        return self._elementwise(o, lambda a, b: bool(op(a, b)), a, b)
+
+    def eq(self, o, a, b):
+        return self._binary_condition(o, a, b, operator.eq)
+
+    def ne(self, o, a, b):
+        return self._binary_condition(o, a, b, operator.ne)
+
+    def le(self, o, a, b):
+        return self._binary_condition(o, a, b, operator.le)
+
+    def ge(self, o, a, b):
+        return self._binary_condition(o, a, b, operator.ge)
+
+    def lt(self, o, a, b):
+        return self._binary_condition(o, a, b, operator.lt)
+
+    def gt(self, o, a, b):
+        return self._binary_condition(o, a, b, operator.gt)
+
+    def and_condition(self, o, a, b):
+        return self._binary_condition(o, a, b, lambda a, b: a and b)
+
+    def or_condition(self, o, a, b):
+        return self._binary_condition(o, a, b, lambda a, b: a or b)
+
+    def not_condition(self, o, a):
+        return self._elementwise(o, lambda a: bool(not a), a)
+
+    def conditional(self, o, c, t, f):
+        fo = o.ufl_free_indices
+        operands = [_positions(op.ufl_free_indices, fo) for op in o.ufl_operands]
+        values = {}
+        for key in _value_keys(o):
+            component, iv = key
+            pc, pt, pf = [tuple(iv[p] for p in positions) for positions in operands]
+            cv = c[((), pc)]
+            if isinstance(cv, _Failure):
+                values[key] = cv
+            elif cv:
+                values[key] = t[(component, pt)]
+            else:
+                values[key] = f[(component, pf)]
+        return values
+
+    def min_value(self, o, a, b):
+        return self._elementwise(o, _min_value, a, b)
+
+    def max_value(self, o, a, b):
+        return self._elementwise(o, _max_value, a, b)
+
+    # --- Functions
+
+    def math_function(self, o, a):
+        def function(a):
+            try:
+                res = getattr(math, o._name)(a)
+            except ValueError:
+                warning('Value error in evaluation of function %s with argument %s.' % (o._name, a))
+                raise
+            return res
+        return self._elementwise(o, function, a)
+
+    def ln(self, o, a):
+        return self._elementwise(o, math.log, a)
+
+    def erf(self, o, a):
+        return self._elementwise(o, _erf, a)
+
+    def atan_2(self, o, a, b):
+        return self._elementwise(o, _atan_2, a, b)
+
+    def bessel_function(self, o, nu, a):
+        if isinstance(o.ufl_operands[0], IntValue):
+            n = int(o.ufl_operands[0])
+            return self._elementwise(o, lambda nu, a: bessel_function(o._name, n, a), nu, a)
+        return self._elementwise(o, lambda nu, a: bessel_function(o._name, nu, a), nu, a)
+
+    # --- Index notation
+
+    def indexed(self, o, A, ii):
+        fo = o.ufl_free_indices
+        pa = _positions(o.ufl_operands[0].ufl_free_indices, fo)
+        # Fixed indices as ints, free indices as 1-tuples of their positions
+        indices = tuple(int(i) if isinstance(i, FixedIndex) else (fo.index(i.count()),)
+                        for i in ii)
+        values = {}
+        for key in _value_keys(o):
+            component, iv = key
+            c = tuple(iv[i[0]] if isinstance(i, tuple) else i for i in indices)
+            values[key] = A[(c, tuple(iv[p] for p in pa))]
+        return values
+
+    def component_tensor(self, o, A, ii):
+        fo = o.ufl_free_indices
+        counts = [i.count() for i in ii]
+        # Take each free index value of A from the component or the
+        # index values of o
+        sources = [(True, counts.index(i)) if i in counts else (False, fo.index(i))
+                   for i in o.ufl_operands[0].ufl_free_indices]
+        values = {}
+        for key in _value_keys(o):
+            component, iv = key
+            ia = tuple(component[p] if from_component else iv[p]
+                       for from_component, p in sources)
+            values[key] = A[((), ia)]
+        return values
+
+    def index_sum(self, o, A, ii):
+        fo = o.ufl_free_indices
+        i = ii[0].count()
+        fa = o.ufl_operands[0].ufl_free_indices
+        sources = [None if j == i else fo.index(j) for j in fa]
+        values = {}
+        for key in _value_keys(o):
+            component, iv = key
+            args = [A[(component, tuple(k if p is None else iv[p] for p in sources))]
+                    for k in range(o.dimension())]
+            values[key] = _apply(lambda *args: sum(args), args)
+        return values
+
+    def list_tensor(self, o, *ops):
+        values = {}
+        for key in _value_keys(o):
+            component, iv = key
+            values[key] = ops[component[0]][(component[1:], iv)]
+        return values
+
+    # --- Operators without effect on values
+
+    def variable(self, o, a, label):
+        return a
+
+    def restricted(self, o, a):
+        return a
+
+    def cell_avg(self, o, a):
+        return a
+
+    def facet_avg(self, o, a):
+        return a
+
+
+def evaluate_memoized(expression, x, mapping=None, component=()):
+    """Evaluate component of expression in the point x, with the same
+    result as ``expression(x, mapping, component)``, but evaluating
+    shared subexpressions only once and without recursion.
+
+    See MemoizedEvaluator.
+    """
+    from ufl.algorithms.ad import expand_derivatives
+    if mapping is None:
+        mapping = {}
+    expression = expand_derivatives(expression)
+    if expression.ufl_free_indices:
+        error("Cannot evaluate expression with free indices.")
+    component = tuple(component)
+    if len(component) != len(expression.ufl_shape):
+        error("Can only evaluate scalars, expecting a component "
+              "tuple of length %d, not %s." % (len(expression.ufl_shape), component))
+    values = map_expr_dag(MemoizedEvaluator(x, mapping), expression, compress=False)
+    v = values[(component, ())]
+    if isinstance(v, _Failure):
+        raise v.exception
+    return v
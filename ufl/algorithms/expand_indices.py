@@ -22,14 +22,20 @@ indices only."""
 #
 # Modified by Anders Logg, 2009.
 
+from types import GeneratorType
+
 from ufl.log import error
 from ufl.utils.stacks import Stack, StackDict
 from ufl.classes import Terminal, ListTensor
 from ufl.constantvalue import Zero
 from ufl.core.multiindex import Index, FixedIndex, MultiIndex
 from ufl.differentiation import Grad
-from ufl.algorithms.transformer import ReuseTransformer, apply_transformer
+from ufl.variable import Variable
+from ufl.algorithms.transformer import ReuseTransformer
+from ufl.algorithms.map_integrands import map_integrands
+from ufl.corealg.multifunction import MultiFunction
 from ufl.corealg.traversal import unique_pre_traversal
+from ufl.permutation import compute_indices
 
 
 class IndexExpander(ReuseTransformer):
@@ -227,8 +233,200 @@ class IndexExpander(ReuseTransformer):
         return x[self.component()]
 
 
+class IndexScalarizer(MultiFunction):
+    """Expand free indices and components of expressions to scalar
+    expressions with fixed indices only, with the same results as
+    IndexExpander.
+
+    The expansion of each node is computed once for each component
+    and each combination of values of the free indices of the node,
+    and shared between all uses of the node. Handlers are generators
+    which yield requests (operand, component, index_values) and are
+    resumed with the expanded operand, such that deep expressions are
+    expanded without recursion.
+
+    Handlers take the arguments (o, component, index_values), where
+    index_values is a dict from the counts of the free indices of o
+    to their values.
+    """
+
+    def __init__(self):
+        MultiFunction.__init__(self)
+        self._cache = {}
+
+    def _key(self, o, component, index_values):
+        try:
+            values = tuple(index_values[i] for i in o.ufl_free_indices)
+        except KeyError:
+            s = set(o.ufl_free_indices) - set(index_values)
+            error("Free index set mismatch, these indices have no value assigned: %s." % str(s))
+        return (o, component, values)
+
+    def _expand(self, o, component, index_values):
+        "Return the expansion of o for the given component and index values."
+        cache = self._cache
+        key = self._key(o, component, index_values)
+        r = cache.get(key)
+        if r is not None:
+            return r
+
+        stack = []
+        while True:
+            # Call handler for the request in key, which is not cached
+            o, component, values = key
+            h = self(o, component, dict(zip(o.ufl_free_indices, values)))
+            if isinstance(h, GeneratorType):
+                stack.append((key, h))
+                r = None
+            else:
+                cache[key] = h
+                r = h
+
+            # Resume handlers until one requests an operand which is
+            # not cached
+            while stack:
+                key, h = stack[-1]
+                try:
+                    request = h.send(r)
+                except StopIteration as e:
+                    stack.pop()
+                    r = e.value
+                    cache[key] = r
+                    continue
+                key = self._key(*request)
+                r = cache.get(key)
+                if r is None:
+                    break
+            else:
+                return r
+
+    def scalar_component(self, expr, component=()):
+        "Return the expansion of the given component of expr."
+        if expr.ufl_free_indices:
+            error("Cannot expand expression with free indices.")
+        return self._expand(expr, tuple(component), {})
+
+    def iter_components(self, expr):
+        """Iterate over the components of expr, yielding tuples
+        (component, expansion), expanding each component on request."""
+        for component in compute_indices(expr.ufl_shape):
+            yield component, self.scalar_component(expr, component)
+
+    def _check_component(self, o, component):
+        if len(o.ufl_shape) != len(component):
+            error("Component size mismatch.")
+
+    def _multi_index_values(self, ii, index_values):
+        return tuple(i._value if isinstance(i, FixedIndex) else index_values[i.count()]
+                     for i in ii)
+
+    def expr(self, o, component, index_values):
+        ops = []
+        for op in o.ufl_operands:
+            if isinstance(op, MultiIndex):
+                op = MultiIndex(tuple(FixedIndex(i) for i in
+                                      self._multi_index_values(op, index_values)))
+            else:
+                op = yield (op, component, index_values)
+            ops.append(op)
+        return self.reuse_if_untouched(o, *ops)
+
+    def terminal(self, o, component, index_values):
+        if o.ufl_shape:
+            self._check_component(o, component)
+            return o[component]
+        return o
+
+    def form_argument(self, o, component, index_values):
+        if not o.ufl_shape:
+            return o
+        self._check_component(o, component)
+
+        # Map it through an eventual symmetry mapping
+        c = o.ufl_element().symmetry().get(component, component)
+        if len(c) != len(component):
+            error("Component size mismatch after symmetry mapping.")
+        return o[c]
+
+    def zero(self, o, component, index_values):
+        self._check_component(o, component)
+        return Zero()
+
+    def scalar_value(self, o, component, index_values):
+        self._check_component(o, component)
+        return o._ufl_class_(o.value())
+
+    def variable(self, o, component, index_values):
+        e, label = o.ufl_operands
+        r = yield (e, component, index_values)
+        if component:
+            # A Variable with this label would represent the whole tensor
+            return r
+        if r == e:
+            return o
+        return Variable(r, label)
+
+    def conditional(self, o, component, index_values):
+        c, t, f = o.ufl_operands
+        if c.ufl_shape != ():
+            error("Not expecting tensor in condition.")
+        c = yield (c, (), index_values)
+        t = yield (t, component, index_values)
+        f = yield (f, component, index_values)
+        return self.reuse_if_untouched(o, c, t, f)
+
+    def division(self, o, component, index_values):
+        a, b = o.ufl_operands
+        if a.ufl_shape != ():
+            error("Not expecting tensor in division.")
+        if component != ():
+            error("Not expecting component in division.")
+        if b.ufl_shape != ():
+            error("Not expecting division by tensor.")
+        a = yield (a, component, index_values)
+        b = yield (b, component, index_values)
+        return self.reuse_if_untouched(o, a, b)
+
+    def index_sum(self, o, component, index_values):
+        summand, (index,) = o.ufl_operands
+        ops = []
+        for value in range(o.dimension()):
+            values = dict(index_values)
+            values[index.count()] = value
+            ops.append((yield (summand, component, values)))
+        return sum(ops)
+
+    def indexed(self, o, component, index_values):
+        A, ii = o.ufl_operands
+        return (yield (A, self._multi_index_values(ii, index_values), index_values))
+
+    def component_tensor(self, o, component, index_values):
+        expression, indices = o.ufl_operands
+        if expression.ufl_shape != ():
+            error("Expecting scalar base expression.")
+        if len(indices) != len(component):
+            error("Index/component mismatch.")
+        values = dict(index_values)
+        for i, v in zip(indices.indices(), component):
+            values[i.count()] = v
+        return (yield (expression, (), values))
+
+    def list_tensor(self, o, component, index_values):
+        return (yield (o.ufl_operands[component[0]], component[1:], index_values))
+
+    def grad(self, o, component, index_values):
+        f, = o.ufl_operands
+        if not isinstance(f, (Terminal, Grad)):
+            error("Expecting expand_derivatives to have been applied.")
+        return o[component]
+
+
 def expand_indices(e):
-    return apply_transformer(e, IndexExpander())
+    """Expand free indices and tensor components in the integrands of
+    a form, or an expression, to scalar expressions with fixed indices
+    only. Subexpressions shared between integrands are expanded once."""
+    scalarizer = IndexScalarizer()
+    return map_integrands(scalarizer.scalar_component, e)
 
 
 def purge_list_tensors(expr):
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""Compact array representation of expression DAGs.
+
+An ``ExprGraph`` stores the unique nodes of one or more expressions
+as flat integer arrays instead of linked ``Expr`` objects, which makes
+bulk analyses like type counting and terminal extraction cheap
+vectorized or tight-loop passes.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+
+from ufl.log import error
+from ufl.core.expr import Expr
+from ufl.argument import Argument
+from ufl.corealg.traversal import unique_post_traversal
+from ufl.algorithms.traversal import iter_expressions
+
+
+class ExprGraph(object):
+    """Array representation of the unique nodes of one or more expressions.
+
+    Nodes are numbered in post-order, i.e. the operands of a node always
+    have lower numbers than the node itself. Structurally equal
+    subexpressions are stored once.
+
+    *Attributes*
+        ``typecodes``
+            Array with the ``_ufl_typecode_`` of each node.
+        ``operand_offsets``, ``operand_indices``
+            CSR-style operand lists: the operands of node ``i`` are the
+            nodes ``operand_indices[operand_offsets[i]:operand_offsets[i+1]]``.
+        ``terminals``
+            List of the unique terminal objects.
+        ``terminal_indices``
+            Array with the position in ``terminals`` of each terminal node,
+            and -1 for operator nodes.
+        ``roots``
+            Array with the node of each input expression, in the order
+            given by ``iter_expressions`` applied to each input object.
+        ``nodes``
+            List of the unique node objects, or None for a graph
+            restored by ``pickle``, which only stores the terminals.
+    """
+
+    def __init__(self, a):
+        "Build graph from a Form, Integral or Expr, or a list of these."
+        if isinstance(a, (list, tuple)):
+            expressions = [e for b in a for e in iter_expressions(b)]
+        else:
+            expressions = iter_expressions(a)
+
+        nodes = []
+        typecodes = []
+        offsets = [0]
+        operands = []
+        terminals = []
+        terminal_indices = []
+        roots = []
+
+        numbering = {}
+        visited = set()
+        for expr in expressions:
+            for v in unique_post_traversal(expr, visited):
+                numbering[v] = len(nodes)
+                nodes.append(v)
+                typecodes.append(v._ufl_typecode_)
+                if v._ufl_is_terminal_:
+                    terminal_indices.append(len(terminals))
+                    terminals.append(v)
+                else:
+                    terminal_indices.append(-1)
+                    operands.extend(numbering[o] for o in v.ufl_operands)
+                offsets.append(len(operands))
+            roots.append(numbering[expr])
+
+        self.typecodes = numpy.array(typecodes, dtype=numpy.int32)
+        self.operand_offsets = numpy.array(offsets, dtype=numpy.int32)
+        self.operand_indices = numpy.array(operands, dtype=numpy.int32)
+        self.terminals = terminals
+        self.terminal_indices = numpy.array(terminal_indices, dtype=numpy.int32)
+        self.roots = numpy.array(roots, dtype=numpy.int32)
+        self.nodes = nodes
+
+    def __getstate__(self):
+        """Pickle typecodes with class names, the typecodes depend on the
+        order classes are defined. The nodes are not pickled."""
+        state = dict(self.__dict__)
+        state["nodes"] = None
+        state["class_names"] = [c.__name__ for c in Expr._ufl_all_classes_]
+        return state
+
+    def __setstate__(self, state):
+        typecodes = dict((c.__name__, c._ufl_typecode_) for c in Expr._ufl_all_classes_)
+        remap = numpy.array([typecodes.get(name, -1) for name in state.pop("class_names")],
+                            dtype=numpy.int32)
+        self.__dict__.update(state)
+        self.typecodes = remap[self.typecodes]
+        if numpy.any(self.typecodes < 0):
+            error("Expression graph refers to unknown expression types.")
+
+    def __len__(self):
+        "Return the number of unique nodes."
+        return len(self.typecodes)
+
+    def num_edges(self):
+        "Return the number of operand edges."
+        return len(self.operand_indices)
+
+    def operands(self, i):
+        "Return array with the operand nodes of node *i*."
+        return self.operand_indices[self.operand_offsets[i]:self.operand_offsets[i + 1]]
+
+    def arities(self):
+        "Return array with the number of operands of each node."
+        return numpy.diff(self.operand_offsets)
+
+    def parent_counts(self):
+        "Return array with the number of operand references to each node."
+        return numpy.bincount(self.operand_indices, minlength=len(self))
+
+    def type_counts(self):
+        "Return array with the number of nodes of each typecode."
+        return numpy.bincount(self.typecodes, minlength=Expr._ufl_num_typecodes_)
+
+    def _type_mask(self, ufl_type):
+        "Return boolean array over typecodes which are subclasses of *ufl_type*."
+        return numpy.array([issubclass(c, ufl_type) for c in Expr._ufl_all_classes_])
+
+    def count_type(self, ufl_type):
+        "Return the number of nodes of class *ufl_type* or a subclass."
+        return int(numpy.count_nonzero(self._type_mask(ufl_type)[self.typecodes]))
+
+    def has_type(self, ufl_type):
+        "Return if a node of class *ufl_type* or a subclass is in the graph."
+        return bool(numpy.any(self._type_mask(ufl_type)[self.typecodes]))
+
+    def extract_terminals(self, ufl_type=None):
+        "Return list of unique terminals, optionally only those of class *ufl_type*."
+        if ufl_type is None:
+            return list(self.terminals)
+        return [t for t in self.terminals if isinstance(t, ufl_type)]
+
+    def propagate(self, terminal_rule, operator_rule):
+        """Compute a value for each node in a single pass over the arrays.
+
+        The value of a terminal node is ``terminal_rule(terminal)``, the
+        value of an operator node is ``operator_rule(typecode, values)``
+        where ``values`` is the list of values of its operands.
+
+        Return a list with the value of each node.
+        """
+        typecodes = self.typecodes.tolist()
+        offsets = self.operand_offsets.tolist()
+        operands = self.operand_indices.tolist()
+        terminal_indices = self.terminal_indices.tolist()
+        terminals = self.terminals
+
+        values = [None]*len(typecodes)
+        for i, tc in enumerate(typecodes):
+            k = terminal_indices[i]
+            if k >= 0:
+                values[i] = terminal_rule(terminals[k])
+            else:
+                values[i] = operator_rule(tc, [values[j] for j in operands[offsets[i]:offsets[i + 1]]])
+        return values
+
+    def depths(self):
+        "Return array with the height of each node, 0 for terminals."
+        return numpy.array(self.propagate(lambda t: 0,
+                                          lambda tc, ops: 1 + max(ops)),
+                           dtype=numpy.int32)
+
+    def tree_sizes(self):
+        """Return list with the number of nodes in the tree representation
+        of each node, counting shared subexpressions once per path."""
+        return self.propagate(lambda t: 1, lambda tc, ops: 1 + sum(ops))
+
+    def argument_numbers(self):
+        "Return list with the set of argument numbers each node depends on."
+        empty = frozenset()
+
+        def terminal_rule(t):
+            if isinstance(t, Argument):
+                return frozenset((t.number(),))
+            return empty
+
+        def operator_rule(tc, ops):
+            return empty.union(*ops)
+
+        return self.propagate(terminal_rule, operator_rule)
+
+    def reachable(self, roots=None):
+        "Return boolean array marking the nodes reachable from *roots* (default all roots)."
+        if roots is None:
+            roots = self.roots
+        offsets = self.operand_offsets.tolist()
+        operands = self.operand_indices.tolist()
+        mask = [False]*len(self)
+        for i in roots:
+            mask[i] = True
+        for i in range(len(mask) - 1, -1, -1):
+            if mask[i]:
+                for j in operands[offsets[i]:offsets[i + 1]]:
+                    mask[j] = True
+        return numpy.array(mask, dtype=bool)
+
+    def expressions(self):
+        "Reconstruct and return the list of root expressions."
+        return self._reconstruct(self.roots.tolist())
+
+    def expression(self, i=0):
+        "Reconstruct and return root expression number *i*."
+        if not 0 <= i < len(self.roots):
+            error("Invalid root number %d." % i)
+        return self._reconstruct([int(self.roots[i])])[0]
+
+    def _reconstruct(self, roots):
+        """Reconstruct the expressions of the given nodes, visiting only the nodes they depend on.
+
+        Nodes are reconstructed by the ``_ufl_expr_reconstruct_`` method
+        of the original nodes, or by their classes for graphs restored
+        by ``pickle``. Nodes whose operands are unchanged are reused."""
+        classes = Expr._ufl_all_classes_
+        nodes = self.nodes
+        typecodes = self.typecodes.tolist()
+        offsets = self.operand_offsets.tolist()
+        operands = self.operand_indices.tolist()
+        terminal_indices = self.terminal_indices.tolist()
+        terminals = self.terminals
+        mask = self.reachable(roots).tolist()
+
+        values = [None]*len(typecodes)
+        for i, tc in enumerate(typecodes):
+            if not mask[i]:
+                continue
+            k = terminal_indices[i]
+            if k >= 0:
+                values[i] = terminals[k]
+                continue
+            ops = [values[j] for j in operands[offsets[i]:offsets[i + 1]]]
+            if nodes is None:
+                values[i] = classes[tc](*ops)
+            else:
+                v = nodes[i]
+                if all(a is b for a, b in zip(ops, v.ufl_operands)):
+                    values[i] = v
+                else:
+                    values[i] = v._ufl_expr_reconstruct_(*ops)
+        return [values[i] for i in roots]
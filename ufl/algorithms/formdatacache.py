@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Persistent cache of preprocessed form data.
+
+The ``FormData`` computed by ``compute_form_data`` is stored in a
+directory, one file per form signature, processing options and UFL
+version. The processed integrands are stored as the arrays of an
+``ExprGraph``, with the arguments, coefficients and domains of the
+original form replaced by their positions in the form, such that a
+file can be loaded for any form with the same signature.
+
+Files are written atomically, so several processes may share a cache
+directory. Only use directories writable by trusted users, the files
+are loaded with ``pickle``.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+from ufl.log import error, warning
+from ufl.argument import Argument
+from ufl.coefficient import Coefficient
+from ufl.geometry import GeometricQuantity
+from ufl.integral import Integral
+from ufl.algorithms.formdata import FormData
+from ufl.algorithms.exprgraph import ExprGraph
+from ufl.algorithms.domain_analysis import IntegralData
+from ufl.algorithms.domain_analysis import reconstruct_form_from_integral_data
+from ufl.algorithms.parallel import _global_counts, _update_global_counts
+
+
+# Increase when the file contents change
+_format_version = 3
+
+
+def _ufl_version():
+    from ufl import __version__
+    return __version__
+
+
+def _encode_terminal(t, arguments, coefficients, domains):
+    "Replace terminal by its position in the form if it belongs to the form."
+    if isinstance(t, Argument) and t in arguments:
+        return ("argument", arguments.index(t))
+    elif isinstance(t, Coefficient) and t in coefficients:
+        return ("coefficient", coefficients.index(t))
+    elif isinstance(t, GeometricQuantity) and t.ufl_domain() in domains:
+        return ("geometry", t._ufl_class_, domains.index(t.ufl_domain()))
+    return ("terminal", t)
+
+
+def _decode_terminal(data, arguments, coefficients, domains):
+    kind = data[0]
+    if kind == "argument":
+        return arguments[data[1]]
+    elif kind == "coefficient":
+        return coefficients[data[1]]
+    elif kind == "geometry":
+        return data[1](domains[data[2]])
+    return data[1]
+
+
+def serialize_form_data(form_data):
+    """Return a picklable representation of form_data which does not
+    refer to the arguments, coefficients and domains of the
+    original form."""
+    form = form_data.original_form
+    arguments = list(form.arguments())
+    coefficients = list(form.coefficients())
+    domains = list(form.ufl_domains())
+
+    integrals = [itg for itg_data in form_data.integral_data
+                 for itg in itg_data.integrals]
+    graph = ExprGraph(integrals)
+    graph.terminals = [_encode_terminal(t, arguments, coefficients, domains)
+                       for t in graph.terminals]
+
+    integral_data = []
+    for itg_data in form_data.integral_data:
+        itg_metadata = [(itg.subdomain_id(), itg.metadata())
+                        for itg in itg_data.integrals]
+        integral_data.append((domains.index(itg_data.domain),
+                              itg_data.integral_type,
+                              itg_data.subdomain_id,
+                              itg_data.metadata,
+                              itg_metadata,
+                              [coefficients.index(c) for c in itg_data.integral_coefficients],
+                              itg_data.enabled_coefficients))
+
+    # The remaining attributes do not refer to the original form
+    attributes = dict(form_data.__dict__)
+    for name in ("original_form", "integral_data", "preprocessed_form",
+                 "reduced_coefficients", "function_replace_map"):
+        del attributes[name]
+    replacements = [form_data.function_replace_map[c]
+                    for c in form_data.reduced_coefficients]
+
+    return {
+        "format": _format_version,
+        "graph": graph,
+        "integral_data": integral_data,
+        "attributes": attributes,
+        "replacements": replacements,
+        "counts": _global_counts(),
+    }
+
+
+def deserialize_form_data(data, form):
+    """Return the FormData represented by data, as returned by
+    serialize_form_data, for a form with the same signature as the
+    original form."""
+    if data["format"] != _format_version:
+        error("Unsupported form data format %s." % (data["format"],))
+    # The integrands contain indices and labels counted in the process
+    # which stored them
+    _update_global_counts(data["counts"])
+    arguments = list(form.arguments())
+    coefficients = list(form.coefficients())
+    domains = list(form.ufl_domains())
+
+    graph = data["graph"]
+    graph.terminals = [_decode_terminal(t, arguments, coefficients, domains)
+                       for t in graph.terminals]
+    integrands = iter(graph.expressions())
+
+    self = FormData()
+    self.__dict__.update(data["attributes"])
+    self.original_form = form
+    self.reduced_coefficients = [coefficients[i] for i in self.original_coefficient_positions]
+    self.function_replace_map = dict(zip(self.reduced_coefficients, data["replacements"]))
+
+    subdomain_data = form.subdomain_data()
+    self.integral_data = []
+    for (k, integral_type, subdomain_id, metadata, itg_metadata,
+         integral_coefficients, enabled_coefficients) in data["integral_data"]:
+        domain = domains[k]
+        sd = subdomain_data[domain].get(integral_type)
+        integrals = [Integral(next(integrands), integral_type, domain, sid, md, sd)
+                     for sid, md in itg_metadata]
+        itg_data = IntegralData(domain, integral_type, subdomain_id, integrals, metadata)
+        itg_data.integral_coefficients = set(coefficients[i] for i in integral_coefficients)
+        itg_data.enabled_coefficients = enabled_coefficients
+        self.integral_data.append(itg_data)
+    self.preprocessed_form = reconstruct_form_from_integral_data(self.integral_data)
+    return self
+
+
+class FormDataCache(object):
+    """Directory of serialized FormData objects.
+
+    If max_size is given, the least recently used files are removed
+    when the total size of the files exceeds max_size bytes.
+    """
+
+    suffix = ".ufd"
+
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def filename(self, key):
+        "Return the file name for key, which must have a stable repr."
+        data = repr((key, _ufl_version(), _format_version)).encode("utf-8")
+        name = hashlib.sha256(data).hexdigest()
+        return os.path.join(self.directory, name + self.suffix)
+
+    def get(self, key, form):
+        "Return the FormData stored for key renumbered for form, or None."
+        filename = self.filename(key)
+        try:
+            with open(filename, "rb") as f:
+                data = pickle.load(f)
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            warning("Ignoring invalid form data cache file %s: %s" % (filename, e))
+            return None
+        try:
+            # Mark as recently used
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return deserialize_form_data(data, form)
+
+    def put(self, key, form_data):
+        "Store form_data for key."
+        try:
+            data = serialize_form_data(form_data)
+            data = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            warning("Unable to store form data in cache: %s" % (e,))
+            return
+
+        # Write to a temporary file and rename it, which is atomic
+        tmpname = None
+        try:
+            fd, tmpname = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmpname, self.filename(key))
+        except (IOError, OSError) as e:
+            if tmpname is not None:
+                try:
+                    os.remove(tmpname)
+                except OSError:
+                    pass
+            warning("Unable to store form data in cache: %s" % (e,))
+            return
+
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def files(self):
+        "Return list of (filename, size, time of last use) of the cache files."
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                filename = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                files.append((filename, st.st_size, st.st_mtime))
+        return files
+
+    def evict(self, max_size):
+        "Remove least recently used files until the total size is at most max_size bytes."
+        files = sorted(self.files(), key=lambda f: f[2])
+        total = sum(f[1] for f in files)
+        for filename, size, mtime in files:
+            if total <= max_size:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        "Remove all cache files."
+        self.evict(0)
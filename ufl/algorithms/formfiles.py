@@ -32,6 +32,7 @@ from ufl.finiteelement import FiniteElementBase
 from ufl.core.expr import Expr
 from ufl.argument import Argument
 from ufl.coefficient import Coefficient
+from ufl.tracing import trace_span
 
 
 class FileData(object):
@@ -223,10 +224,13 @@ def interpret_ufl_namespace(namespace):
 
 def load_ufl_file(filename):
     "Load a .ufl file with elements, coefficients and forms."
-    # Read code from file and execute it
-    uflcode = read_ufl_file(filename)
-    namespace = execute_ufl_code(uflcode, filename)
-    return interpret_ufl_namespace(namespace)
+    with trace_span("load_ufl_file", args={"filename": filename}):
+        # Read code from file and execute it
+        uflcode = read_ufl_file(filename)
+        with trace_span("execute_ufl_code"):
+            namespace = execute_ufl_code(uflcode, filename)
+        with trace_span("interpret_ufl_namespace"):
+            return interpret_ufl_namespace(namespace)
 
 
 def load_forms(filename):
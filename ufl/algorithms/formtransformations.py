@@ -60,6 +60,7 @@ class PartExtracter(Transformer):
     PartExtracter extracts those parts of a form that contain the
     given argument(s).
     """
+    _memoize_visits = True
 
     def __init__(self, arguments):
         Transformer.__init__(self)
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""Generation of Python functions evaluating expressions with NumPy.
+
+``lambdify`` walks the expression DAG once and emits straight-line
+Python source with one local variable for each unique subexpression,
+computing the same value arrays as ``evaluate_points``. The compiled
+function is cached by the signature of the expression, such that
+expressions differing only in their terminals share it.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+
+import numpy
+
+from ufl.log import error
+from ufl.core.multiindex import FixedIndex
+from ufl.constantvalue import IntValue
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dag
+from ufl.algorithms.analysis import extract_coefficients
+from ufl.algorithms.signature import compute_expression_signature
+from ufl.domain import extract_domains
+from ufl.algorithms import evaluation
+from ufl.algorithms.evaluation import PointsEvaluator, points_array
+
+
+# Compiled functions by expression signature, ordered from least to
+# most recently used
+_lambdify_cache = OrderedDict()
+_lambdify_cache_size = 128
+
+# Source code of the NumPy functions for the names of MathFunction objects
+_math_function_code = {
+    "sqrt": "numpy.sqrt",
+    "exp": "numpy.exp",
+    "ln": "numpy.log",
+    "cos": "numpy.cos",
+    "sin": "numpy.sin",
+    "tan": "numpy.tan",
+    "cosh": "numpy.cosh",
+    "sinh": "numpy.sinh",
+    "tanh": "numpy.tanh",
+    "acos": "numpy.arccos",
+    "asin": "numpy.arcsin",
+    "atan": "numpy.arctan",
+    "erf": "math_functions['erf']",
+}
+
+# Names available to the generated code
+_namespace = {
+    "numpy": numpy,
+    "expand": evaluation.expand,
+    "indexed": evaluation.indexed,
+    "component_tensor": evaluation.component_tensor,
+    "index_sum": evaluation.index_sum,
+    "list_tensor": evaluation.list_tensor,
+    "bessel_function": evaluation.bessel_function,
+    "math_functions": evaluation.math_functions,
+}
+
+
+def set_lambdify_cache_size(size):
+    """Set the maximal number of functions compiled by lambdify which
+    are kept for reuse. Least recently used functions are evicted
+    first, size 0 disables the cache."""
+    global _lambdify_cache_size
+    if size < 0:
+        error("Expecting nonnegative cache size.")
+    _lambdify_cache_size = size
+    while len(_lambdify_cache) > size:
+        _lambdify_cache.popitem(last=False)
+
+
+def clear_lambdify_cache():
+    "Remove all functions compiled by lambdify from the cache."
+    _lambdify_cache.clear()
+
+
+class LambdaCodeGenerator(MultiFunction):
+    """Emit a line of code computing the value of each node, and
+    return the name of the variable holding it.
+
+    Terminals and derivatives of terminals are evaluated by the
+    terminal evaluator passed to the generated function. Counts of
+    free indices are renumbered in the order they are visited, so
+    expressions with the same signature get the same code."""
+
+    def __init__(self):
+        MultiFunction.__init__(self)
+        self.lines = []
+        self.terminals = []
+        self.index_numbering = {}
+
+    def _assign(self, code):
+        name = "v%d" % len(self.lines)
+        self.lines.append("%s = %s" % (name, code))
+        return name
+
+    def _indices(self, counts):
+        return tuple(self.index_numbering.setdefault(c, len(self.index_numbering))
+                     for c in counts)
+
+    def _expanded(self, o, *ops):
+        "Return code for the operands expanded to the free indices and rank of o."
+        fo = self._indices(o.ufl_free_indices)
+        rank = len(o.ufl_shape)
+        code = []
+        for op, v in zip(o.ufl_operands, ops):
+            fi = self._indices(op.ufl_free_indices)
+            if fi == fo and len(op.ufl_shape) == rank:
+                code.append(v)
+            else:
+                code.append("expand(%s, %r, %r, %d)" % (v, fi, fo, rank))
+        return code
+
+    def expr(self, o, *ops):
+        error("Code generation for %s not available." % o._ufl_class_.__name__)
+
+    # --- Terminals and their derivatives
+
+    def terminal(self, o):
+        self.terminals.append(o)
+        return self._assign("evaluate_terminal(terminals[%d])" % (len(self.terminals) - 1))
+
+    def zero(self, o):
+        # Created in the code rather than as a terminal, since the
+        # axes for its free indices must be ordered like in the code
+        shape = (1,) + o.ufl_shape + o.ufl_index_dimensions
+        return self._assign("numpy.zeros(%r)" % (shape,))
+
+    def grad(self, o):
+        return self.terminal(o)
+
+    reference_grad = grad
+
+    def multi_index(self, o):
+        return tuple(int(i) if isinstance(i, FixedIndex) else (self._indices((i.count(),))[0],)
+                     for i in o)
+
+    def label(self, o):
+        return None
+
+    # --- Algebra
+
+    def sum(self, o, a, b):
+        return self._assign("%s + %s" % (a, b))
+
+    def product(self, o, a, b):
+        return self._assign("%s*%s" % tuple(self._expanded(o, a, b)))
+
+    def division(self, o, a, b):
+        return self._assign("%s/%s" % tuple(self._expanded(o, a, b)))
+
+    def power(self, o, a, b):
+        return self._assign("%s**%s" % tuple(self._expanded(o, a, b)))
+
+    def abs(self, o, a):
+        return self._assign("numpy.abs(%s)" % a)
+
+    # --- Conditions
+
+    def _comparison(self, o, a, b, op):
+        a_op, b_op = o.ufl_operands
+        fa = self._indices(a_op.ufl_free_indices)
+        fb = self._indices(b_op.ufl_free_indices)
+        if fa != fb:
+            fo = self._indices(sorted(set(a_op.ufl_free_indices + b_op.ufl_free_indices)))
+            a = "expand(%s, %r, %r)" % (a, fa, fo)
+            b = "expand(%s, %r, %r)" % (b, fb, fo)
+        return self._assign("%s %s %s" % (a, op, b))
+
+    def eq(self, o, a, b):
+        return self._comparison(o, a, b, "==")
+
+    def ne(self, o, a, b):
+        return self._comparison(o, a, b, "!=")
+
+    def le(self, o, a, b):
+        return self._comparison(o, a, b, "<=")
+
+    def ge(self, o, a, b):
+        return self._comparison(o, a, b, ">=")
+
+    def lt(self, o, a, b):
+        return self._comparison(o, a, b, "<")
+
+    def gt(self, o, a, b):
+        return self._comparison(o, a, b, ">")
+
+    def and_condition(self, o, a, b):
+        return self._assign("numpy.logical_and(%s, %s)" % (a, b))
+
+    def or_condition(self, o, a, b):
+        return self._assign("numpy.logical_or(%s, %s)" % (a, b))
+
+    def not_condition(self, o, a):
+        return self._assign("numpy.logical_not(%s)" % a)
+
+    def conditional(self, o, c, t, f):
+        fo = self._indices(o.ufl_free_indices)
+        rank = len(o.ufl_shape)
+        if fo or rank:
+            c = "expand(%s, (), %r, %d)" % (c, fo, rank)
+        return self._assign("numpy.where(%s, %s, %s)" % (c, t, f))
+
+    def min_value(self, o, a, b):
+        return self._assign("numpy.minimum(%s, %s)" % tuple(self._expanded(o, a, b)))
+
+    def max_value(self, o, a, b):
+        return self._assign("numpy.maximum(%s, %s)" % tuple(self._expanded(o, a, b)))
+
+    # --- Functions
+
+    def math_function(self, o, a):
+        return self._assign("%s(%s)" % (_math_function_code[o._name], a))
+
+    def atan_2(self, o, a, b):
+        return self._assign("numpy.arctan2(%s, %s)" % tuple(self._expanded(o, a, b)))
+
+    def bessel_function(self, o, nu, a):
+        if isinstance(o.ufl_operands[0], IntValue):
+            nu = repr(int(o.ufl_operands[0]))
+        return self._assign("bessel_function(%r, %s, %s)" % (o._name, nu, a))
+
+    # --- Index notation
+
+    def indexed(self, o, A, ii):
+        fa = self._indices(o.ufl_operands[0].ufl_free_indices)
+        fo = self._indices(o.ufl_free_indices)
+        return self._assign("indexed(%s, %r, %r, %r)" % (A, fa, ii, fo))
+
+    def component_tensor(self, o, A, ii):
+        fa = self._indices(o.ufl_operands[0].ufl_free_indices)
+        fo = self._indices(o.ufl_free_indices)
+        ii = tuple(i[0] for i in ii)
+        return self._assign("component_tensor(%s, %r, %r, %r)" % (A, fa, ii, fo))
+
+    def index_sum(self, o, A, i):
+        A_op = o.ufl_operands[0]
+        fa = self._indices(A_op.ufl_free_indices)
+        fo = self._indices(o.ufl_free_indices)
+        return self._assign("index_sum(%s, %d, %r, %r)" % (A, len(A_op.ufl_shape), fa, fo))
+
+    def list_tensor(self, o, *ops):
+        return self._assign("list_tensor(%s)" % ", ".join(ops))
+
+    # --- Operators without effect on values
+
+    def variable(self, o, a, label):
+        return a
+
+    def restricted(self, o, a):
+        return a
+
+    def cell_avg(self, o, a):
+        return a
+
+    def facet_avg(self, o, a):
+        return a
+
+
+def generate_lambda_code(expression):
+    """Return the source code of a function evaluating expression,
+    and the list of terminals it takes values of.
+
+    The function takes the arguments (evaluate_terminal, terminals),
+    where evaluate_terminal(t) returns the value array of terminal t.
+    """
+    generator = LambdaCodeGenerator()
+    result = map_expr_dag(generator, expression)
+    lines = ["def evaluate(evaluate_terminal, terminals):"]
+    lines += ["    " + line for line in generator.lines]
+    lines += ["    return %s" % result]
+    return "\n".join(lines) + "\n", generator.terminals
+
+
+class TerminalCollector(MultiFunction):
+    "Collect the terminals in the order of LambdaCodeGenerator."
+
+    def __init__(self):
+        MultiFunction.__init__(self)
+        self.terminals = []
+
+    def expr(self, o, *ops):
+        return None
+
+    def terminal(self, o):
+        self.terminals.append(o)
+
+    def zero(self, o):
+        return None
+
+    def grad(self, o):
+        self.terminals.append(o)
+
+    reference_grad = grad
+
+    def multi_index(self, o):
+        return None
+
+    def label(self, o):
+        return None
+
+
+def _collect_terminals(expression):
+    collector = TerminalCollector()
+    map_expr_dag(collector, expression)
+    return collector.terminals
+
+
+def _expression_signature(expression):
+    renumbering = {}
+    for d in extract_domains(expression):
+        renumbering[d] = len(renumbering)
+    for c in extract_coefficients(expression):
+        renumbering[c] = len(renumbering)
+    return compute_expression_signature(expression, renumbering)
+
+
+class LambdifiedExpression(object):
+    """Callable evaluating an expression in arrays of points.
+
+    Call with an array of points with shape (N, gdim) and a mapping
+    like for ``evaluate_points``, returns an array with shape (N,) +
+    the shape of the expression."""
+
+    def __init__(self, expression, function, terminals, source):
+        self.expression = expression
+        self.function = function
+        self.terminals = terminals
+        self.source = source
+
+    def __call__(self, x, mapping=None):
+        x = points_array(x)
+        if mapping is None:
+            mapping = {}
+        v = self.function(PointsEvaluator(x, mapping), self.terminals)
+        return numpy.array(numpy.broadcast_to(v, (len(x),) + self.expression.ufl_shape))
+
+
+def lambdify(expression):
+    """Return a LambdifiedExpression evaluating expression with NumPy
+    in arrays of points.
+
+    Derivatives are expanded first. The generated function is cached
+    by the signature of the expression, see set_lambdify_cache_size."""
+    from ufl.algorithms.ad import expand_derivatives
+    expression = expand_derivatives(expression)
+    if expression.ufl_free_indices:
+        error("Cannot evaluate expression with free indices.")
+
+    signature = _expression_signature(expression)
+    cached = _lambdify_cache.get(signature)
+    if cached is None:
+        source, terminals = generate_lambda_code(expression)
+        namespace = dict(_namespace)
+        exec(compile(source, "<lambdify %s>" % signature[:16], "exec"), namespace)
+        cached = (namespace["evaluate"], source)
+        if _lambdify_cache_size:
+            _lambdify_cache[signature] = cached
+            if len(_lambdify_cache) > _lambdify_cache_size:
+                _lambdify_cache.popitem(last=False)
+    else:
+        _lambdify_cache.move_to_end(signature)
+        terminals = _collect_terminals(expression)
+    function, source = cached
+    return LambdifiedExpression(expression, function, terminals, source)
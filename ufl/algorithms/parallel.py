@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Utilities for applying algorithms to integrals in a pool of processes.
+
+Integrals are sent to the worker processes with their integrands in
+the ``ExprGraph`` array format. Arguments, coefficients, domains and
+subdomain data are replaced by plain UFL objects in the workers, which
+carry no solver data, and the results refer to the original objects
+again when they are received.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from ufl.core.multiindex import Index, MultiIndex
+from ufl.constantvalue import Zero
+from ufl.variable import Label
+from ufl.domain import Mesh
+from ufl.functionspace import FunctionSpace
+from ufl.argument import Argument
+from ufl.coefficient import Coefficient
+from ufl.integral import Integral
+from ufl.form import Form
+from ufl.algorithms.exprgraph import ExprGraph
+
+
+class SubdomainDataPlaceholder(object):
+    "Stands in for subdomain data objects in worker processes."
+
+    def __init__(self, ufl_id):
+        self._ufl_id = ufl_id
+
+    def ufl_id(self):
+        return self._ufl_id
+
+
+class _Pickler(pickle.Pickler):
+    "Pickler storing the given objects by their position."
+
+    def __init__(self, file, objects):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self._positions = dict((id(o), k) for k, o in enumerate(objects))
+
+    def persistent_id(self, obj):
+        return self._positions.get(id(obj))
+
+
+class _Unpickler(pickle.Unpickler):
+    "Unpickler replacing positions stored by _Pickler with the given objects."
+
+    def __init__(self, file, objects):
+        pickle.Unpickler.__init__(self, file)
+        self._objects = objects
+
+    def persistent_load(self, pid):
+        return self._objects[pid]
+
+
+def _dumps_integrals(integrals, objects):
+    graph = ExprGraph(integrals)
+    properties = [(itg.integral_type(), itg.ufl_domain(), itg.subdomain_id(),
+                   itg.metadata(), itg.subdomain_data())
+                  for itg in integrals]
+    f = io.BytesIO()
+    _Pickler(f, objects).dump((graph, properties))
+    return f.getvalue()
+
+
+def _loads_integrals(data, objects, counts=None):
+    graph, properties = _Unpickler(io.BytesIO(data), objects).load()
+    if counts is not None:
+        graph.terminals = _renumber_terminals(graph.terminals, counts)
+    return [Integral(integrand, *p)
+            for integrand, p in zip(graph.expressions(), properties)]
+
+
+def _renumber_terminals(terminals, counts):
+    """Give the indices and labels with counts from counts and up,
+    which were created in a worker process, new counts in this process.
+
+    The new counts have the same order as the old ones, such that
+    operands are sorted the same way."""
+    index_counts = set()
+    label_counts = set()
+    for t in terminals:
+        if isinstance(t, MultiIndex):
+            index_counts.update(i.count() for i in t.indices() if isinstance(i, Index))
+        elif isinstance(t, Zero):
+            index_counts.update(t.ufl_free_indices)
+        elif isinstance(t, Label):
+            label_counts.add(t.count())
+    indices = dict((c, Index()) for c in sorted(index_counts) if c >= counts[0])
+    labels = dict((c, Label()) for c in sorted(label_counts) if c >= counts[1])
+    if not (indices or labels):
+        return terminals
+
+    renumbered = []
+    for t in terminals:
+        if isinstance(t, MultiIndex):
+            t = MultiIndex(tuple(indices.get(i.count(), i) if isinstance(i, Index) else i
+                                 for i in t.indices()))
+        elif isinstance(t, Zero) and t.ufl_free_indices:
+            fi = tuple(indices[c].count() if c in indices else c
+                       for c in t.ufl_free_indices)
+            t = Zero(t.ufl_shape, fi, t.ufl_index_dimensions)
+        elif isinstance(t, Label):
+            t = labels.get(t.count(), t)
+        renumbered.append(t)
+    return renumbered
+
+
+def _surrogates(integrals):
+    """Return the objects of the integrals which are replaced in the
+    worker processes, and their replacements."""
+    form = Form(integrals)
+    objects = []
+    surrogates = []
+
+    domains = {}
+    for d in form.ufl_domains() + tuple(f.ufl_domain() for f in
+                                        form.arguments() + form.coefficients()):
+        if d is not None and id(d) not in domains:
+            # Subclasses may hold solver data which cannot be pickled
+            if isinstance(d, Mesh):
+                s = Mesh(d.ufl_coordinate_element(), ufl_id=d.ufl_id())
+            else:
+                s = d
+            domains[id(d)] = s
+            objects.append(d)
+            surrogates.append(s)
+
+    for f in form.arguments() + form.coefficients():
+        V = f.ufl_function_space()
+        if isinstance(V, FunctionSpace):
+            d = V.ufl_domain()
+            V = FunctionSpace(None if d is None else domains[id(d)], V.ufl_element())
+            if isinstance(f, Argument):
+                s = Argument(V, f.number(), f.part())
+            else:
+                s = Coefficient(V, count=f.count())
+        else:
+            s = f
+        objects.append(f)
+        surrogates.append(s)
+
+    for itg in integrals:
+        sd = itg.subdomain_data()
+        if sd is not None and not any(sd is o for o in objects):
+            objects.append(sd)
+            surrogates.append(SubdomainDataPlaceholder(sd.ufl_id()))
+
+    return objects, surrogates
+
+
+def _global_counts():
+    return (Index._globalcount, Label._globalcount)
+
+
+def _update_global_counts(counts):
+    # New indices and labels must not get the counts of existing ones
+    Index._globalcount = max(Index._globalcount, counts[0])
+    Label._globalcount = max(Label._globalcount, counts[1])
+
+
+def _process_integrals(function, args, surrogates_data, integrals_data, counts):
+    "Apply function to the integrals in a worker process."
+    _update_global_counts(counts)
+    surrogates = pickle.loads(surrogates_data)
+    integrals = _loads_integrals(integrals_data, surrogates)
+    integrals = function(integrals, *args)
+    return _dumps_integrals(integrals, surrogates)
+
+
+def map_integrals_in_processes(function, integrals, args=(), num_processes=None):
+    """Apply function to each integral in a pool of processes.
+
+    The call function([integral], *args) must return a list of
+    integrals, and both function and args must be picklable. Returns
+    the concatenation of the returned lists, in the order of the
+    input integrals.
+    """
+    integrals = list(integrals)
+    if not integrals:
+        return []
+    objects, surrogates = _surrogates(integrals)
+    surrogates_data = pickle.dumps(surrogates, pickle.HIGHEST_PROTOCOL)
+    counts = _global_counts()
+
+    with ProcessPoolExecutor(num_processes) as executor:
+        futures = [executor.submit(_process_integrals, function, args,
+                                   surrogates_data,
+                                   _dumps_integrals([itg], objects),
+                                   counts)
+                   for itg in integrals]
+        results = [future.result() for future in futures]
+
+    # Renumber indices created in the workers in the order of the
+    # integrals, like in serial processing
+    processed = []
+    for data in results:
+        processed.extend(_loads_integrals(data, objects, counts))
+    return processed
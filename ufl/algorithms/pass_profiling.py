@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""Instrumentation of the passes applied to forms by compute_form_data.
+
+Within a ``profile_passes`` context, ``compute_form_data`` records the
+wall time, the number of unique nodes and the tree size of the
+integrands before and after, and optionally the memory allocated, for
+each pass it applies. The passes applied to each integral separately
+are recorded per integral. The records of each call are attached to
+the resulting ``FormData`` as ``pass_profile`` and can be exported as
+JSON. Within a ``profile_allocations`` context, the objects created by
+each pass are counted as well, see ``ufl.algorithms.allocation_profiling``.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from ufl.form import Form
+from ufl.tracing import trace_span
+from ufl.algorithms.ssa import SSAList
+from ufl.algorithms.allocation_profiling import active_allocation_profiler
+
+
+# Stack of the profilers of the active profile_passes contexts
+_active_profilers = []
+
+
+class PassRecord(object):
+    """Measurements of one application of a pass.
+
+    *Attributes*
+        ``name``
+            Name of the pass.
+        ``integral_type``, ``subdomain_id``
+            The integral the pass was applied to, or None for passes
+            applied to the whole form.
+        ``time``
+            Wall time in seconds.
+        ``nodes_before``, ``nodes_after``
+            Number of unique nodes of the integrands.
+        ``tree_size_before``, ``tree_size_after``
+            Number of nodes in the tree representation of the
+            integrands.
+        ``memory_delta``, ``peak_memory_delta``
+            Change of the memory traced by ``tracemalloc`` in bytes,
+            at the end of the pass and at its peak during the pass,
+            or None if memory is not traced.
+    """
+
+    _fields = ("name", "integral_type", "subdomain_id", "time",
+               "nodes_before", "nodes_after",
+               "tree_size_before", "tree_size_after",
+               "memory_delta", "peak_memory_delta")
+
+    def __init__(self, **kwargs):
+        for name in self._fields:
+            setattr(self, name, kwargs.get(name))
+
+    def as_dict(self):
+        "Return the measurements as a dict."
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+
+class PassProfile(object):
+    "The list of PassRecord objects of one call to compute_form_data."
+
+    def __init__(self, callback=None):
+        self.records = []
+        self.callback = callback
+
+        # The integral the passes are currently applied to
+        self.integral_type = None
+        self.subdomain_id = None
+
+    def add(self, record):
+        "Append record and pass it to the callback."
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def total_time(self):
+        "Return the sum of the wall times of the passes."
+        return sum(r.time for r in self.records)
+
+    def as_dict(self):
+        "Return a dict with the records as dicts and the total time."
+        return {"total_time": self.total_time(),
+                "passes": [r.as_dict() for r in self.records]}
+
+    def to_json(self, **kwargs):
+        "Return the profile as a JSON string, passing kwargs to json.dumps."
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __str__(self):
+        header = ("Pass", "Integral", "Time (s)", "Nodes", "Tree size")
+        lines = ["%-28s %-24s %10s %10s %10s" % header]
+        for r in self.records:
+            if r.integral_type is None:
+                integral = ""
+            else:
+                integral = "%s %s" % (r.integral_type, r.subdomain_id)
+            lines.append("%-28s %-24s %10.4f %10d %10d" % (r.name, integral[:24], r.time,
+                                                           r.nodes_after, r.tree_size_after))
+        lines.append("%-28s %-24s %10.4f" % ("Total", "", self.total_time()))
+        return "\n".join(lines)
+
+
+class PassProfiler(object):
+    "The PassProfile objects of the calls to compute_form_data in a profile_passes context."
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.profiles = []
+
+    def new_profile(self):
+        "Return a new PassProfile for a call to compute_form_data."
+        profile = PassProfile(self.callback)
+        self.profiles.append(profile)
+        return profile
+
+    def to_json(self, **kwargs):
+        "Return the profiles as a JSON list, passing kwargs to json.dumps."
+        return json.dumps([p.as_dict() for p in self.profiles], **kwargs)
+
+
+@contextmanager
+def profile_passes(callback=None, trace_memory=False):
+    """Record the passes applied by compute_form_data in this context.
+
+    Yields a PassProfiler collecting a PassProfile for each call. The
+    FormData cache is bypassed within the context, such that all
+    passes are applied, and integrals are transformed serially.
+
+    If callback is given, it is called with each PassRecord. If
+    trace_memory is true, memory allocations are traced with
+    tracemalloc during the context, which slows down the passes.
+    """
+    profiler = PassProfiler(callback)
+    start_tracing = trace_memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    _active_profilers.append(profiler)
+    try:
+        yield profiler
+    finally:
+        _active_profilers.pop()
+        if start_tracing:
+            tracemalloc.stop()
+
+
+def active_pass_profiler():
+    "Return the PassProfiler of the innermost profile_passes context, or None."
+    return _active_profilers[-1] if _active_profilers else None
+
+
+def _form_sizes(form):
+    "Return the number of unique nodes and the tree size of the integrands of form."
+    ssa = SSAList(form)
+    sizes = ssa.tree_sizes()
+    return len(ssa), sum(sizes[i] for i in ssa.roots)
+
+
+def run_pass(profile, name, function, form, *args):
+    """Return function(form, *args), adding a PassRecord with the given
+    name to profile unless profile is None. If allocations are
+    profiled, the objects created are counted in a section with the
+    given name. If tracing is active, the pass is traced as a span
+    with the given name, see ufl.tracing."""
+    with trace_span(name, "compute_form_data", _integral_args(profile)):
+        allocations = active_allocation_profiler()
+        if allocations is not None:
+            with allocations.section(name):
+                return _run_pass(profile, name, function, form, *args)
+        return _run_pass(profile, name, function, form, *args)
+
+
+def _integral_args(profile):
+    "Return the integral of the passes recorded in profile as trace event args, or None."
+    if profile is None or profile.integral_type is None:
+        return None
+    return {"integral_type": profile.integral_type,
+            "subdomain_id": str(profile.subdomain_id)}
+
+
+def _run_pass(profile, name, function, form, *args):
+    if profile is None:
+        return function(form, *args)
+
+    nodes_before, tree_size_before = _form_sizes(form)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        memory_before = tracemalloc.get_traced_memory()[0]
+        reset_peak = getattr(tracemalloc, "reset_peak", None)
+        if reset_peak is not None:
+            reset_peak()
+
+    t0 = time.perf_counter()
+    result = function(form, *args)
+    t1 = time.perf_counter()
+
+    memory_delta = None
+    peak_memory_delta = None
+    if tracing:
+        memory, peak = tracemalloc.get_traced_memory()
+        memory_delta = memory - memory_before
+        if reset_peak is not None:
+            peak_memory_delta = peak - memory_before
+
+    if isinstance(result, Form):
+        nodes_after, tree_size_after = _form_sizes(result)
+    else:
+        nodes_after, tree_size_after = nodes_before, tree_size_before
+
+    profile.add(PassRecord(name=name,
+                           integral_type=profile.integral_type,
+                           subdomain_id=profile.subdomain_id,
+                           time=t1 - t0,
+                           nodes_before=nodes_before, nodes_after=nodes_after,
+                           tree_size_before=tree_size_before,
+                           tree_size_after=tree_size_after,
+                           memory_delta=memory_delta,
+                           peak_memory_delta=peak_memory_delta))
+    return result
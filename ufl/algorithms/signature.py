@@ -1,5 +1,16 @@
 # -*- coding: utf-8 -*-
-"""Signature computation for forms."""
+"""Signature computation for forms.
+
+Signatures are computed from a canonical digest of each unique node
+of the integrands, so the cost is linear in the size of the expression
+DAG also when subexpressions are shared. The canonical digests of the
+integrands are cached by the structural digests of the integrands,
+which are stored on the nodes, and the renumbering, so signing another
+form with the same integrands and coefficients does not traverse them
+again. Set ``legacy_signatures`` to True, or pass ``legacy=True``, to
+reproduce the signatures computed by UFL 2017.2, which hash the prefix
+notation of the expression trees.
+"""
 
 # Copyright (C) 2012-2016 Martin Sandve Alnæs
 #
@@ -19,16 +30,29 @@
 # along with UFL. If not, see <http://www.gnu.org/licenses/>.
 
 import hashlib
+from collections import OrderedDict
+
 from ufl.classes import (Label,
                          Index, MultiIndex,
                          Coefficient, Argument,
                          GeometricQuantity, ConstantValue,
                          ExprList, ExprMapping)
 from ufl.log import error
-from ufl.corealg.traversal import traverse_unique_terminals, pre_traversal
+from ufl.corealg.traversal import traverse_unique_terminals, pre_traversal, unique_post_traversal
+from ufl.core.compute_expr_digest import compute_digest, compute_expr_digest
 from ufl.algorithms.domain_analysis import canonicalize_metadata
 
 
+# Default for the legacy argument of the signature functions
+legacy_signatures = False
+
+# Canonical digests of the integrands of signed forms, keyed by the
+# structural digests of the integrands and the renumbering and ordered
+# from least to most recently used
+_integrand_digest_cache = OrderedDict()
+_integrand_digest_cache_size = 256
+
+
 def compute_multiindex_hashdata(expr, index_numbering):
     data = []
     for i in expr:
@@ -118,30 +142,126 @@ def compute_expression_hashdata(expression, terminal_hashdata):
     return expression_hashdata
 
 
-def compute_expression_signature(expr, renumbering):  # FIXME: Fix callers
+def compute_expression_digests(expressions, terminal_hashdata):
+    """Compute canonical digests of all unique nodes in the given expressions.
+
+    The digest of a terminal is computed from its hashdata, the digest
+    of an operator from its type and the digests of its operands.
+    Each unique node is visited once. Returns a dict mapping each node
+    to its digest.
+    """
+    digests = {}
+    visited = set()
+    for expression in expressions:
+        for expr in unique_post_traversal(expression, visited):
+            if expr._ufl_is_terminal_:
+                data = str(terminal_hashdata[expr]).encode("utf-8")
+                digests[expr] = compute_digest(data)
+            else:
+                name = expr._ufl_class_.__name__.encode("utf-8")
+                digests[expr] = compute_digest(name, b"\0",
+                                               *[digests[o] for o in expr.ufl_operands])
+    return digests
+
+
+def compute_expression_signature(expr, renumbering, legacy=None):  # FIXME: Fix callers
     # FIXME: Rewrite in terms of compute_form_signature?
+    if legacy is None:
+        legacy = legacy_signatures
 
     # Build hashdata for all terminals first
     terminal_hashdata = compute_terminal_hashdata([expr], renumbering)
 
-    # Build hashdata for full expression
-    expression_hashdata = compute_expression_hashdata(expr, terminal_hashdata)
+    if legacy:
+        # Build hashdata for full expression
+        expression_hashdata = compute_expression_hashdata(expr, terminal_hashdata)
 
-    # Pass it through a seriously overkill hashing algorithm
-    # (should we use sha1 instead?)
-    data = str(expression_hashdata).encode("utf-8")
-    return hashlib.sha512(data).hexdigest()
+        # Pass it through a seriously overkill hashing algorithm
+        # (should we use sha1 instead?)
+        data = str(expression_hashdata).encode("utf-8")
+        return hashlib.sha512(data).hexdigest()
 
+    digests = compute_expression_digests([expr], terminal_hashdata)
+    return hashlib.sha512(digests[expr]).hexdigest()
 
-def compute_form_signature(form, renumbering):  # FIXME: Fix callers
-    # Extract integrands
-    integrals = form.integrals()
-    integrands = [integral.integrand() for integral in integrals]
+
+def _renumbering_key(renumbering):
+    "Return a hashable representation of renumbering."
+    return tuple(sorted((v, repr(k)) for k, v in renumbering.items()))
+
+
+def compute_integrand_digests(integrands, renumbering):
+    """Return the canonical digests of the given integrands.
+
+    The canonical digest of an integrand depends only on its
+    structure, its terminals and the renumbering, which are all
+    reflected in the structural digests memorized on each node by
+    ``compute_expr_digest``. The results are therefore cached by the
+    structural digests and the renumbering.
+    """
+    key = (tuple(compute_expr_digest(e) for e in integrands),
+           _renumbering_key(renumbering))
+    digests = _integrand_digest_cache.get(key)
+    if digests is not None:
+        _integrand_digest_cache.move_to_end(key)
+        return digests
 
     # Build hashdata for all terminals first, with on-the-fly
     # replacement of functions and index labels.
     terminal_hashdata = compute_terminal_hashdata(integrands, renumbering)
 
+    # Digest each unique node of the integrands once, shared
+    # subexpressions get the same digest in all integrals
+    node_digests = compute_expression_digests(integrands, terminal_hashdata)
+    digests = [node_digests[e] for e in integrands]
+
+    _integrand_digest_cache[key] = digests
+    if len(_integrand_digest_cache) > _integrand_digest_cache_size:
+        _integrand_digest_cache.popitem(last=False)
+    return digests
+
+
+def compute_form_signature(form, renumbering, legacy=None):  # FIXME: Fix callers
+    if legacy is None:
+        legacy = legacy_signatures
+
+    # Extract integrands
+    integrals = form.integrals()
+    integrands = [integral.integrand() for integral in integrals]
+
+    if legacy:
+        # Build hashdata for all terminals first, with on-the-fly
+        # replacement of functions and index labels.
+        terminal_hashdata = compute_terminal_hashdata(integrands, renumbering)
+        return _compute_legacy_form_signature(integrals, terminal_hashdata,
+                                              renumbering)
+
+    digests = compute_integrand_digests(integrands, renumbering)
+
+    # Feed the data of each integral to the hash as we go instead
+    # of building the complete data first
+    h = hashlib.sha512()
+    for integral, digest in zip(integrals, digests):
+        # Collect all data about integral that should be reflected in
+        # signature, including compiler data but not domain data,
+        # because compiler data affects the way the integral is
+        # compiled while domain data is only carried for convenience
+        # in the problem solving environment.
+        integral_hashdata = (
+            digest,
+            integral.ufl_domain()._ufl_signature_data_(renumbering),
+            integral.integral_type(),
+            integral.subdomain_id(),
+            canonicalize_metadata(integral.metadata()),
+        )
+        # The repr of the tuple never contains a newline
+        h.update(repr(integral_hashdata).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def _compute_legacy_form_signature(integrals, terminal_hashdata, renumbering):
+    "Compute the form signature from the prefix notation of the integrands."
     # Build hashdata for each integral
     hashdata = []
     for integral in integrals:
@@ -151,11 +271,6 @@ def compute_form_signature(form, renumbering):  # FIXME: Fix callers
 
         domain_hashdata = integral.ufl_domain()._ufl_signature_data_(renumbering)
 
-        # Collect all data about integral that should be reflected in
-        # signature, including compiler data but not domain data,
-        # because compiler data affects the way the integral is
-        # compiled while domain data is only carried for convenience
-        # in the problem solving environment.
         integral_hashdata = (
             integrand_hashdata,
             domain_hashdata,
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Algorithm for simplifying expressions by folding constants and
+removing operations without effect."""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+from ufl.core.multiindex import FixedIndex, MultiIndex
+from ufl.constantvalue import ScalarValue, Zero, as_ufl
+from ufl.algebra import Sum, Product, Division, Abs
+from ufl.indexed import Indexed
+from ufl.tensors import ListTensor
+from ufl.conditional import BinaryCondition, AndCondition, OrCondition, NotCondition
+from ufl.corealg.multifunction import MultiFunction
+from ufl.algorithms.map_integrands import map_integrand_dags
+
+
+def _flatten(cls, operands):
+    """Return the operands of the tree of nested cls objects with the
+    given operands, split into a list of the values of ScalarValue
+    objects, a list of the values of constant divisors and a list of
+    the other operands.
+
+    For products, divisions by constants are included in the tree and
+    their divisors collected separately."""
+    constants = []
+    divisors = []
+    others = []
+    stack = list(reversed(operands))
+    while stack:
+        t = stack.pop()
+        if isinstance(t, cls):
+            stack.extend(reversed(t.ufl_operands))
+        elif isinstance(t, ScalarValue):
+            constants.append(t._value)
+        elif (cls is Product and isinstance(t, Division) and
+              isinstance(t.ufl_operands[1], ScalarValue)):
+            n, d = t.ufl_operands
+            divisors.append(d._value)
+            stack.append(n)
+        else:
+            others.append(t)
+    return constants, divisors, others
+
+
+def _exact_quotient(n, d):
+    """Return n/d if it can be folded without changing the value of
+    an expression, otherwise None.
+
+    Integer constants are only folded if d divides n, such that they
+    are never replaced by rounded floating point values."""
+    if d == 0:
+        return None
+    if isinstance(n, int) and isinstance(d, int):
+        return n // d if n % d == 0 else None
+    return n / d
+
+
+def _is_scalar_constant(o):
+    return isinstance(o, ScalarValue) or (isinstance(o, Zero) and
+                                          not o.ufl_shape and
+                                          not o.ufl_free_indices)
+
+
+def _condition_value(c):
+    """Return the value of condition c if it only depends on constant
+    scalar values, otherwise None."""
+    if isinstance(c, (AndCondition, OrCondition)):
+        a, b = [_condition_value(op) for op in c.ufl_operands]
+        # Shortcut if one of the operands decides the value
+        decisive = isinstance(c, OrCondition)
+        if a is decisive or b is decisive:
+            return decisive
+        if a is None or b is None:
+            return None
+        return not decisive
+    elif isinstance(c, NotCondition):
+        a = _condition_value(c.ufl_operands[0])
+        return None if a is None else not a
+    elif isinstance(c, BinaryCondition):
+        if all(_is_scalar_constant(op) for op in c.ufl_operands):
+            return bool(c.evaluate(None, {}, (), None))
+    return None
+
+
+class Simplifier(MultiFunction):
+    """Fold constants in sums and products, select known components
+    of list tensors and remove conditionals with known conditions.
+
+    Operators are otherwise reconstructed with simplified operands,
+    which applies the simplifications of their constructors."""
+
+    expr = MultiFunction.reuse_if_untouched
+
+    def dag_cache_key(self):
+        return ()
+
+    def terminal(self, o):
+        return o
+
+    def sum(self, o, a, b):
+        constants, divisors, others = _flatten(Sum, (a, b))
+        if len(constants) < 2:
+            return self.reuse_if_untouched(o, a, b)
+        # Place the folded constant at the top
+        r = others[0]
+        for t in others[1:]:
+            r = Sum(r, t)
+        return Sum(as_ufl(sum(constants)), r)
+
+    def _product(self, o, constants, divisors, others):
+        """Return the product of the constants and others divided by
+        the divisors with constants folded, or None if nothing can be
+        folded."""
+        value = 1
+        for c in constants:
+            value *= c
+        # Divide by the constant divisors where the quotient is
+        # exact, and keep a single division by the remaining ones
+        divisor = 1
+        remaining = 0
+        for d in divisors:
+            q = _exact_quotient(value, d)
+            if q is None:
+                divisor *= d
+                remaining += 1
+            else:
+                value = q
+        if len(constants) < 2 and remaining == len(divisors) < 2:
+            return None
+        if value == 0:
+            return Zero((), o.ufl_free_indices, o.ufl_index_dimensions)
+        r = others[0]
+        for t in others[1:]:
+            r = Product(r, t)
+        r = Product(as_ufl(value), r)
+        if divisor != 1:
+            r = Division(r, as_ufl(divisor))
+        return r
+
+    def product(self, o, a, b):
+        constants, divisors, others = _flatten(Product, (a, b))
+        r = self._product(o, constants, divisors, others)
+        if r is None:
+            return self.reuse_if_untouched(o, a, b)
+        return r
+
+    def division(self, o, a, b):
+        if isinstance(b, ScalarValue):
+            constants, divisors, others = _flatten(Product, (a,))
+            if others:
+                # (c1*x) / c2 -> (c1/c2)*x where c1/c2 is exact
+                r = self._product(o, constants, divisors + [b._value], others)
+                if r is not None:
+                    return r
+        return self.reuse_if_untouched(o, a, b)
+
+    def abs(self, o, a):
+        if isinstance(a, ScalarValue):
+            return as_ufl(abs(a._value))
+        if isinstance(a, Abs):
+            return a
+        return self.reuse_if_untouched(o, a)
+
+    def _min_max(self, o, a, b, op):
+        if isinstance(a, ScalarValue) and isinstance(b, ScalarValue):
+            return as_ufl(op(a._value, b._value))
+        return self.reuse_if_untouched(o, a, b)
+
+    def min_value(self, o, a, b):
+        return self._min_max(o, a, b, min)
+
+    def max_value(self, o, a, b):
+        return self._min_max(o, a, b, max)
+
+    def conditional(self, o, c, t, f):
+        if t == f:
+            return t
+        value = _condition_value(c)
+        if value is not None:
+            return t if value else f
+        return self.reuse_if_untouched(o, c, t, f)
+
+    def indexed(self, o, A, ii):
+        indices = ii.indices()
+        while isinstance(A, ListTensor) and indices and isinstance(indices[0], FixedIndex):
+            A = A.ufl_operands[int(indices[0])]
+            indices = indices[1:]
+        if not indices:
+            return A
+        if len(indices) < len(ii):
+            return Indexed(A, MultiIndex(indices))
+        return self.reuse_if_untouched(o, A, ii)
+
+
+def simplify(expr):
+    """Simplify the integrands of a form, or an expression, by folding
+    constants in sums, products and divisions, selecting known
+    components of list tensors and removing conditionals with known
+    conditions and equal branches."""
+    return map_integrand_dags(Simplifier(), expr)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Flattening of expression DAGs into lists of unique nodes.
+
+The ``SSAList`` of a form or expression holds each structurally unique
+subexpression of all integrands once, in an order where operands come
+before the nodes using them, with the number of references to each
+node. This is the usual input of common subexpression elimination in
+code generators.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+
+from ufl.corealg.multifunction import MultiFunction
+from ufl.algorithms.exprgraph import ExprGraph
+from ufl.algorithms.map_integrands import map_integrand_dags
+from ufl.conditional import Condition
+from ufl.variable import Variable, Label
+from ufl.exprcontainers import ExprList, ExprMapping
+
+
+class SSAList(ExprGraph):
+    """Topologically ordered list of the unique nodes of one or more expressions.
+
+    This is an ``ExprGraph`` with the number of references to each
+    node. The ``nodes`` list holds the unique subexpressions, with the
+    operands of a node before the node itself, and structurally equal
+    subexpressions of different integrands stored once.
+
+    *Attributes*
+        ``reference_counts``
+            List with the number of references to each node, as an
+            operand of the nodes in the list or as a root.
+    """
+
+    def __init__(self, a):
+        "Build list from a Form, Integral or Expr, or a list of these."
+        ExprGraph.__init__(self, a)
+        counts = self.parent_counts()
+        numpy.add.at(counts, self.roots, 1)
+        self.reference_counts = counts.tolist()
+
+    def shared_nodes(self, min_count=2):
+        """Return list of positions of the operator nodes which are
+        referenced at least min_count times."""
+        return [i for i, v in enumerate(self.nodes)
+                if not v._ufl_is_terminal_ and self.reference_counts[i] >= min_count]
+
+    def redundancy(self):
+        """Return the ratio of the number of nodes in the tree
+        representation of the roots to the number of unique nodes."""
+        if not self.nodes:
+            return 1.0
+        sizes = self.tree_sizes()
+        return float(sum(sizes[i] for i in self.roots)) / len(self.nodes)
+
+
+def compute_ssa_list(a):
+    "Return the SSAList of a Form, Integral or Expr, or a list of these."
+    return SSAList(a)
+
+
+def _can_wrap(o):
+    "Return if o can be replaced by a Variable without changing its meaning."
+    return not (o._ufl_is_terminal_ or o._ufl_is_terminal_modifier_ or
+                o.ufl_free_indices or
+                isinstance(o, (Variable, Condition, ExprList, ExprMapping)))
+
+
+class SharedSubexpressionWrapper(MultiFunction):
+    """Wrap the given subexpressions in Variable objects, with one
+    Label for each subexpression across all expressions."""
+
+    def __init__(self, shared):
+        MultiFunction.__init__(self)
+        self.shared = shared
+        self.labels = {}
+
+    def operator(self, o, *ops):
+        r = self.reuse_if_untouched(o, *ops)
+        if o in self.shared:
+            label = self.labels.get(o)
+            if label is None:
+                label = Label()
+                self.labels[o] = label
+            r = Variable(r, label)
+        return r
+
+    def terminal(self, o):
+        return o
+
+
+def wrap_shared_subexpressions(a, min_count=2):
+    """Wrap the subexpressions of a Form, Integral or Expr which are
+    referenced at least min_count times, counted across all
+    integrands, in Variable objects.
+
+    Structurally equal subexpressions get the same Label. Terminals,
+    terminal modifiers, conditions and expressions with free indices
+    are not wrapped.
+    """
+    ssa = SSAList(a)
+    shared = set(ssa.nodes[i] for i in ssa.shared_nodes(min_count)
+                 if _can_wrap(ssa.nodes[i]))
+    return map_integrand_dags(SharedSubexpressionWrapper(shared), a)
@@ -29,6 +29,10 @@ from ufl.classes import Variable, all_ufl_classes
 from ufl.algorithms.map_integrands import map_integrands
 
 
+# Marker for cache misses, results may be None
+_missing = object()
+
+
 def is_post_handler(function):
     "Is this a handler that expects transformed children as input?"
     insp = getargspec(function)
@@ -39,9 +43,18 @@ def is_post_handler(function):
 
 class Transformer(object):
     """Base class for a visitor-like algorithm design pattern used to
-    transform expression trees from one representation to another."""
+    transform expression trees from one representation to another.
+
+    Subclasses whose handler results depend only on the visited node,
+    and not on state pushed by handlers of its ancestors, can set
+    ``_memoize_visits = True`` to transform shared subexpressions
+    only once.
+    """
     _handlers_cache = {}
 
+    # Cache the result of visiting each unique node
+    _memoize_visits = False
+
     def __init__(self, variable_cache=None):
         if variable_cache is None:
             variable_cache = {}
@@ -74,6 +87,9 @@ class Transformer(object):
         # backtracking
         self._visit_stack = []
 
+        # Cache of visit results
+        self._visit_cache = {} if self._memoize_visits else None
+
     def print_visit_stack(self):
         print("/"*80)
         print("Visit stack in Transformer:")
@@ -86,30 +102,68 @@ class Transformer(object):
         print("\\"*80)
 
     def visit(self, o):
-        # Update stack
-        self._visit_stack.append(o)
+        """Transform *o* and return the result.
+
+        Handlers expecting transformed children are applied using an
+        explicit stack instead of recursion, so only handlers that
+        visit their own children recurse into ``visit``.  If the class
+        sets ``_memoize_visits`` the result for each unique node is
+        cached and reused.
+        """
+        cache = self._visit_cache
+        if cache is not None:
+            r = cache.get(o, _missing)
+            if r is not _missing:
+                return r
+        handlers = self._handlers
+        visit_stack = self._visit_stack
 
         # Get handler for the UFL class of o (type(o) may be an
         # external subclass of the actual UFL class)
-        h, visit_children_first = self._handlers[o._ufl_typecode_]
-
-        # if not h:
-        #    # Failed to find a handler! Should never happen, but will happen if a non-Expr object is visited.
-        #    error("Can't handle objects of type %s" % str(type(o)))
+        h, visit_children_first = handlers[o._ufl_typecode_]
 
-        # Is this a handler that expects transformed children as
-        # input?
-        if visit_children_first:
-            # Yes, visit all children first and then call h.
-            r = h(o, *[self.visit(op) for op in o.ufl_operands])
-        else:
-            # No, this is a handler that handles its own children
-            # (arguments self and o, where self is already bound)
+        # This is a handler that handles its own children (arguments
+        # self and o, where self is already bound)
+        if not visit_children_first:
+            visit_stack.append(o)
             r = h(o)
-
-        # Update stack and return
-        self._visit_stack.pop()
-        return r
+            visit_stack.pop()
+            if cache is not None:
+                cache[o] = r
+            return r
+
+        # Otherwise visit all children first and then call h, each
+        # stack entry holds (expr, handler, operands, results)
+        visit_stack.append(o)
+        stack = [(o, h, o.ufl_operands, [])]
+        while True:
+            e, h, ops, results = stack[-1]
+            n = len(results)
+            if n < len(ops):
+                # Visit next child
+                c = ops[n]
+                if cache is not None:
+                    r = cache.get(c, _missing)
+                    if r is not _missing:
+                        results.append(r)
+                        continue
+                hc, post = handlers[c._ufl_typecode_]
+                visit_stack.append(c)
+                if post:
+                    stack.append((c, hc, c.ufl_operands, []))
+                    continue
+                r = hc(c)
+            else:
+                # All children visited, call the handler
+                r = h(e, *results)
+                stack.pop()
+                c = e
+            visit_stack.pop()
+            if cache is not None:
+                cache[c] = r
+            if not stack:
+                return r
+            stack[-1][3].append(r)
 
     def undefined(self, o):
         "Trigger error."
@@ -214,6 +268,8 @@ class CopyTransformer(Transformer):
 
 
 class VariableStripper(ReuseTransformer):
+    _memoize_visits = True
+
     def __init__(self):
         ReuseTransformer.__init__(self)
 
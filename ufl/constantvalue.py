@@ -28,6 +28,7 @@ from ufl.core.expr import Expr
 from ufl.core.terminal import Terminal
 from ufl.core.multiindex import Index, FixedIndex
 from ufl.core.ufl_type import ufl_type
+from ufl.core.compute_expr_digest import compute_digest
 
 # --- Helper functions imported here for compatibility---
 from ufl.checks import is_python_scalar, is_ufl_scalar, is_true_ufl_scalar  # noqa: F401
@@ -237,6 +238,15 @@ class ScalarValue(ConstantValue):
         else:
             return False
 
+    def _ufl_compute_digest_(self):
+        "Digest of the exact value, the repr may be rounded to the UFL precision."
+        value = self._value
+        if value == 0:
+            # Equal values must have equal digests, e.g. 0.0 and -0.0
+            value = type(value)(0)
+        r = "%s(%r)" % (type(self).__name__, value)
+        return compute_digest(r.encode("utf-8"))
+
     def __str__(self):
         return str(self._value)
 
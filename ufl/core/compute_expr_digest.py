@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Non-recursive traversal-based structural digest computation algorithm.
+
+The digest of an ``Expr`` is a 128-bit value computed from the digests
+of its operands (a Merkle tree), and from the repr string for
+terminals.  Unlike the Python hash, it does not depend on
+``PYTHONHASHSEED`` and can be compared across processes.  The digest
+of each node is memorized, so nodes shared with previously digested
+expressions are not visited again.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+try:
+    from hashlib import blake2b
+
+    def _new_hasher():
+        return blake2b(digest_size=16)
+except ImportError:  # Python 3.5
+    from hashlib import sha256 as _new_hasher
+
+# Size in bytes of expression digests
+digest_size = 16
+
+
+def compute_digest(*chunks):
+    "Return a 128-bit digest of the given bytes objects."
+    h = _new_hasher()
+    for chunk in chunks:
+        h.update(chunk)
+    return h.digest()[:digest_size]
+
+
+def compute_expr_digest(expr):
+    """Compute digests of *expr* and all its nodes efficiently, without using Python recursion.
+
+    Returns the digest of *expr* as a ``bytes`` object of length 16.
+    """
+    if expr._digest is not None:
+        return expr._digest
+
+    stack = [[expr, expr.ufl_operands, len(expr.ufl_operands)]]
+    while stack:
+        entry = stack[-1]
+        e = entry[0]
+        if e._digest is not None:
+            # cutoff: don't need to visit children when digest has previously been computed
+            stack.pop()
+        elif entry[2] == 0:
+            # all children consumed: trigger memoized digest computation
+            e._digest = e._ufl_compute_digest_()
+            stack.pop()
+        else:
+            # add children to stack to digest them first
+            entry[2] -= 1
+            o = entry[1][entry[2]]
+            oops = o.ufl_operands
+            stack.append([o, oops, len(oops)])
+
+    return expr._digest
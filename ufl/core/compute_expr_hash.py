@@ -24,38 +24,40 @@ memorized hashes for all unique nodes.
 #
 # Modified by Massimiliano Leoni, 2016
 
-# This limits the _depth_ of expression trees
-_recursion_limit_ = 6400  # should be enough for everyone
-
 
 def compute_expr_hash(expr):
     """Compute hashes of *expr* and all its nodes efficiently, without using Python recursion."""
     if expr._hash is not None:
         return expr._hash
 
-    stack = [None]*_recursion_limit_
-    stacksize = 0
-
+    # Fast path for terminals and for operators built from already
+    # hashed operands, the common case when building expressions
     ops = expr.ufl_operands
-    stack[stacksize] = [expr, ops, len(ops)]
-    stacksize += 1
+    for o in ops:
+        if o._hash is None:
+            break
+    else:
+        expr._hash = expr._ufl_compute_hash_()
+        return expr._hash
 
-    while stacksize > 0:
-        entry = stack[stacksize - 1]
+    # The stack is a plain list that grows as needed, so there is no
+    # limit on the depth of expression trees
+    stack = [[expr, ops, len(ops)]]
+    while stack:
+        entry = stack[-1]
         e = entry[0]
         if e._hash is not None:
             # cutoff: don't need to visit children when hash has previously been computed
-            stacksize -= 1
+            stack.pop()
         elif entry[2] == 0:
             # all children consumed: trigger memoized hash computation
             e._hash = e._ufl_compute_hash_()
-            stacksize -= 1
+            stack.pop()
         else:
             # add children to stack to hash them first
             entry[2] -= 1
             o = entry[1][entry[2]]
             oops = o.ufl_operands
-            stack[stacksize] = [o, oops, len(oops)]
-            stacksize += 1
+            stack.append([o, oops, len(oops)])
 
     return expr._hash
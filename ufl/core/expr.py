@@ -91,6 +91,9 @@ class Expr(object):
             initstats, delstats = Expr.ufl_disable_profiling()
 
         Giving a list of creation and deletion counts for each typecode.
+        Expr has no ``__del__`` method unless this is enabled. For
+        live object counts and allocations per pass, see
+        ``ufl.algorithms.allocation_profiling``.
     """
 
     # --- Each Expr subclass must define __slots__ or _ufl_noslots_ at
@@ -98,7 +101,9 @@ class Expr(object):
     # This is to freeze member variables for objects of this class and
     # save memory by skipping the per-instance dict.
 
-    __slots__ = as_native_strings(("_hash",))
+    # The __weakref__ slot allows expressions to be held in weak
+    # containers, such as the table used by operator interning.
+    __slots__ = as_native_strings(("_hash", "_digest", "_sort_key", "__weakref__"))
     # _ufl_noslots_ = True
 
     # --- Basic object behaviour ---
@@ -114,9 +119,8 @@ class Expr(object):
 
     def __init__(self):
         self._hash = None
-
-    def __del__(self):
-        pass
+        self._digest = None
+        self._sort_key = None
 
     # This shows the principal behaviour of the hash function attached
     # in ufl_type:
@@ -125,6 +129,10 @@ class Expr(object):
     #         self._hash = self._ufl_compute_hash_()
     #     return self._hash
 
+    # The structural digest is computed on demand in the same way,
+    # see ufl.core.compute_expr_digest, and so is the canonical sort
+    # key, see ufl.sorting.sort_key.
+
     # --- Type traits are added to subclasses by the ufl_type class
     # --- decorator ---
 
@@ -189,6 +197,11 @@ class Expr(object):
     # Type trait: If the type never has free indices.
     _ufl_is_index_free_ = False
 
+    # Type traits: Operand number the type takes its shape and free
+    # indices from, or None.
+    _ufl_inherit_shape_from_operand_ = None
+    _ufl_inherit_indices_from_operand_ = None
+
     # --- All subclasses must define these object attributes ---
 
     # Each subclass of Expr is checked to have these properties in
@@ -214,6 +227,10 @@ class Expr(object):
         # To compute the hash on demand, this method is called.
         "_ufl_compute_hash_",
 
+        # To compute the stable structural digest on demand, this
+        # method is called.
+        "_ufl_compute_digest_",
+
         # The data returned from this method is used to compute the
         # signature of a form
         "_ufl_signature_data_",
@@ -267,9 +284,8 @@ class Expr(object):
     # typecode
     _ufl_obj_del_counts_ = [0]
 
-    # Backup of default init and del
+    # Backup of default init
     _ufl_regular__init__ = __init__
-    _ufl_regular__del__ = __del__
 
     def _ufl_profiling__init__(self):
         "Replacement constructor with object counting."
@@ -277,8 +293,7 @@ class Expr(object):
         Expr._ufl_obj_init_counts_[self._ufl_typecode_] += 1
 
     def _ufl_profiling__del__(self):
-        "Replacement destructor with object counting."
-        Expr._ufl_regular__del__(self)
+        "Destructor with object counting, only installed while profiling."
         Expr._ufl_obj_del_counts_[self._ufl_typecode_] -= 1
 
     @staticmethod
@@ -294,7 +309,8 @@ class Expr(object):
     def ufl_disable_profiling():
         "Turn off the object counting mechanism. Return object init and del counts."
         Expr.__init__ = Expr._ufl_regular__init__
-        Expr.__del__ = Expr._ufl_regular__del__
+        if "__del__" in Expr.__dict__:
+            del Expr.__del__
         return (Expr._ufl_obj_init_counts_, Expr._ufl_obj_del_counts_)
 
     # === Abstract functions that must be implemented by subclasses ===
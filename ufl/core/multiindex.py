@@ -123,6 +123,10 @@ class MultiIndex(Terminal):
 
     _cache = {}
 
+    # Weak-value table of multiindices with free indices, set while
+    # operator interning is enabled (see Operator.ufl_enable_interning)
+    _ufl_interning_table_ = None
+
     def __getnewargs__(self):
         return (self._indices,)
 
@@ -141,10 +145,18 @@ class MultiIndex(Terminal):
             MultiIndex._cache[key] = self
         else:
             # Create a new object if we have any free indices (too
-            # many combinations to cache)
+            # many combinations to cache), unless interning is enabled
             if not all(isinstance(ind, IndexBase) for ind in indices):
                 error("Expecting only Index and FixedIndex objects.")
-            self = Terminal.__new__(cls)
+            table = MultiIndex._ufl_interning_table_
+            if table is not None:
+                self = table.get(indices)
+                if self is not None:
+                    return self
+                self = Terminal.__new__(cls)
+                table[indices] = self
+            else:
+                self = Terminal.__new__(cls)
 
         # Initialize here instead of in __init__ to avoid overwriting
         # self._indices from cached objects
@@ -20,10 +20,13 @@
 # Modified by Anders Logg, 2008
 # Modified by Massimiliano Leoni, 2016
 
+import weakref
+
 from ufl.utils.str import as_native_str
 from ufl.utils.str import as_native_strings
 from ufl.core.expr import Expr
 from ufl.core.ufl_type import ufl_type
+from ufl.core.compute_expr_digest import compute_digest
 
 
 # --- Base class for operator objects ---
@@ -54,9 +57,136 @@ class Operator(Expr):
         "Compute a hash code for this expression. Used by sets and dicts."
         return hash((self._ufl_typecode_,) + tuple(hash(o) for o in self.ufl_operands))
 
+    def _ufl_compute_digest_(self):
+        "Compute the stable digest of this expression from the digests of the operands."
+        return compute_digest(self._ufl_class_.__name__.encode("utf-8"), b"\0",
+                              *[o._digest for o in self.ufl_operands])
+
     def __repr__(self):
         "Default repr string construction for operators."
         # This should work for most cases
         r = "%s(%s)" % (self._ufl_class_.__name__,
                         ", ".join(repr(op) for op in self.ufl_operands))
         return as_native_str(r)
+
+    # --- Mechanism for interning (hash-consing) operator objects ---
+
+    # Weak-value table mapping (type, id(op0), id(op1), ...) to the
+    # single live operator object with exactly these operands, or
+    # None if interning is disabled.  Using operand identities in the
+    # key is safe because a live table entry keeps its operands alive.
+    _ufl_interning_table_ = None
+
+    # Backup of the class dict entries replaced while interning is
+    # enabled, {cls: (__new__, __init__)}
+    _ufl_interning_backup_ = {}
+
+    @staticmethod
+    def ufl_enable_interning():
+        """Turn on interning of operator objects at construction time.
+
+        While enabled, constructing an operator with the same type and
+        the very same operand objects as a live operator returns the
+        existing object, such that structurally equal DAGs built from
+        the same terminals share all their nodes. Multiindices with free
+        indices are interned as well.  This only affects objects
+        created after the call, and only the operator types registered
+        at the time of the call.
+        """
+        if Operator._ufl_interning_table_ is not None:
+            return
+        from ufl.core.multiindex import MultiIndex
+
+        classes = [c for c in Expr._ufl_all_classes_
+                   if issubclass(c, Operator) and not c._ufl_is_abstract_]
+
+        # Look up the constructors of all classes before replacing
+        # any of them, such that inherited functions are not replaced
+        # versions from a base class
+        constructors = [(c, c.__new__, c.__init__) for c in classes]
+        for cls, new, init in constructors:
+            Operator._ufl_interning_backup_[cls] = (cls.__dict__.get("__new__"),
+                                                    cls.__dict__.get("__init__"))
+            cls.__new__ = staticmethod(_make_interning_new(cls, new, init))
+            cls.__init__ = _interning_noop_init
+
+        Operator._ufl_interning_table_ = weakref.WeakValueDictionary()
+        MultiIndex._ufl_interning_table_ = weakref.WeakValueDictionary()
+
+    @staticmethod
+    def ufl_disable_interning():
+        """Turn off interning of operator objects.
+
+        Return the number of interned operator objects still alive.
+        """
+        table = Operator._ufl_interning_table_
+        if table is None:
+            return 0
+        from ufl.core.multiindex import MultiIndex
+
+        for cls, (new, init) in Operator._ufl_interning_backup_.items():
+            # Once __new__ has been assigned on a class, CPython keeps
+            # dispatching through the Python level __new__, and
+            # object.__new__ then rejects constructor arguments.
+            # Classes without their own __new__ therefore keep a
+            # trivial one.
+            if new is None:
+                new = staticmethod(_object_new)
+            cls.__new__ = new
+            if init is None:
+                del cls.__init__
+            else:
+                cls.__init__ = init
+        Operator._ufl_interning_backup_.clear()
+
+        Operator._ufl_interning_table_ = None
+        MultiIndex._ufl_interning_table_ = None
+        return len(table)
+
+    @staticmethod
+    def ufl_interning_enabled():
+        "Return whether operator interning is currently enabled."
+        return Operator._ufl_interning_table_ is not None
+
+
+def _object_new(cls, *args, **kwargs):
+    "Replacement for object.__new__ accepting constructor arguments."
+    return object.__new__(cls)
+
+
+def _interning_noop_init(self, *args, **kwargs):
+    "Replacement for __init__ while interning, construction is completed in __new__."
+    pass
+
+
+def _make_interning_new(cls, new, init):
+    "Create a replacement for ``cls.__new__`` that returns interned objects."
+    # object.__new__ rejects the constructor arguments since __new__
+    # is overridden on the class
+    if new is object.__new__:
+        new = _object_new
+
+    def _interning_new(subcls, *args, **kwargs):
+        self = new(subcls, *args, **kwargs)
+
+        # Objects returned by __new__ that already exist, like
+        # simplifications returning one of the operands, are left
+        # alone.  Otherwise complete the construction here.
+        if not isinstance(self, subcls) or hasattr(self, "_hash"):
+            return self
+        init(self, *args, **kwargs)
+
+        # External subclasses are not interned
+        if subcls is not cls:
+            return self
+
+        # Look for an existing object built from the same operands
+        key = (cls,) + tuple(id(o) for o in self.ufl_operands)
+        table = Operator._ufl_interning_table_
+        existing = table.get(key)
+        if existing is not None:
+            return existing
+        table[key] = self
+        return self
+
+    return _interning_new
@@ -25,6 +25,7 @@ for all types that are terminal nodes in an expression tree."""
 from ufl.log import error, warning
 from ufl.core.expr import Expr
 from ufl.core.ufl_type import ufl_type
+from ufl.core.compute_expr_digest import compute_digest
 
 
 # --- Base class for terminal objects ---
@@ -96,6 +97,10 @@ class Terminal(Expr):
         "Default hash of terminals just hash the repr string."
         return hash(repr(self))
 
+    def _ufl_compute_digest_(self):
+        "Default digest of terminals is a digest of the repr string."
+        return compute_digest(repr(self).encode("utf-8"))
+
     def __eq__(self, other):
         "Default comparison of terminals just compare repr strings."
         return repr(self) == repr(other)
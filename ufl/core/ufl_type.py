@@ -207,18 +207,33 @@ def attach_implementations_of_indexing_interface(cls,
 
     # Automate direct inheriting of shape and indices from one of the
     # operands.  This simplifies refactoring because a lot of types do
-    # this.
+    # this.  The properties follow chains of operands that inherit
+    # from their own operands in a loop, as recursing through long
+    # chains like deep sums would hit the Python recursion limit.
     if inherit_shape_from_operand is not None:
         def _inherited_ufl_shape(self):
-            return self.ufl_operands[inherit_shape_from_operand].ufl_shape
+            o = self.ufl_operands[inherit_shape_from_operand]
+            k = o._ufl_inherit_shape_from_operand_
+            while k is not None:
+                o = o.ufl_operands[k]
+                k = o._ufl_inherit_shape_from_operand_
+            return o.ufl_shape
         cls.ufl_shape = property(_inherited_ufl_shape)
 
     if inherit_indices_from_operand is not None:
+        def _inherited_operand(self):
+            o = self.ufl_operands[inherit_indices_from_operand]
+            k = o._ufl_inherit_indices_from_operand_
+            while k is not None:
+                o = o.ufl_operands[k]
+                k = o._ufl_inherit_indices_from_operand_
+            return o
+
         def _inherited_ufl_free_indices(self):
-            return self.ufl_operands[inherit_indices_from_operand].ufl_free_indices
+            return _inherited_operand(self).ufl_free_indices
 
         def _inherited_ufl_index_dimensions(self):
-            return self.ufl_operands[inherit_indices_from_operand].ufl_index_dimensions
+            return _inherited_operand(self).ufl_index_dimensions
         cls.ufl_free_indices = property(_inherited_ufl_free_indices)
         cls.ufl_index_dimensions = property(_inherited_ufl_index_dimensions)
 
@@ -308,6 +323,11 @@ def ufl_type(is_abstract=False,
         set_trait(cls, "is_scalar", is_scalar, inherit=True)
         set_trait(cls, "is_index_free", _is_index_free, inherit=True)
 
+        # Operand to take shape and free indices from, only set for
+        # the classes using the properties attached below
+        set_trait(cls, "inherit_shape_from_operand", inherit_shape_from_operand, inherit=False)
+        set_trait(cls, "inherit_indices_from_operand", inherit_indices_from_operand, inherit=False)
+
         # Number of operands can often be determined automatically
         _num_ops = determine_num_ops(cls, num_ops, unop, binop, rbinop)
         set_trait(cls, "num_ops", _num_ops)
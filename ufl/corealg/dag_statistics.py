@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Statistics of the caches of map_expr_dags.
+
+Within a ``collect_dag_statistics`` context, each call to
+``map_expr_dags`` records how many nodes it visited, how many nodes
+were skipped below cutoff handlers, how many visited nodes were found
+in the cache of transformed nodes, how many results were replaced by
+equal results already computed, and the number of unique nodes of the
+input and output expressions. The statistics are available per call
+and aggregated per algorithm class. Nothing is recorded outside of
+the context.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from ufl.core.expr import Expr
+from ufl.corealg.traversal import unique_pre_traversal
+
+
+# Stack of the collectors of the active collect_dag_statistics contexts
+_active_collectors = []
+
+
+def count_unique_nodes(expressions):
+    """Return the number of unique nodes of the given expressions,
+    or None if any of them is not an Expr."""
+    if not all(isinstance(e, Expr) for e in expressions):
+        return None
+    visited = set()
+    for e in expressions:
+        for v in unique_pre_traversal(e, visited):
+            pass
+    return len(visited)
+
+
+class DagMapStatistics(object):
+    """Cache statistics of one or more calls to map_expr_dags.
+
+    *Attributes*
+        ``algorithm``
+            Name of the class of the function applied.
+        ``calls``
+            Number of calls.
+        ``input_nodes``
+            Number of unique nodes of the input expressions.
+        ``visited``
+            Number of nodes visited by the traversal.
+        ``cutoff_skipped``
+            Number of input nodes not visited because they are below
+            a node with a cutoff handler.
+        ``vcache_hits``
+            Number of visited nodes with a cached result, from an
+            earlier expression of the call or from shared caches.
+        ``handler_calls``
+            Number of calls to the function.
+        ``rcache_hits``
+            Number of results replaced by an equal result computed
+            earlier, when compressing.
+        ``output_nodes``
+            Number of unique nodes of the results, or None if the
+            results are not expressions.
+    """
+
+    _fields = ("algorithm", "calls", "input_nodes", "visited", "cutoff_skipped",
+               "vcache_hits", "handler_calls", "rcache_hits", "output_nodes")
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.calls = 0
+        self.input_nodes = 0
+        self.visited = 0
+        self.cutoff_skipped = 0
+        self.vcache_hits = 0
+        self.handler_calls = 0
+        self.rcache_hits = 0
+        self.output_nodes = 0
+
+    def add(self, other):
+        "Add the counts of other to the counts of self."
+        for name in self._fields[1:]:
+            a = getattr(self, name)
+            b = getattr(other, name)
+            setattr(self, name, None if a is None or b is None else a + b)
+
+    def vcache_hit_rate(self):
+        "Return the fraction of the visited nodes with a cached result."
+        return float(self.vcache_hits) / self.visited if self.visited else 0.0
+
+    def rcache_hit_rate(self):
+        "Return the fraction of the handler results replaced by earlier results."
+        return float(self.rcache_hits) / self.handler_calls if self.handler_calls else 0.0
+
+    def size_ratio(self):
+        """Return the ratio of the number of unique output nodes to the
+        number of unique input nodes, or None if the results are not
+        expressions."""
+        if self.output_nodes is None or not self.input_nodes:
+            return None
+        return float(self.output_nodes) / self.input_nodes
+
+    def as_dict(self):
+        "Return the statistics and the derived ratios as a dict."
+        d = dict((name, getattr(self, name)) for name in self._fields)
+        d["vcache_hit_rate"] = self.vcache_hit_rate()
+        d["rcache_hit_rate"] = self.rcache_hit_rate()
+        d["size_ratio"] = self.size_ratio()
+        return d
+
+
+class DagStatisticsCollector(object):
+    "The DagMapStatistics of the calls to map_expr_dags in a collect_dag_statistics context."
+
+    def __init__(self):
+        self.records = []
+
+    def new_record(self, algorithm):
+        "Return a new DagMapStatistics for a call applying algorithm."
+        record = DagMapStatistics(algorithm)
+        self.records.append(record)
+        return record
+
+    def by_algorithm(self):
+        """Return an OrderedDict mapping algorithm names to the sum of
+        the statistics of their calls, in order of first call."""
+        totals = OrderedDict()
+        for r in self.records:
+            total = totals.get(r.algorithm)
+            if total is None:
+                total = DagMapStatistics(r.algorithm)
+                totals[r.algorithm] = total
+            total.add(r)
+        return totals
+
+    def to_json(self, **kwargs):
+        """Return the statistics of each call and of each algorithm as
+        JSON, passing kwargs to json.dumps."""
+        return json.dumps({"calls": [r.as_dict() for r in self.records],
+                           "algorithms": [r.as_dict() for r in self.by_algorithm().values()]},
+                          **kwargs)
+
+    def __str__(self):
+        header = ("Algorithm", "Calls", "Visited", "Skipped", "Vhits", "Rhits", "Ratio")
+        lines = ["%-36s %8s %10s %10s %10s %10s %8s" % header]
+        for r in self.by_algorithm().values():
+            ratio = r.size_ratio()
+            lines.append("%-36s %8d %10d %10d %10d %10d %8s" % (
+                r.algorithm[:36], r.calls, r.visited, r.cutoff_skipped,
+                r.vcache_hits, r.rcache_hits, "-" if ratio is None else "%.3f" % ratio))
+        return "\n".join(lines)
+
+
+@contextmanager
+def collect_dag_statistics():
+    """Record cache statistics of the calls to map_expr_dags in this context.
+
+    Yields a DagStatisticsCollector. Counting the input and output
+    nodes requires extra traversals, so the calls are slower within
+    the context.
+    """
+    collector = DagStatisticsCollector()
+    _active_collectors.append(collector)
+    try:
+        yield collector
+    finally:
+        _active_collectors.remove(collector)
+
+
+def active_dag_statistics():
+    "Return the DagStatisticsCollector of the innermost collect_dag_statistics context, or None."
+    return _active_collectors[-1] if _active_collectors else None
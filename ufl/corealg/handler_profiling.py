@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Profiling of the handlers of MultiFunction objects.
+
+Within a ``profile_handlers`` context, the handlers of each
+MultiFunction created in the context are wrapped in functions
+measuring the number of calls, the cumulative time including nested
+handler calls, the self time excluding them, and the number of calls
+to cutoff handlers which skip the subtrees of their argument. The
+statistics are collected per handler and per expression type.
+Handlers are only wrapped within the context, so this costs nothing
+otherwise.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from ufl.core.expr import Expr
+
+
+# Stack of the profilers of the active profile_handlers contexts
+_active_profilers = []
+
+
+class HandlerStats(object):
+    "Call count, cumulative time, self time and cutoff calls of a handler."
+
+    __slots__ = ("calls", "cumulative_time", "self_time", "cutoff_calls")
+
+    def __init__(self):
+        self.calls = 0
+        self.cumulative_time = 0.0
+        self.self_time = 0.0
+        self.cutoff_calls = 0
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class HandlerProfiler(object):
+    """Statistics of the handler calls in a profile_handlers context.
+
+    *Attributes*
+        ``handlers``
+            Dict mapping "Class.handler" names to HandlerStats.
+        ``types``
+            Dict mapping expression type names to HandlerStats of the
+            calls with an argument of the type.
+    """
+
+    def __init__(self):
+        self.handlers = defaultdict(HandlerStats)
+        self.types = defaultdict(HandlerStats)
+        # Time spent in nested handler calls of each active call
+        self._nested_times = []
+
+    def wrap(self, handler, handler_name, type_name, cutoff):
+        """Return a function calling handler and recording the call
+        in the statistics with the given names."""
+        hstats = self.handlers[handler_name]
+        tstats = self.types[type_name]
+        nested_times = self._nested_times
+        clock = time.perf_counter
+
+        def profiled_handler(*args):
+            nested_times.append(0.0)
+            t0 = clock()
+            try:
+                return handler(*args)
+            finally:
+                t = clock() - t0
+                self_t = t - nested_times.pop()
+                if nested_times:
+                    nested_times[-1] += t
+                for stats in (hstats, tstats):
+                    stats.calls += 1
+                    stats.cumulative_time += t
+                    stats.self_time += self_t
+                    if cutoff:
+                        stats.cutoff_calls += 1
+        return profiled_handler
+
+    def wrap_multifunction(self, mf):
+        "Wrap the handlers in the dispatch table of MultiFunction mf."
+        cls = type(mf).__name__
+        handlers = []
+        for tc, h in enumerate(mf._handlers):
+            name = "%s.%s" % (cls, getattr(h, "__name__", "?"))
+            type_name = Expr._ufl_all_classes_[tc].__name__
+            handlers.append(self.wrap(h, name, type_name, mf._is_cutoff_type[tc]))
+        mf._handlers = handlers
+
+    def report(self, key="self_time", limit=None):
+        """Return a table of the handlers and of the expression types,
+        sorted by the given statistic in decreasing order and limited
+        to the first limit rows if given."""
+        lines = []
+        for title, stats in (("Handler", self.handlers), ("Type", self.types)):
+            rows = sorted(((s, name) for name, s in stats.items() if s.calls),
+                          key=lambda x: (-getattr(x[0], key), x[1]))
+            lines.append("%-48s %10s %12s %12s %10s" % (title, "Calls", "Cumulative",
+                                                        "Self", "Cutoffs"))
+            for s, name in rows[:limit]:
+                lines.append("%-48s %10d %12.6f %12.6f %10d" % (name, s.calls, s.cumulative_time,
+                                                                s.self_time, s.cutoff_calls))
+            lines.append("")
+        return "\n".join(lines)
+
+    def as_dict(self):
+        "Return the statistics as a dict of dicts."
+        return {"handlers": dict((k, s.as_dict()) for k, s in self.handlers.items() if s.calls),
+                "types": dict((k, s.as_dict()) for k, s in self.types.items() if s.calls)}
+
+
+@contextmanager
+def profile_handlers():
+    """Profile the handlers of the MultiFunction objects created in this
+    context, and of plain functions passed to map_expr_dags.
+
+    Yields a HandlerProfiler.
+    """
+    profiler = HandlerProfiler()
+    _active_profilers.append(profiler)
+    try:
+        yield profiler
+    finally:
+        _active_profilers.remove(profiler)
+
+
+def active_handler_profiler():
+    "Return the HandlerProfiler of the innermost profile_handlers context, or None."
+    return _active_profilers[-1] if _active_profilers else None
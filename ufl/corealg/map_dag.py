@@ -20,9 +20,38 @@
 #
 # Modified by Massimiliano Leoni, 2016
 
+from contextlib import contextmanager
+
 from ufl.core.expr import Expr
-from ufl.corealg.traversal import unique_post_traversal, cutoff_unique_post_traversal
+from ufl.corealg.traversal import unique_pre_traversal, unique_post_traversal, cutoff_unique_post_traversal
 from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.handler_profiling import active_handler_profiler
+from ufl.corealg.dag_statistics import active_dag_statistics, count_unique_nodes
+
+
+# Caches of map_expr_dags shared between calls, see shared_dag_caches
+_shared_dag_caches = None
+
+
+@contextmanager
+def shared_dag_caches():
+    """Share the caches of map_expr_dags between calls in this context.
+
+    Within the context, map_expr_dags applies a MultiFunction with a
+    ``dag_cache_key`` other than None to each subexpression only once,
+    also across calls and for separate instances of the MultiFunction
+    with equal keys. The caches are released when the outermost
+    context exits.
+    """
+    global _shared_dag_caches
+    if _shared_dag_caches is not None:
+        yield
+        return
+    _shared_dag_caches = {}
+    try:
+        yield
+    finally:
+        _shared_dag_caches = None
 
 
 def map_expr_dag(function, expression, compress=True):
@@ -52,6 +81,13 @@ def map_expr_dags(function, expressions, compress=True):
     vcache = {}  # expr -> r = function(expr,...),  cache of intermediate results
     rcache = {}  # r -> r,  cache of result objects for memory reuse
 
+    # Use shared caches if requested and possible
+    if _shared_dag_caches is not None and isinstance(function, MultiFunction):
+        key = function.dag_cache_key()
+        if key is not None:
+            key = (type(function), compress, key)
+            vcache, rcache = _shared_dag_caches.setdefault(key, (vcache, rcache))
+
     # Build mapping typecode:bool, for which types to skip the subtree of
     if isinstance(function, MultiFunction):
         cutoff_types = function._is_cutoff_type
@@ -60,6 +96,11 @@ def map_expr_dags(function, expressions, compress=True):
         # Regular function: no skipping supported
         cutoff_types = [False]*Expr._ufl_num_typecodes_
         handlers = [function]*Expr._ufl_num_typecodes_
+        profiler = active_handler_profiler()
+        if profiler is not None:
+            name = getattr(function, "__name__", type(function).__name__)
+            handlers = [profiler.wrap(function, name, cls.__name__, False)
+                        for cls in Expr._ufl_all_classes_]
 
     # Create visited set here to share between traversal calls
     visited = set()
@@ -72,6 +113,25 @@ def map_expr_dags(function, expressions, compress=True):
         def traversal(expression):
             return unique_post_traversal(expression, visited)
 
+    # Record cache statistics if requested
+    collector = active_dag_statistics()
+    if collector is not None:
+        if isinstance(function, MultiFunction):
+            algorithm = type(function).__name__
+        else:
+            algorithm = getattr(function, "__name__", type(function).__name__)
+        counter = _DagMapCounter(cutoff_types, handlers, traversal, rcache)
+        results = _map_expr_dags(expressions, compress, vcache, counter.rcache,
+                                 cutoff_types, counter.handlers, counter.traversal)
+        counter.record(collector.new_record(algorithm), expressions, results, visited)
+        return results
+
+    return _map_expr_dags(expressions, compress, vcache, rcache,
+                          cutoff_types, handlers, traversal)
+
+
+def _map_expr_dags(expressions, compress, vcache, rcache, cutoff_types, handlers, traversal):
+    "The loop of map_expr_dags."
     for expression in expressions:
         # Iterate over all subexpression nodes, child before parent
         for v in traversal(expression):
@@ -101,3 +161,71 @@ def map_expr_dags(function, expressions, compress=True):
             vcache[v] = r
 
     return [vcache[expression] for expression in expressions]
+
+
+class _DagMapCounter(object):
+    """Wraps the handlers, traversal and rcache of map_expr_dags
+    to count the events recorded in DagMapStatistics."""
+
+    def __init__(self, cutoff_types, handlers, traversal, rcache):
+        self.visited = 0
+        self.handler_calls = 0
+        self.rcache_hits = 0
+        self.cutoff_nodes = []
+        self._cutoff_types = cutoff_types
+        self._traversal = traversal
+        self._rcache = rcache
+
+        wrapped = {}
+        for h in handlers:
+            if id(h) not in wrapped:
+                wrapped[id(h)] = self._counted(h)
+        self.handlers = [wrapped[id(h)] for h in handlers]
+
+    def _counted(self, handler):
+        def counted_handler(*args):
+            self.handler_calls += 1
+            return handler(*args)
+        return counted_handler
+
+    def traversal(self, expression):
+        cutoff_types = self._cutoff_types
+        for v in self._traversal(expression):
+            self.visited += 1
+            # The traversal does not enter the operands of cutoff types
+            if cutoff_types[v._ufl_typecode_] and v.ufl_operands:
+                self.cutoff_nodes.append(v)
+            yield v
+
+    # The rcache interface used by _map_expr_dags
+    @property
+    def rcache(self):
+        return self
+
+    def get(self, r):
+        r2 = self._rcache.get(r)
+        if r2 is not None:
+            self.rcache_hits += 1
+        return r2
+
+    def __setitem__(self, r, r2):
+        self._rcache[r] = r2
+
+    def cutoff_skipped(self, visited_set):
+        "Count the unique nodes below cutoff nodes that were never visited."
+        skipped = set()
+        for v in self.cutoff_nodes:
+            for u in v.ufl_operands:
+                for w in unique_pre_traversal(u, skipped):
+                    pass
+        return len(skipped - visited_set)
+
+    def record(self, statistics, expressions, results, visited_set):
+        statistics.calls = 1
+        statistics.input_nodes = count_unique_nodes(expressions)
+        statistics.visited = self.visited
+        statistics.cutoff_skipped = self.cutoff_skipped(visited_set)
+        statistics.vcache_hits = self.visited - self.handler_calls
+        statistics.handler_calls = self.handler_calls
+        statistics.rcache_hits = self.rcache_hits
+        statistics.output_nodes = count_unique_nodes(results)
@@ -24,6 +24,7 @@ from inspect import getargspec
 
 from ufl.log import error
 from ufl.core.expr import Expr
+from ufl.corealg.handler_profiling import active_handler_profiler
 
 
 def get_num_args(function):
@@ -91,6 +92,11 @@ class MultiFunction(object):
         self._handlers = [getattr(self, name) for name in handler_names]
         self._is_cutoff_type = is_cutoff_type
 
+        # Wrap handlers to record calls when profiling is active
+        profiler = active_handler_profiler()
+        if profiler is not None:
+            profiler.wrap_multifunction(self)
+
         # Create cache for memoized_handler
         self._memoized_handler_cache = {}
 
@@ -98,6 +104,16 @@ class MultiFunction(object):
         "Delegate to handler function based on typecode of first argument."
         return self._handlers[o._ufl_typecode_](o, *args)
 
+    def dag_cache_key(self):
+        """Return a hashable key such that all instances of this class
+        with equal keys give the same result for each expression, or
+        None if the result also depends on other state.
+
+        If not None, ``map_expr_dags`` may share cached results between
+        calls in a ``shared_dag_caches`` context.
+        """
+        return None
+
     def undefined(self, o, *args):
         "Trigger error for types with missing handlers."
         error("No handler defined for %s." % o._ufl_class_.__name__)
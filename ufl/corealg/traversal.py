@@ -24,62 +24,58 @@ by a factor of 10 or so because of the function call overhead.
 #
 # Modified by Massimiliano Leoni, 2016
 
-# This limits the _depth_ of expression trees
-_recursion_limit_ = 6400  # should be enough for everyone
+# The traversal stacks below are plain lists that grow as needed, so
+# there is no limit on the depth of expression trees.  Terminal
+# expressions are handled up front without allocating a stack.
 
 
 def pre_traversal(expr):
     """Yield ``o`` for each tree node ``o`` in *expr*, parent before child."""
-    stack = [None]*_recursion_limit_
-    stack[0] = expr
-    stacksize = 1
-    while stacksize > 0:
-        stacksize -= 1
-        expr = stack[stacksize]
+    if expr._ufl_is_terminal_:
         yield expr
-        for op in expr.ufl_operands:
-            stack[stacksize] = op
-            stacksize += 1
+        return
+    stack = [expr]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        expr = pop()
+        yield expr
+        extend(expr.ufl_operands)
 
 
 def post_traversal(expr):
     """Yield ``o`` for each node ``o`` in *expr*, child before parent."""
-    stack = [None]*_recursion_limit_
-    stacksize = 0
-
+    if expr._ufl_is_terminal_:
+        yield expr
+        return
     ops = expr.ufl_operands
-    stack[stacksize] = [expr, ops, len(ops)]
-    stacksize += 1
-
-    while stacksize > 0:
-        entry = stack[stacksize - 1]
+    stack = [[expr, ops, len(ops)]]
+    while stack:
+        entry = stack[-1]
         if entry[2] == 0:
             yield entry[0]
-            stacksize -= 1
+            stack.pop()
         else:
             entry[2] -= 1
             o = entry[1][entry[2]]
             oops = o.ufl_operands
-            stack[stacksize] = [o, oops, len(oops)]
-            stacksize += 1
+            stack.append([o, oops, len(oops)])
 
 
 def cutoff_post_traversal(expr, cutofftypes):
     """Yield ``o`` for each node ``o`` in *expr*, child before parent, but
     skipping subtrees of the cutofftypes."""
-    stack = [None]*_recursion_limit_
-    stacksize = 0
-
+    if expr._ufl_is_terminal_:
+        yield expr
+        return
     ops = expr.ufl_operands
-    stack[stacksize] = [expr, ops, len(ops)]
-    stacksize += 1
-
-    while stacksize > 0:
-        entry = stack[stacksize - 1]
+    stack = [[expr, ops, len(ops)]]
+    while stack:
+        entry = stack[-1]
         expr = entry[0]
         if entry[2] == 0 or cutofftypes[expr._ufl_typecode_]:
             yield expr
-            stacksize -= 1
+            stack.pop()
         else:
             entry[2] -= 1
             o = entry[1][entry[2]]
@@ -87,8 +83,7 @@ def cutoff_post_traversal(expr, cutofftypes):
                 oops = ()
             else:
                 oops = o.ufl_operands
-            stack[stacksize] = [o, oops, len(oops)]
-            stacksize += 1
+            stack.append([o, oops, len(oops)])
 
 
 def unique_pre_traversal(expr, visited=None):
@@ -96,99 +91,94 @@ def unique_pre_traversal(expr, visited=None):
 
     This version only visits each node once.
     """
-    stack = [None]*_recursion_limit_
-    stack[0] = expr
-    stacksize = 1
     if visited is None:
         visited = set()
-    while stacksize > 0:
-        stacksize -= 1
-        expr = stack[stacksize]
+    stack = [expr]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        expr = pop()
         if expr not in visited:
             visited.add(expr)
             yield expr
-            for op in expr.ufl_operands:
-                stack[stacksize] = op
-                stacksize += 1
+            extend(expr.ufl_operands)
 
 
 def unique_post_traversal(expr, visited=None):
     """Yield ``o`` for each node ``o`` in *expr*, child before parent.
 
     Never visit a node twice."""
-    stack = [None]*_recursion_limit_
-    stack[0] = (expr, list(expr.ufl_operands))
-    stacksize = 1
     if visited is None:
         visited = set()
-    while stacksize > 0:
-        expr, ops = stack[stacksize - 1]
+    stack = [(expr, list(expr.ufl_operands))]
+    while stack:
+        expr, ops = stack[-1]
         for i, o in enumerate(ops):
             if o is not None and o not in visited:
-                stack[stacksize] = (o, list(o.ufl_operands))
-                stacksize += 1
+                stack.append((o, list(o.ufl_operands)))
                 ops[i] = None
                 break
         else:
             yield expr
             visited.add(expr)
-            stacksize -= 1
+            stack.pop()
 
 
 def cutoff_unique_post_traversal(expr, cutofftypes, visited=None):
     """Yield ``o`` for each node ``o`` in *expr*, child before parent.
 
     Never visit a node twice."""
-    stack = [None]*_recursion_limit_
-    stack[0] = (expr, () if cutofftypes[expr._ufl_typecode_] else list(expr.ufl_operands))
-    stacksize = 1
     if visited is None:
         visited = set()
-    while stacksize > 0:
-        expr, ops = stack[stacksize - 1]
+    stack = [(expr, () if cutofftypes[expr._ufl_typecode_] else list(expr.ufl_operands))]
+    while stack:
+        expr, ops = stack[-1]
         for i, o in enumerate(ops):
             if o is not None and o not in visited:
-                stack[stacksize] = (o, () if cutofftypes[o._ufl_typecode_] else list(o.ufl_operands))
-                stacksize += 1
+                stack.append((o, () if cutofftypes[o._ufl_typecode_] else list(o.ufl_operands)))
                 ops[i] = None
                 break
         else:
             yield expr
             visited.add(expr)
-            stacksize -= 1
+            stack.pop()
 
 
 def traverse_terminals(expr):
     "Iterate over all terminal objects in *expr*, including duplicates."
-    stack = [None]*_recursion_limit_
-    stack[0] = expr
-    stacksize = 1
-    while stacksize > 0:
-        stacksize -= 1
-        expr = stack[stacksize]
+    if expr._ufl_is_terminal_:
+        yield expr
+        return
+    stack = [expr]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        expr = pop()
         if expr._ufl_is_terminal_:
             yield expr
         else:
-            for op in expr.ufl_operands:
-                stack[stacksize] = op
-                stacksize += 1
+            extend(expr.ufl_operands)
 
 
 def traverse_unique_terminals(expr, visited=None):
     "Iterate over all terminal objects in *expr*, not including duplicates."
-    stack = [None]*_recursion_limit_
-    stack[0] = expr
-    stacksize = 1
+    if expr._ufl_is_terminal_:
+        if visited is None:
+            yield expr
+        elif expr not in visited:
+            visited.add(expr)
+            yield expr
+        return
     if visited is None:
         visited = set()
-    while stacksize > 0:
-        stacksize -= 1
-        expr = stack[stacksize]
+    stack = [expr]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        expr = pop()
         if expr not in visited:
             visited.add(expr)
             if expr._ufl_is_terminal_:
                 yield expr
             else:
-                for op in expr.ufl_operands:
-                    stack[stacksize] = op
-                    stacksize += 1
+                extend(expr.ufl_operands)
@@ -1,70 +1,248 @@
 # -*- coding: utf-8 -*-
 
-from collections import defaultdict
+import json
+import time
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+from weakref import ref
 
 from ufl.core.expr import Expr
-from ufl.log import error
-
-hash_total = defaultdict(int)
-hash_collisions = defaultdict(int)
-hash_equals = defaultdict(int)
-hash_notequals = defaultdict(int)
-
+from ufl.log import error, deprecate
+
+
+class PairStatistics(object):
+    """Counts of the comparisons of expressions of a pair of types.
+
+    *Attributes*
+        ``comparisons``
+            Number of comparisons.
+        ``equal``, ``not_equal``
+            Number of comparisons of equal and unequal objects with
+            equal and different hashes respectively.
+        ``collisions``
+            Number of comparisons of unequal objects with equal hashes.
+        ``deep_comparisons``
+            Number of comparisons of distinct objects with equal
+            hashes, which may need to compare the subexpressions.
+        ``time``, ``deep_time``
+            Time spent in all comparisons and in the deep comparisons,
+            in seconds.
+    """
+
+    __slots__ = ("comparisons", "equal", "not_equal", "collisions",
+                 "deep_comparisons", "time", "deep_time")
+
+    def __init__(self):
+        self.comparisons = 0
+        self.equal = 0
+        self.not_equal = 0
+        self.collisions = 0
+        self.deep_comparisons = 0
+        self.time = 0.0
+        self.deep_time = 0.0
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class HashStatistics(object):
+    "Number of hash computations of expressions of a type and their total time in seconds."
+
+    __slots__ = ("computations", "time")
+
+    def __init__(self):
+        self.computations = 0
+        self.time = 0.0
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class EqualityStatistics(object):
+    """Statistics of expression comparisons and hash computations.
+
+    *Attributes*
+        ``pairs``
+            Dict mapping pairs of type names to PairStatistics.
+        ``hashes``
+            Dict mapping type names to HashStatistics.
+    """
+
+    def __init__(self):
+        self.pairs = defaultdict(PairStatistics)
+        self.hashes = defaultdict(HashStatistics)
+
+    def total(self):
+        "Return the sum of the PairStatistics of all pairs of types."
+        total = PairStatistics()
+        for stats in self.pairs.values():
+            for name in PairStatistics.__slots__:
+                setattr(total, name, getattr(total, name) + getattr(stats, name))
+        return total
+
+    def as_dict(self):
+        """Return the statistics as a dict, with pairs of type names
+        joined by a comma."""
+        return {"pairs": dict(("%s,%s" % k, s.as_dict()) for k, s in self.pairs.items()),
+                "hashes": dict((k, s.as_dict()) for k, s in self.hashes.items()),
+                "total": self.total().as_dict()}
+
+    def to_json(self, **kwargs):
+        "Return the statistics as JSON, passing kwargs to json.dumps."
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def report(self, limit=None):
+        """Return a table of the pairs of types, with the most collisions
+        and then the most deep comparison time first, limited to the
+        first limit rows if given."""
+        keys = sorted(self.pairs, key=lambda k: (-self.pairs[k].collisions,
+                                                 -self.pairs[k].deep_time, k))
+        header = ("Types", "Compared", "Equal", "Unequal", "Collisions", "Deep time")
+        lines = ["%-48s %10s %10s %10s %10s %12s" % header]
+        for k in keys[:limit]:
+            s = self.pairs[k]
+            lines.append("%-48s %10d %10d %10d %10d %12.6f" % (
+                "%s, %s" % k, s.comparisons, s.equal, s.not_equal,
+                s.collisions, s.deep_time))
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.report()
+
+
+# Statistics of the active equality statistics mode, and the original
+# methods replaced by it
+_equality_statistics = None
+_replaced_methods = []
+
+
+def _measuring_equals(equals, stats):
+    "Return __eq__ implementation recording the comparisons in stats."
+    pairs = stats.pairs
+    clock = time.perf_counter
+
+    def measuring_equals(self, other):
+        if not isinstance(other, Expr):
+            return equals(self, other)
+        sh = hash(self)
+        oh = hash(other)
+        t0 = clock()
+        equal = equals(self, other)
+        t = clock() - t0
+
+        s = pairs[(type(self).__name__, type(other).__name__)]
+        s.comparisons += 1
+        s.time += t
+        if sh == oh:
+            if self is not other:
+                s.deep_comparisons += 1
+                s.deep_time += t
+            if equal:
+                s.equal += 1
+            else:
+                # Equal hashes of unequal objects is a collision
+                s.collisions += 1
+        elif equal:
+            error("Equal objects must always have the same hash! Objects are:\n{0}\n{1}".format(self, other))
+        else:
+            s.not_equal += 1
+        return equal
+    return measuring_equals
+
+
+def _measuring_hash(compute_hash, stats):
+    "Return _ufl_compute_hash_ implementation recording the computations in stats."
+    hashes = stats.hashes
+    clock = time.perf_counter
+
+    def measuring_hash(self):
+        t0 = clock()
+        h = compute_hash(self)
+        s = hashes[type(self).__name__]
+        s.time += clock() - t0
+        s.computations += 1
+        return h
+    return measuring_hash
+
+
+def enable_equality_statistics():
+    """Start recording statistics of expression comparisons and hash
+    computations, and return the EqualityStatistics to fill.
+
+    The ``__eq__`` and ``_ufl_compute_hash_`` implementations of all
+    expression classes are replaced by measuring wrappers until
+    ``disable_equality_statistics`` is called. Hashes already computed
+    are not recomputed.
+    """
+    global _equality_statistics
+    if _equality_statistics is not None:
+        error("Equality statistics are already enabled.")
+    stats = EqualityStatistics()
+    wrappers = (("__eq__", _measuring_equals),
+                ("_ufl_compute_hash_", _measuring_hash))
+    for cls in Expr._ufl_all_classes_:
+        for name, wrapper in wrappers:
+            method = cls.__dict__.get(name)
+            if method is not None:
+                _replaced_methods.append((cls, name, method))
+                setattr(cls, name, wrapper(method, stats))
+    _equality_statistics = stats
+    return stats
+
+
+def disable_equality_statistics():
+    """Stop recording statistics of expression comparisons, restoring
+    the original methods, and return the EqualityStatistics."""
+    global _equality_statistics
+    stats = _equality_statistics
+    while _replaced_methods:
+        cls, name, method = _replaced_methods.pop()
+        setattr(cls, name, method)
+    _equality_statistics = None
+    return stats
+
+
+@contextmanager
+def collect_equality_statistics():
+    """Record statistics of expression comparisons and hash computations
+    in this context, see enable_equality_statistics.
+
+    Yields the EqualityStatistics.
+    """
+    stats = enable_equality_statistics()
+    try:
+        yield stats
+    finally:
+        disable_equality_statistics()
+
+
+# Statistics of the comparisons of functions decorated by the
+# deprecated measure_collisions
+_collision_statistics = EqualityStatistics()
 
-def print_collisions():
 
-    keys = sorted(hash_total.keys(), key=lambda x: (hash_collisions[x], x))
-
-    print("Collision statistics ({0} keys):".format(len(keys)))
-    print("[key: equals; notequals; collisions]")
-    n = max(len(str(k)) for k in keys)
-    fmt = ("%%%ds" % n) + ": \t %6d (%3d%%); %6d (%3d%%); %6d (%3d%%) col; tot %d"
-    for k in keys:
-        co = hash_collisions[k]
-        eq = hash_equals[k]
-        ne = hash_notequals[k]
-        tot = hash_total[k]
-        sn, on = k
-        # Skip those that are all not equal
-        if sn != on and ne == tot:
-            continue
-        print(fmt % (k, eq, int(100.0*eq/tot),
-                     ne, int(100.0*ne/tot),
-                     co, int(100.0*co/tot),
-                     tot))
+def measure_collisions(equals_func):
+    """Deprecated, use collect_equality_statistics or
+    enable_equality_statistics instead."""
+    deprecate("measure_collisions is deprecated, please use "
+              "collect_equality_statistics or enable_equality_statistics.")
+    return _measuring_equals(equals_func, _collision_statistics)
 
 
-def measure_collisions(equals_func):
-    def equals_func_with_collision_measuring(self, other):
-        # Call equals
-        equal = equals_func(self, other)
-
-        # Get properties
-        st = type(self)
-        ot = type(other)
-        sn = st.__name__
-        on = ot.__name__
-        sh = hash(self)
-        oh = hash(other)
-        key = (sn, on)
-
-        # If hashes are the same but objects are not equal, we have a
-        # collision
-        hash_total[key] += 1
-        if sh == oh and not equal:
-            hash_collisions[key] += 1
-        elif sh != oh and equal:
-            error("Equal objects must always have the same hash! Objects are:\n{0}\n{1}".format(self, other))
-        elif sh == oh and equal:
-            hash_equals[key] += 1
-        elif sh != oh and not equal:
-            hash_notequals[key] += 1
+def print_collisions():
+    """Deprecated, print the EqualityStatistics returned by
+    collect_equality_statistics or enable_equality_statistics instead.
 
-        return equal
-    return equals_func_with_collision_measuring
+    Prints the statistics of the active equality statistics mode, or
+    of the functions decorated by measure_collisions."""
+    deprecate("print_collisions is deprecated, please print the statistics "
+              "returned by collect_equality_statistics or enable_equality_statistics.")
+    stats = _equality_statistics
+    if stats is None:
+        stats = _collision_statistics
+    print(stats.report())
 
 
-# @measure_collisions
 def recursive_expr_equals(self, other):  # Much faster than the more complex algorithms above!
     """Checks whether the two expressions are represented the
     exact same way. This does not check if the expressions are
@@ -103,7 +281,70 @@ def recursive_expr_equals(self, other):  # Much faster than the more complex alg
     return equal
 
 
-# @measure_collisions
+# Results of deep comparisons of distinct operators with equal hashes,
+# keyed by the pair of object ids and holding weak references to
+# validate entries, ordered from oldest to newest
+_equality_cache = OrderedDict()
+_equality_cache_size = 4096
+
+
+def set_equality_cache_size(size):
+    """Set the maximal number of pairs of expressions whose equality is
+    remembered by expression comparison. Oldest entries are evicted
+    first, size 0 disables the cache."""
+    global _equality_cache_size
+    if size < 0:
+        error("Expecting nonnegative cache size.")
+    _equality_cache_size = size
+    while len(_equality_cache) > size:
+        _equality_cache.popitem(last=False)
+
+
+def clear_equality_cache():
+    "Remove all entries from the expression equality cache."
+    _equality_cache.clear()
+
+
+def _pair_key(s, o):
+    i, j = id(s), id(o)
+    return (i, j) if i < j else (j, i)
+
+
+def _cached_equality(s, o):
+    "Return the remembered equality of s and o, or None."
+    entry = _equality_cache.get(_pair_key(s, o))
+    if entry is not None:
+        a, b, equal = entry
+        a, b = a(), b()
+        if (a is s and b is o) or (a is o and b is s):
+            return equal
+    return None
+
+
+def _record_equality(s, o, equal):
+    "Remember the equality of s and o."
+    if not _equality_cache_size:
+        return
+    if id(s) > id(o):
+        s, o = o, s
+    _equality_cache[(id(s), id(o))] = (ref(s), ref(o), equal)
+    if len(_equality_cache) > _equality_cache_size:
+        _equality_cache.popitem(last=False)
+
+
+def _unify(s, o):
+    """Share the digest and sort key computed for either of the equal
+    objects s and o, making later comparisons of them cheaper."""
+    if s._digest is None:
+        s._digest = o._digest
+    elif o._digest is None:
+        o._digest = s._digest
+    if s._sort_key is None:
+        s._sort_key = o._sort_key
+    elif o._sort_key is None:
+        o._sort_key = s._sort_key
+
+
 def nonrecursive_expr_equals(self, other):
     """Checks whether the two expressions are represented the
     exact same way. This does not check if the expressions are
@@ -118,7 +359,23 @@ def nonrecursive_expr_equals(self, other):
     if self is other:
         return True
 
+    # Stable digests decide equality if both have been computed
+    sd = self._digest
+    if sd is not None:
+        od = other._digest
+        if od is not None:
+            return sd == od
+
+    if self._ufl_is_terminal_:
+        return self == other
+
+    # Use the result of a previous comparison of the same objects
+    equal = _cached_equality(self, other)
+    if equal is not None:
+        return equal
+
     # Modelled after pre_traversal to avoid recursion:
+    compared = []
     left = [(self, other)]
     while left:
         s, o = left.pop()
@@ -126,25 +383,48 @@ def nonrecursive_expr_equals(self, other):
         if s._ufl_is_terminal_:
             # Compare terminals
             if not s == o:
+                _record_equality(self, other, False)
                 return False
         else:
             # Delve into subtrees
+            compared.append((s, o))
             so = s.ufl_operands
             oo = o.ufl_operands
             if len(so) != len(oo):
+                _record_equality(self, other, False)
                 return False
 
             for s, o in zip(so, oo):
                 # Fast cutoff for common case
                 if s._ufl_typecode_ != o._ufl_typecode_:
+                    _record_equality(self, other, False)
                     return False
                 # Skip subtree if objects are the same
                 if s is o:
                     continue
-                # Append subtree for further inspection
-                left.append((s, o))
+                # Use digests for the subtree if both are computed
+                sd = s._digest
+                if sd is not None:
+                    od = o._digest
+                    if od is not None:
+                        if sd != od:
+                            _record_equality(self, other, False)
+                            return False
+                        continue
+                # Use the result of a previous comparison
+                equal = None if s._ufl_is_terminal_ else _cached_equality(s, o)
+                if equal is None:
+                    # Append subtree for further inspection
+                    left.append((s, o))
+                elif not equal:
+                    _record_equality(self, other, False)
+                    return False
 
-    # Equal if we get out of the above loop!
+    # Equal if we get out of the above loop! All compared pairs of
+    # operators are equal
+    for s, o in compared:
+        _unify(s, o)
+        _record_equality(s, o, True)
     return True
 
 
@@ -316,10 +316,15 @@ def _restrict(self, side):
     error("Invalid side '%s' in restriction operator." % (side,))
 
 
-def _eval(self, coord, mapping=None, component=()):
+def _eval(self, coord, mapping=None, component=(), memoize=False):
     # Evaluate expression at this particular coordinate, with provided
     # values for other terminals in mapping
 
+    if memoize:
+        # Evaluate each shared subexpression once
+        from ufl.algorithms.evaluation import evaluate_memoized
+        return evaluate_memoized(self, coord, mapping, component)
+
     # Evaluate derivatives first
     from ufl.algorithms import expand_derivatives
     f = expand_derivatives(self)
@@ -331,14 +336,23 @@ def _eval(self, coord, mapping=None, component=()):
     return f.evaluate(coord, mapping, component, index_values)
 
 
-def _call(self, arg, mapping=None, component=()):
+def _eval_points(self, coords, mapping=None, component=()):
+    # Evaluate expression at all points in the (N, gdim) array coords
+    from ufl.algorithms.evaluation import evaluate_points
+    values = evaluate_points(self, coords, mapping)
+    return values[(slice(None),) + tuple(component)]
+
+
+def _call(self, arg, mapping=None, component=(), memoize=False):
     # Taking the restriction or evaluating depending on argument
-    if arg in ("+", "-"):
+    if isinstance(arg, str) and arg in ("+", "-"):
         if mapping is not None:
             error("Not expecting a mapping when taking restriction.")
         return _restrict(self, arg)
+    elif getattr(arg, "ndim", 0) == 2:
+        return _eval_points(self, arg, mapping, component)
     else:
-        return _eval(self, arg, mapping, component)
+        return _eval(self, arg, mapping, component, memoize)
 
 
 Expr.__call__ = _call
@@ -33,6 +33,7 @@ from ufl.core.expr import Expr
 from ufl.core.expr import ufl_err_str
 from ufl.constantvalue import Zero
 from ufl.utils.str import as_native_strings, as_native_str
+from ufl.tracing import trace_span
 
 # Export list for ufl.classes
 __all_classes__ = as_native_strings(["Form"])
@@ -467,8 +468,9 @@ class Form(object):
 
     def _compute_signature(self):
         from ufl.algorithms.signature import compute_form_signature
-        self._signature = compute_form_signature(self,
-                                                 self._compute_renumbering())
+        with trace_span("Form.signature"):
+            self._signature = compute_form_signature(self,
+                                                     self._compute_renumbering())
 
 
 def as_form(form):
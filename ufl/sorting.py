@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 """This module contains a sorting rule for expr objects that
-is more robust w.r.t. argument numbering than using repr."""
+is more robust w.r.t. argument numbering than using repr.
+
+The rule is represented by a canonical sort key computed once for each
+node from its type code and the keys of its operands, and cached on
+the node, such that sorting compares keys instead of walking trees."""
 
 # Copyright (C) 2008-2016 Martin Sandve Alnæs
 #
@@ -111,8 +115,110 @@ _terminal_cmps[Coefficient._ufl_typecode_] = _cmp_coefficient
 _terminal_cmps[Label._ufl_typecode_] = _cmp_label
 
 
+# Sort keys of terminals, consistent with the comparisons above
+class _MultiIndexKey(object):
+    """Sort key of a MultiIndex. Like _cmp_multi_index, only the
+    indices up to the length of the shorter multi-index are compared,
+    so keys of e.g. [0] and [0,1] compare as equal."""
+    __slots__ = ("indices",)
+
+    def __init__(self, indices):
+        self.indices = indices
+
+    def __eq__(self, other):
+        return all(i == j for i, j in zip(self.indices, other.indices))
+
+    def __lt__(self, other):
+        for i, j in zip(self.indices, other.indices):
+            if i != j:
+                return i < j
+        return False
+
+    def __gt__(self, other):
+        return other < self
+
+    __hash__ = None
+
+
+def _multi_index_key(a):
+    return _MultiIndexKey(tuple((0, i._value) if isinstance(i, FixedIndex) else (1,)
+                                for i in a._indices))
+
+
+def _label_key(a):
+    return 0
+
+
+def _coefficient_key(a):
+    return a._count
+
+
+def _argument_key(a):
+    return (a._number, a._part)
+
+
+_terminal_keys = [repr]*Expr._ufl_num_typecodes_
+_terminal_keys[MultiIndex._ufl_typecode_] = _multi_index_key
+_terminal_keys[Argument._ufl_typecode_] = _argument_key
+_terminal_keys[Coefficient._ufl_typecode_] = _coefficient_key
+_terminal_keys[Label._ufl_typecode_] = _label_key
+
+
+def sort_key(expr):
+    """Return the canonical sort key of expr, computing the keys of
+    all its nodes without recursion where not previously computed.
+
+    The key of a terminal is a tuple of its type code and a type
+    specific key, and the key of an operator is a tuple of its type
+    code, its number of operands and the keys of its operands in
+    reverse order. Keys compare like the trees are compared by
+    cmp_expr, and like there the counts of indices and labels do not
+    affect the key.
+    """
+    if expr._sort_key is not None:
+        return expr._sort_key
+
+    stack = [[expr, expr.ufl_operands, len(expr.ufl_operands)]]
+    while stack:
+        entry = stack[-1]
+        e = entry[0]
+        if e._sort_key is not None:
+            stack.pop()
+        elif entry[2] == 0:
+            # All operands have keys
+            x = e._ufl_typecode_
+            if e._ufl_is_terminal_:
+                e._sort_key = (x, _terminal_keys[x](e))
+            else:
+                ops = e.ufl_operands
+                e._sort_key = (x, len(ops)) + tuple(o._sort_key for o in reversed(ops))
+            stack.pop()
+        else:
+            entry[2] -= 1
+            o = entry[1][entry[2]]
+            oops = o.ufl_operands
+            stack.append([o, oops, len(oops)])
+
+    return expr._sort_key
+
+
 def cmp_expr(a, b):
-    "Replacement for cmp(a, b), removed in Python 3, for Expr objects."
+    """Replacement for cmp(a, b), removed in Python 3, for Expr objects.
+
+    Compares the canonical sort keys of a and b, or the trees
+    themselves if the keys are nested too deeply to be compared."""
+    try:
+        x = sort_key(a)
+        y = sort_key(b)
+        if x < y:
+            return -1
+        return +1 if y < x else 0
+    except RecursionError:
+        return _cmp_expr_trees(a, b)
+
+
+def _cmp_expr_trees(a, b):
+    "Compare a and b by walking both trees, consistently with their sort keys."
 
     # Modelled after pre_traversal to avoid recursion:
     left = [(a, b)]
@@ -168,11 +274,15 @@ def cmp_expr(a, b):
 
 def sorted_expr(sequence):
     "Return a canonically sorted list of Expr objects in sequence."
-    return sorted(sequence, key=cmp_to_key(cmp_expr))
+    sequence = list(sequence)
+    try:
+        return sorted(sequence, key=sort_key)
+    except RecursionError:
+        return sorted(sequence, key=cmp_to_key(_cmp_expr_trees))
 
 
 def sorted_expr_sum(seq):
-    seq2 = sorted(seq, key=cmp_to_key(cmp_expr))
+    seq2 = sorted_expr(seq)
     s = seq2[0]
     for e in seq2[1:]:
         s = s + e
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Tracing of the time spent in the stages of form preprocessing.
+
+Within a ``trace_events`` context, the passes of ``compute_form_data``,
+``Form.signature``, the rulesets applied by ``apply_derivatives`` and
+``load_ufl_file`` emit spans as complete events in the Chrome Trace
+Event format, dicts such as::
+
+    {"name": "apply_derivatives", "cat": "compute_form_data", "ph": "X",
+     "ts": 1514764800000000.0, "dur": 1250.0, "pid": 1234, "tid": 1,
+     "args": {}}
+
+with times in microseconds since the epoch. Events are passed to a
+sink, any callable taking an event, such that they can be merged with
+other traces. ``trace_to_file`` writes the events to a JSON file
+which can be loaded in chrome://tracing. Outside of these contexts
+spans cost one check.
+"""
+
+# Copyright (C) 2018 Martin Sandve Alnæs
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# The sinks of the active trace_events contexts
+_sinks = []
+
+# Offset of the high resolution clock from the epoch, in seconds
+_clock_offset = time.time() - time.perf_counter()
+
+
+def _now():
+    "Return the time since the epoch in microseconds."
+    return (time.perf_counter() + _clock_offset) * 1e6
+
+
+class ChromeTraceWriter(object):
+    """Sink collecting events and writing them to a file in the Chrome
+    Trace Event JSON object format when closed."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def close(self):
+        "Write the events collected so far to the file."
+        with open(self.filename, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+
+class _Span(object):
+    "Context manager emitting a complete event to the active sinks on exit."
+
+    __slots__ = ("name", "category", "args", "start")
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = _now()
+        event = {"name": self.name, "cat": self.category, "ph": "X",
+                 "ts": self.start, "dur": end - self.start,
+                 "pid": os.getpid(), "tid": threading.get_ident(),
+                 "args": self.args or {}}
+        for sink in _sinks:
+            sink(event)
+        return False
+
+
+class _NoSpan(object):
+    "Context manager doing nothing, used when tracing is inactive."
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_no_span = _NoSpan()
+
+
+def trace_span(name, category="ufl", args=None):
+    """Return a context manager emitting a complete event with the given
+    name, category and dict of args for the time spent in the context,
+    if tracing is active."""
+    if not _sinks:
+        return _no_span
+    return _Span(name, category, args)
+
+
+def tracing_active():
+    "Return if events are currently traced."
+    return bool(_sinks)
+
+
+@contextmanager
+def trace_events(sink):
+    """Pass the events of the spans in this context to sink, a callable
+    taking an event dict. Yields sink."""
+    _sinks.append(sink)
+    try:
+        yield sink
+    finally:
+        _sinks.remove(sink)
+
+
+@contextmanager
+def trace_to_file(filename):
+    """Write the events of the spans in this context to a file in the
+    Chrome Trace Event format. Yields the ChromeTraceWriter."""
+    writer = ChromeTraceWriter(filename)
+    try:
+        with trace_events(writer):
+            yield writer
+    finally:
+        writer.close()